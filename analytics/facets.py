@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from game.cache import TRACKED, cached, user_key
+from game.images import image_src
+from game.models import Pokemon, Vote
+from game.signals import vote_cast, votes_imported
+
+# Facet name -> Pokemon field it groups smashed Pokémon by
+FACETS = {
+    'evo': 'evolution_stage',
+    'shape': 'shape',
+    'color': 'color',
+    'gen': 'generation',
+}
+
+TRACKED.append('user_stats')
+
+
+def get_user_facets(username):
+    """user_facets() through the per-user cache; a vote by the user drops the entry."""
+    return cached('user_stats', user_key('analytics:user_stats', username), lambda: user_facets(username))
+
+
+@receiver(vote_cast)
+def clear_user_facets(sender, username, **kwargs):
+    cache.delete(user_key('analytics:user_stats', username))
+
+
+@receiver(votes_imported)
+def clear_imported_user_facets(sender, usernames, **kwargs):
+    cache.delete_many([user_key('analytics:user_stats', username) for username in usernames])
+
+
+def user_facets(username):
+    """
+    Vote totals and per-facet breakdowns of a user's smashes, in one pass over a
+    single values() query.
+
+    Returns a dict with smash_count, pass_count, total_votes, `roster` (pokeapi_id
+    -> name/image_url/card_image_url for every smashed Pokémon) and `facets`: for each facet,
+    `counts` (value -> number smashed) and `pokemon` (value -> pokeapi_ids into
+    the roster).
+    """
+    fields = ['smash', 'pokemon__pokeapi_id', 'pokemon__name', 'pokemon__image_url', 'pokemon__image_hash']
+    fields += [f'pokemon__{field}' for field in FACETS.values()]
+    rows = Vote.objects.filter(username=username).order_by('pokemon__pokeapi_id').values_list(*fields)
+
+    facets = {name: {'counts': {}, 'pokemon': {}} for name in FACETS}
+    # Every stage shows up in the evolution chart, smashed or not
+    for stage, _ in Pokemon.EVOLUTION_STAGES:
+        facets['evo']['counts'][stage] = 0
+        facets['evo']['pokemon'][stage] = []
+
+    roster = {}
+    smash_count = pass_count = 0
+    for smash, pokeapi_id, name, image_url, image_hash, *values in rows.iterator(chunk_size=500):
+        if not smash:
+            pass_count += 1
+            continue
+        smash_count += 1
+        roster[pokeapi_id] = {
+            'name': name,
+            'image_url': image_src(image_hash, image_url, 'thumb'),
+            'card_image_url': image_src(image_hash, image_url, 'card'),
+        }
+        for facet_name, value in zip(FACETS, values):
+            value = value or 'unknown'
+            facet = facets[facet_name]
+            facet['counts'][value] = facet['counts'].get(value, 0) + 1
+            facet['pokemon'].setdefault(value, []).append(pokeapi_id)
+
+    return {
+        'smash_count': smash_count,
+        'pass_count': pass_count,
+        'total_votes': smash_count + pass_count,
+        'roster': roster,
+        'facets': facets,
+    }
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models import Count
+
+from game.models import Pokemon, Vote
+
+from .models import UserTally
+
+# User board -> UserTally column it ranks; only users with a non-zero count are ranked
+USER_BOARDS = {'smashes': 'smash_count', 'passes': 'pass_count'}
+# Pokémon board -> count it ranks. Every rate is a count over the same total
+# number of users, so ranking by count is ranking by rate
+POKEMON_BOARDS = {'smash': 'smash_count', 'pass': 'pass_count'}
+
+
+class Leaderboard:
+    """
+    Rows of a queryset ranked by a count column, highest first, ties broken by
+    `key`. With an index on (-score, key) the top k is a walk of k index entries
+    and a vote moves one entry, so neither depends on how many rows are ranked.
+    """
+
+    def __init__(self, queryset, key, score):
+        self.queryset = queryset
+        self.key = key
+        self.score = score
+
+    def top(self, k, offset=0):
+        """[(key, score), ...] for ranks offset+1 .. offset+k."""
+        ranked = self.queryset.order_by(f'-{self.score}', self.key).values_list(self.key, self.score)
+        return list(ranked[offset:offset + k])
+
+    def __len__(self):
+        return self.queryset.count()
+
+
+def user_boards():
+    return {
+        board: Leaderboard(UserTally.objects.filter(**{f'{column}__gt': 0}), 'username', column)
+        for board, column in USER_BOARDS.items()
+    }
+
+
+def pokemon_boards():
+    return {board: Leaderboard(Pokemon.objects.all(), 'pokeapi_id', field) for board, field in POKEMON_BOARDS.items()}
+
+
+def leader(board):
+    """{'username', 'count'} of the top user on a user board, or None."""
+    top = user_boards()[board].top(1)
+    return {'username': top[0][0], 'count': top[0][1]} if top else None
+
+
+def user_count():
+    """Users with at least one vote: one count over the tally table's username index."""
+    return UserTally.objects.count()
+
+
+def users_after(cursor, limit):
+    """
+    (usernames, next_cursor) for one page of voters in username order, starting
+    after `cursor`. A seek on the unique username index, however many users.
+    """
+    page = list(
+        UserTally.objects.filter(username__gt=cursor).order_by('username').values_list('username', flat=True)[:limit + 1]
+    )
+    return page[:limit], page[limit - 1] if len(page) > limit else None
+
+
+def rebuild_tallies(usernames=None):
+    """
+    Recount the tallies of `usernames` (everyone by default) from the Vote
+    table. The triggers in analytics.triggers keep them current; this is for
+    repairs and rebuild_analytics. Returns the number of tallies.
+    """
+    if usernames is None:
+        with transaction.atomic():
+            UserTally.objects.all().delete()
+            written = _insert_tallies(Vote.objects.all())
+    else:
+        usernames = list(usernames)
+        written = 0
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            with transaction.atomic():
+                UserTally.objects.filter(username__in=chunk).delete()
+                written += _insert_tallies(Vote.objects.filter(username__in=chunk))
+    return written
+
+
+def _insert_tallies(votes):
+    tallies = {}
+    for username, smash, count in votes.values_list('username', 'smash').annotate(count=Count('id')).order_by():
+        tallies.setdefault(username, [0, 0])[0 if smash else 1] = count
+    UserTally.objects.bulk_create(
+        (UserTally(username=username, smash_count=s, pass_count=p) for username, (s, p) in tallies.items()),
+        batch_size=5000,
+    )
+    return len(tallies)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from analytics.leaderboard import rebuild_tallies
+from analytics.snapshot import rebuild_snapshot
+
+class Command(BaseCommand):
+    help = 'Recounts the user tallies behind the leaderboards and rebuilds the cached analytics snapshot from the Vote table.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Recounting user tallies...')
+        users = rebuild_tallies()
+        self.stdout.write('Rebuilding analytics snapshot...')
+        snapshot = rebuild_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot rebuilt: {users} users, {len(snapshot['pokemon_stats'])} pokemon."
+        ))
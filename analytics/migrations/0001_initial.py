@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_tallies(apps, schema_editor):
+    Vote = apps.get_model('game', 'Vote')
+    UserTally = apps.get_model('analytics', 'UserTally')
+    tallies = {}
+    for username, smash, count in Vote.objects.values_list('username', 'smash').annotate(count=Count('id')).order_by():
+        tallies.setdefault(username, [0, 0])[0 if smash else 1] = count
+    UserTally.objects.bulk_create(
+        (UserTally(username=username, smash_count=s, pass_count=p) for username, (s, p) in tallies.items()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('game', '0007_vote_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=100, unique=True)),
+                ('smash_count', models.IntegerField(default=0)),
+                ('pass_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-smash_count', 'username'], name='tally_smashes_idx'), models.Index(fields=['-pass_count', 'username'], name='tally_passes_idx')],
+            },
+        ),
+        migrations.RunPython(fill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count
+
+from analytics.triggers import DROP_TALLY_TRIGGERS, TALLY_TRIGGERS
+
+
+def recount_tallies(apps, schema_editor):
+    # Votes written while the receivers were keeping count may have been missed
+    # (a crash between the vote and its tally); start the triggers from the truth
+    Vote = apps.get_model('game', 'Vote')
+    UserTally = apps.get_model('analytics', 'UserTally')
+    tallies = {}
+    for username, smash, count in Vote.objects.values_list('username', 'smash').annotate(count=Count('id')).order_by():
+        tallies.setdefault(username, [0, 0])[0 if smash else 1] = count
+    UserTally.objects.all().delete()
+    UserTally.objects.bulk_create(
+        (UserTally(username=username, smash_count=s, pass_count=p) for username, (s, p) in tallies.items()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(TALLY_TRIGGERS, DROP_TALLY_TRIGGERS),
+        migrations.RunPython(recount_tallies, migrations.RunPython.noop),
+    ]
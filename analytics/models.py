@@ -1,3 +1,21 @@
 from django.db import models
 
-# Create your models here.
+class UserTally(models.Model):
+    """
+    A user's smash and pass totals, kept in step with their votes by the
+    database triggers in analytics.triggers. Users without votes have no row.
+    """
+    username = models.CharField(max_length=100, unique=True)
+    smash_count = models.IntegerField(default=0)
+    pass_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # The user leaderboards walk these in rank order, and a vote moves
+            # one entry in each
+            models.Index(fields=['-smash_count', 'username'], name='tally_smashes_idx'),
+            models.Index(fields=['-pass_count', 'username'], name='tally_passes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.username}: {self.smash_count} smashes, {self.pass_count} passes"
@@ -0,0 +1,107 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from game.cache import TRACKED, cached
+from game.images import image_src
+from game.models import Pokemon
+from game.signals import roster_changed
+
+from .leaderboard import leader, user_count
+
+# The static half of the gallery (names and sprites). The counters come from the
+# Pokemon table on each read, so a vote never touches this entry
+GALLERY_KEY = 'analytics:gallery'
+
+TRACKED.append('gallery')
+
+
+def build_gallery():
+    return [
+        _gallery_entry(*row)
+        for row in Pokemon.objects.order_by('pokeapi_id').values_list('pokeapi_id', 'name', 'image_url', 'image_hash')
+    ]
+
+
+def get_gallery():
+    return cached('gallery', GALLERY_KEY, build_gallery)
+
+
+def get_pokemon_stats(total_users):
+    """
+    The gallery with each Pokemon's counters and its smash, pass and pending
+    rates over `total_users`. One query, for the counters.
+    """
+    counts = {pokeapi_id: (s, p) for pokeapi_id, s, p in Pokemon.objects.values_list('pokeapi_id', 'smash_count', 'pass_count')}
+    stats = []
+    for entry in get_gallery():
+        if entry['pokeapi_id'] not in counts:
+            continue
+        entry = {**entry}
+        entry['smash_count'], entry['pass_count'] = counts[entry['pokeapi_id']]
+        _set_rates(entry, total_users)
+        stats.append(entry)
+    return stats
+
+
+def get_pokemon_entries(pokeapi_ids, total_users):
+    """
+    get_pokemon_stats() entries for just `pokeapi_ids`, in that order: one
+    query by pokeapi_id, for a page of a leaderboard.
+    """
+    rows = Pokemon.objects.filter(pokeapi_id__in=pokeapi_ids).values_list(
+        'pokeapi_id', 'name', 'image_url', 'image_hash', 'smash_count', 'pass_count'
+    )
+    entries = {}
+    for pokeapi_id, name, image_url, image_hash, smash_count, pass_count in rows:
+        entry = _gallery_entry(pokeapi_id, name, image_url, image_hash)
+        entry['smash_count'], entry['pass_count'] = smash_count, pass_count
+        _set_rates(entry, total_users)
+        entries[pokeapi_id] = entry
+    return [entries[pokeapi_id] for pokeapi_id in pokeapi_ids if pokeapi_id in entries]
+
+
+def get_snapshot():
+    """
+    The aggregates the analytics index shows, assembled from what votes keep
+    current without rewriting anything that grows with the number of users: the
+    Pokemon counters and the user tallies (see analytics.leaderboard), plus the
+    cached gallery, which only changes with the roster. Four queries: the user
+    count, the counters and one index seek per leader.
+    """
+    total_users = user_count()
+    return {
+        'total_users': total_users,
+        'pokemon_stats': get_pokemon_stats(total_users),
+        'most_smashes': leader('smashes'),
+        'most_passes': leader('passes'),
+    }
+
+
+def rebuild_snapshot():
+    cache.delete(GALLERY_KEY)
+    return get_snapshot()
+
+
+def _gallery_entry(pokeapi_id, name, image_url, image_hash):
+    return {
+        'pokeapi_id': pokeapi_id,
+        'name': name.capitalize(),
+        'image_url': image_src(image_hash, image_url, 'thumb'),
+        'card_image_url': image_src(image_hash, image_url, 'card'),
+    }
+
+
+def _set_rates(entry, total_users):
+    # Everyone who voted on anything but not on this Pokemon is pending
+    entry['pending_count'] = total_users - entry['smash_count'] - entry['pass_count']
+    for kind in ('smash', 'pass', 'pending'):
+        rate = (entry[f'{kind}_count'] / total_users * 100) if total_users > 0 else 0
+        entry[f'{kind}_rate'] = round(rate, 1)
+
+
+@receiver(post_save, sender=Pokemon)
+@receiver(post_delete, sender=Pokemon)
+@receiver(roster_changed)
+def clear_gallery(sender, **kwargs):
+    cache.delete(GALLERY_KEY)
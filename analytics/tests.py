@@ -1,3 +1,297 @@
-from django.test import TestCase
+import sys
+import tempfile
+import time
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+
+from game import metrics
+from game.models import Pokemon, Vote
+
+from .facets import get_user_facets, user_facets
+from .leaderboard import pokemon_boards, rebuild_tallies, users_after
+from .models import UserTally
+from .snapshot import GALLERY_KEY, get_snapshot
+
+
+class AnalyticsSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'pokemon{pokeapi_id}', image_url='https://example.com/p.png')
+
+    def test_incremental_updates_match_a_rebuild(self):
+        get_snapshot()
+        Vote.objects.record('misty', 1, True)
+        Vote.objects.record('ash', 1, True)
+        Vote.objects.record('ash', 4, True)
+        Vote.objects.record_many('brock', [(4, False), (7, False)])
+        Vote.objects.record('ash', 1, False)
+        Vote.objects.get(username='misty').delete()
+
+        snapshot = get_snapshot()
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.assertEqual(snapshot, get_snapshot())
+        self.assertEqual(snapshot['total_users'], 2)
+        self.assertEqual(snapshot['most_passes'], {'username': 'brock', 'count': 2})
+
+    def test_index_reads_only_the_snapshot(self):
+        Vote.objects.record('ash', 1, True)
+        call_command('rebuild_analytics', stdout=StringIO())
+        # The user count, the Pokemon counters, one index seek per Hall of Fame
+        # card and one for the page of users
+        with self.assertNumQueries(5):
+            response = self.client.get('/analytics/')
+        self.assertEqual(response.context['most_smashes'], {'username': 'ash', 'count': 1})
+        self.assertEqual(response.context['usernames'], ['ash'])
+        self.assertEqual(response.context['pokemon_stats'][0]['smash_rate'], 100.0)
+
+    def test_votes_with_a_warm_snapshot_and_many_users(self):
+        users = 20000
+        UserTally.objects.bulk_create(
+            (UserTally(username=f'user{i:05}', smash_count=1) for i in range(users)), batch_size=5000,
+        )
+        self.assertEqual(get_snapshot()['total_users'], users)
+
+        # Votes, by known and new users alike, leave the only cache entry alone
+        # and nothing is rebuilt on the next read
+        with self.assertNumQueries(2):
+            Vote.objects.record('user00042', 4, False)
+        Vote.objects.record('zubat', 1, True)
+        self.assertIsNotNone(cache.get(GALLERY_KEY))
+        with self.assertNumQueries(4):
+            snapshot = get_snapshot()
+        self.assertEqual(snapshot['total_users'], users + 1)
+        entry = snapshot['pokemon_stats'][1]
+        self.assertEqual((entry['pokeapi_id'], entry['pass_count'], entry['pending_count']), (4, 1, users))
+
+    def test_users_are_paged_from_the_tallies(self):
+        for username in ('ash', 'brock', 'misty'):
+            Vote.objects.record(username, 1, True)
+        self.assertEqual(users_after('', 2), (['ash', 'brock'], 'brock'))
+        response = self.client.get('/analytics/', {'after': 'brock'})
+        self.assertEqual(response.context['usernames'], ['misty'])
+        self.assertIsNone(response.context['next_after'])
+
+    def test_index_ships_counts_not_voter_lists(self):
+        Vote.objects.record('ash', 1, True)
+        response = self.client.get('/analytics/')
+        self.assertNotIn('smash_users', response.context['pokemon_stats'][0])
+        self.assertNotContains(response, 'gallery-data')
+
+
+class PokemonVotersTests(TestCase):
+    def setUp(self):
+        Pokemon.objects.create(pokeapi_id=1, name='bulbasaur', image_url='https://example.com/1.png')
+        Pokemon.objects.create(pokeapi_id=4, name='charmander', image_url='https://example.com/4.png')
+        for username in ('ash', 'brock', 'gary', 'misty'):
+            Vote.objects.record(username, 1, username != 'brock')
+        Vote.objects.record('oak', 4, True)
+
+    def get_voters(self, **params):
+        return self.client.get('/analytics/api/pokemon/1/voters/', params).json()
+
+    def test_pages_follow_the_cursor(self):
+        first = self.get_voters(type='smash', limit=2)
+        self.assertEqual(first, {'users': ['ash', 'gary'], 'next_cursor': 'gary'})
+        second = self.get_voters(type='smash', limit=2, cursor=first['next_cursor'])
+        self.assertEqual(second, {'users': ['misty'], 'next_cursor': None})
+
+    def test_pass_and_pending(self):
+        self.assertEqual(self.get_voters(type='pass')['users'], ['brock'])
+        self.assertEqual(self.get_voters(type='pending')['users'], ['oak'])
+
+    def test_pending_walks_tallies_not_votes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_voters(type='pending')
+        sql = queries[-1]['sql']
+        self.assertIn('FROM "analytics_usertally"', sql)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        # The anti-join looks up this Pokémon's voters by index, not by a scan
+        self.assertNotIn('SCAN game_vote', plan)
+
+    def test_bad_type(self):
+        self.assertEqual(self.client.get('/analytics/api/pokemon/1/voters/', {'type': 'maybe'}).status_code, 400)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'pokemon{pokeapi_id}', image_url='https://example.com/p.png')
+
+    def tallies(self):
+        return set(UserTally.objects.values_list('username', 'smash_count', 'pass_count'))
+
+    def test_votes_move_users_on_the_board(self):
+        Vote.objects.record_many('ash', [(1, True), (4, True)])
+        Vote.objects.record('misty', 1, True)
+        Vote.objects.record('brock', 7, False)
+
+        response = self.client.get('/analytics/api/leaderboards/users/', {'limit': 1})
+        self.assertEqual(response.json(), {'total': 2, 'users': [{'rank': 1, 'username': 'ash', 'count': 2}]})
+
+        Vote.objects.record('ash', 4, False)
+        Vote.objects.record('ash', 1, False)
+        response = self.client.get('/analytics/api/leaderboards/users/', {'by': 'passes'})
+        self.assertEqual([u['username'] for u in response.json()['users']], ['ash', 'brock'])
+
+        Vote.objects.get(username='misty').delete()
+        self.assertFalse(UserTally.objects.filter(username='misty').exists())
+        incremental = self.tallies()
+        rebuild_tallies()
+        self.assertEqual(incremental, self.tallies())
+
+    def test_the_tally_moves_with_the_vote_write(self):
+        Vote.objects.record('ash', 1, True)
+        # No statement of its own: the vote write carries the tally
+        with self.assertNumQueries(2):
+            Vote.objects.record('ash', 4, True)
+        self.assertEqual(self.tallies(), {('ash', 2, 0)})
+
+        # and it rolls back with it
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Vote.objects.record('ash', 7, False)
+            raise RuntimeError
+        self.assertEqual(self.tallies(), {('ash', 2, 0)})
+
+    def test_writes_around_record_move_the_tallies(self):
+        Vote.objects.record('ash', 1, True)
+        Vote.objects.filter(username='ash').update(smash=False)
+        Vote.objects.bulk_create([Vote(username='misty', pokemon=Pokemon.objects.get(pokeapi_id=4), smash=True)])
+        self.assertEqual(self.tallies(), {('ash', 0, 1), ('misty', 1, 0)})
+        Vote.objects.filter(username='misty').update(username='ash')
+        self.assertEqual(self.tallies(), {('ash', 1, 1)})
+        Pokemon.objects.filter(pokeapi_id=1).delete()
+        self.assertEqual(self.tallies(), {('ash', 1, 0)})
+
+    def test_pokemon_by_smash_rate(self):
+        for username in ('ash', 'brock'):
+            Vote.objects.record(username, 4, True)
+        Vote.objects.record('ash', 7, True)
+        Vote.objects.record('brock', 1, False)
+
+        response = self.client.get('/analytics/api/leaderboards/pokemon/', {'offset': 1})
+        pokemon = response.json()['pokemon']
+        self.assertEqual([(p['rank'], p['pokeapi_id'], p['smash_rate']) for p in pokemon], [(2, 7, 50.0), (3, 1, 0.0)])
+
+        response = self.client.get('/analytics/api/leaderboards/pokemon/', {'by': 'pass', 'limit': 1})
+        self.assertEqual(response.json()['pokemon'][0]['pokeapi_id'], 1)
+
+    def test_pokemon_pages_read_only_their_rows(self):
+        Pokemon.objects.bulk_create(
+            Pokemon(pokeapi_id=i, name=f'pokemon{i}', image_url='https://example.com/p.png', smash_count=i % 13)
+            for i in range(10, 1000)
+        )
+        # The index walk, the page's rows, the user count and the board size
+        with self.assertNumQueries(4):
+            response = self.client.get('/analytics/api/leaderboards/pokemon/', {'limit': 3})
+        self.assertEqual([p['pokeapi_id'] for p in response.json()['pokemon']], [12, 25, 38])
+        for by, index in (('smash', 'pokemon_smashes_idx'), ('pass', 'pokemon_passes_idx')):
+            board = pokemon_boards()[by]
+            plan = board.queryset.order_by(f'-{board.score}', board.key).values_list(board.key)[:3].explain()
+            self.assertIn(index, plan)
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get('/analytics/api/leaderboards/users/', {'by': 'votes'}).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/api/leaderboards/pokemon/', {'limit': 0}).status_code, 400)
+
+
+class UserFacetsTests(TestCase):
+    def setUp(self):
+        Pokemon.objects.create(pokeapi_id=1, name='Bulbasaur', image_url='https://example.com/1.png',
+                               evolution_stage='FIRST', shape='quadruped', color='green', generation='generation-i')
+        Pokemon.objects.create(pokeapi_id=4, name='Charmander', image_url='https://example.com/4.png',
+                               evolution_stage='FIRST', shape='upright', color='red', generation='generation-i')
+        Pokemon.objects.create(pokeapi_id=7, name='Squirtle', image_url='https://example.com/7.png')
+        Vote.objects.record_many('ash', [(1, True), (4, True), (7, False)])
+
+    def test_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = user_facets('ash')
+        self.assertEqual((stats['smash_count'], stats['pass_count'], stats['total_votes']), (2, 1, 3))
+        self.assertEqual(stats['facets']['evo']['counts'], {'FIRST': 2, 'MIDDLE': 0, 'LAST': 0, 'NONE': 0})
+        self.assertEqual(stats['facets']['evo']['pokemon']['FIRST'], [1, 4])
+        self.assertEqual(stats['facets']['color']['pokemon'], {'green': [1], 'red': [4]})
+        self.assertEqual(set(stats['roster']), {1, 4})
+
+    def test_user_stats_page(self):
+        response = self.client.get('/analytics/user/ash/')
+        self.assertEqual(response.context['shape_data'], {'quadruped': 1, 'upright': 1})
+        self.assertContains(response, 'roster-data')
+
+
+@tag('benchmark')
+class UserFacetsBenchmark(TestCase):
+    """One user's facets should be an index search, whatever everyone else's vote history."""
+
+    def test_facets_stay_an_index_search(self):
+        pokemon = [
+            Pokemon(pokeapi_id=i, name=f'pokemon{i}', image_url='https://example.com/p.png', shape='upright')
+            for i in range(1, 152)
+        ]
+        Pokemon.objects.bulk_create(pokemon)
+        pokemon = list(Pokemon.objects.order_by('pokeapi_id'))
+        Vote.objects.bulk_create([Vote(username='ash', pokemon=p, smash=p.pokeapi_id % 2 == 0) for p in pokemon])
+
+        timings = []
+        created = 0
+        for history in (0, 5_000, 30_000):
+            Vote.objects.bulk_create(
+                [Vote(username=f'user{n // 151}', pokemon=pokemon[n % 151], smash=True) for n in range(created, history)],
+                batch_size=2000,
+            )
+            created = history
+            with self.assertNumQueries(1):
+                user_facets('ash')
+            timings.append(min(_timed(user_facets, 'ash') for _ in range(5)))
+
+        # Timings depend on the machine; print them and check the plan instead
+        sys.stderr.write(f'\n{self.id()}: ' + ', '.join(f'{t * 1000:.3f}ms' for t in timings) + '\n')
+        rows = Vote.objects.filter(username='ash').order_by('pokemon__pokeapi_id').values_list('smash', 'pokemon__name')
+        self.assertIn('vote_username_smash_idx', rows.explain())
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+class UserStatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        metrics.registry.reset()
+        Pokemon.objects.create(pokeapi_id=1, name='Bulbasaur', image_url='https://example.com/1.png')
+        Pokemon.objects.create(pokeapi_id=4, name='Charmander', image_url='https://example.com/4.png')
+        Vote.objects.record('ash', 1, True)
+
+    def assertStatsCached(self):
+        self.assertEqual(get_user_facets('ash')['smash_count'], 1)
+        with self.assertNumQueries(0):
+            self.client.get('/analytics/user/ash/')
+
+        Vote.objects.record('ash', 4, True)
+        self.assertEqual(get_user_facets('ash')['smash_count'], 2)
+
+        stats = self.client.get('/api/cache/stats/').json()['caches']['user_stats']
+        self.assertEqual(stats, {'hits': 1, 'misses': 2, 'hit_rate': 0.3333})
+        self.assertIn('pokesmash_cache_lookups_total{kind="user_stats",outcome="misses"} 2', metrics.registry.render())
+
+    def test_locmem_cache(self):
+        self.assertStatsCached()
+
+    def test_file_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with self.settings(CACHES={'default': backend}):
+                self.assertStatsCached()
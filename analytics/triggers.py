@@ -0,0 +1,42 @@
+"""
+SQLite triggers that keep analytics_usertally in step with game_vote.
+
+The tally moves inside the statement that writes the vote, so the two can't
+disagree after a crash, and the vote path pays no extra round-trip for it.
+Every write counts, including bulk_create, QuerySet.update(), imports and
+cascading deletes. Installed by migration 0002; changing them needs a new
+migration.
+"""
+
+# Add or remove one vote from a user's tally
+_MOVE = """
+    INSERT INTO analytics_usertally (username, smash_count, pass_count) VALUES ({row}.username, {sign}{row}.smash, {sign}(NOT {row}.smash))
+    ON CONFLICT (username) DO UPDATE SET
+        smash_count = smash_count + excluded.smash_count,
+        pass_count = pass_count + excluded.pass_count;
+"""
+
+# Users without votes have no tally
+_PRUNE = """
+    DELETE FROM analytics_usertally WHERE username = OLD.username AND smash_count <= 0 AND pass_count <= 0;
+"""
+
+TALLY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER analytics_tally_vote_insert AFTER INSERT ON game_vote
+    BEGIN {_MOVE.format(row='NEW', sign='')} END
+    """,
+    f"""
+    CREATE TRIGGER analytics_tally_vote_update AFTER UPDATE OF username, smash ON game_vote
+    WHEN OLD.username IS NOT NEW.username OR OLD.smash IS NOT NEW.smash
+    BEGIN {_MOVE.format(row='OLD', sign='-')} {_MOVE.format(row='NEW', sign='')} {_PRUNE} END
+    """,
+    f"""
+    CREATE TRIGGER analytics_tally_vote_delete AFTER DELETE ON game_vote
+    BEGIN {_MOVE.format(row='OLD', sign='-')} {_PRUNE} END
+    """,
+]
+
+DROP_TALLY_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS analytics_tally_vote_{event}' for event in ('insert', 'update', 'delete')
+]
@@ -6,4 +6,7 @@ app_name = 'analytics'
 urlpatterns = [
     path('', views.index, name='index'),
     path('user/<str:username>/', views.user_stats, name='user_stats'),
+    path('api/pokemon/<int:pokeapi_id>/voters/', views.pokemon_voters, name='pokemon_voters'),
+    path('api/leaderboards/users/', views.user_leaderboard, name='user_leaderboard'),
+    path('api/leaderboards/pokemon/', views.pokemon_leaderboard, name='pokemon_leaderboard'),
 ]
@@ -1,170 +1,129 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Q
+from django.http import JsonResponse
 from game.models import Pokemon, Vote
 from django.contrib.auth.models import User
+from .facets import get_user_facets
+from .leaderboard import pokemon_boards, user_boards, user_count, users_after
+from .snapshot import get_pokemon_entries, get_snapshot
+from .models import UserTally
+
+USERS_PAGE_SIZE = 100
+VOTERS_PAGE_SIZE = 50
+MAX_VOTERS_PAGE_SIZE = 200
+LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
 
 def index(request):
     """
-    Display a list of all users who have voted and a global Pokémon gallery.
+    Display a page of the users who have voted and a global Pokémon gallery.
+    Reads the snapshot assembled from what votes keep current (see analytics.snapshot);
+    `after` is the last username of the previous page of users.
     """
-    # Get all distinct usernames from the Vote model
-    all_usernames = list(Vote.objects.values_list('username', flat=True).distinct().order_by('username'))
-    total_users_count = len(all_usernames)
-    
-    # Calculate General Stats
-    most_smashes = Vote.objects.filter(smash=True).values('username').annotate(count=Count('id')).order_by('-count').first()
-    most_passes = Vote.objects.filter(smash=False).values('username').annotate(count=Count('id')).order_by('-count').first()
-    
-    # Pokémon Gallery Data
-    all_pokemon = Pokemon.objects.all().order_by('pokeapi_id')
-    
-    # Pre-fetch all votes to map users to pokemon efficiently
-    votes = Vote.objects.values('pokemon__pokeapi_id', 'username', 'smash')
-    vote_map = {}
-    for v in votes:
-        pid = v['pokemon__pokeapi_id']
-        if pid not in vote_map:
-            vote_map[pid] = {'smash_users': [], 'pass_users': []}
-        if v['smash']:
-            vote_map[pid]['smash_users'].append(v['username'])
-        else:
-            vote_map[pid]['pass_users'].append(v['username'])
-
-    pokemon_stats = []
-    for p in all_pokemon:
-        breakdown = vote_map.get(p.pokeapi_id, {'smash_users': [], 'pass_users': []})
-        smash_users = breakdown['smash_users']
-        pass_users = breakdown['pass_users']
-        voted_users = set(smash_users + pass_users)
-        
-        # Determine who hasn't voted
-        pending_users = [u for u in all_usernames if u not in voted_users]
-        
-        smash_count = len(smash_users)
-        pass_count = len(pass_users)
-        pending_count = len(pending_users)
-        
-        smash_rate = (smash_count / total_users_count * 100) if total_users_count > 0 else 0
-        pass_rate = (pass_count / total_users_count * 100) if total_users_count > 0 else 0
-        pending_rate = (pending_count / total_users_count * 100) if total_users_count > 0 else 0
-            
-        pokemon_stats.append({
-            'pokeapi_id': p.pokeapi_id,
-            'name': p.name.capitalize(),
-            'image_url': p.image_url,
-            'smash_count': smash_count,
-            'pass_count': pass_count,
-            'pending_count': pending_count,
-            'smash_rate': round(smash_rate, 1),
-            'pass_rate': round(pass_rate, 1),
-            'pending_rate': round(pending_rate, 1),
-            'smash_users': smash_users,
-            'pass_users': pass_users,
-            'pending_users': pending_users
-        })
+    snapshot = get_snapshot()
+    usernames, next_after = users_after(request.GET.get('after', ''), USERS_PAGE_SIZE)
 
     context = {
-        'usernames': all_usernames,
-        'most_smashes': most_smashes,
-        'most_passes': most_passes,
-        'pokemon_stats': pokemon_stats,
-        'total_users': total_users_count,
+        'usernames': usernames,
+        'next_after': next_after,
+        'most_smashes': snapshot['most_smashes'],
+        'most_passes': snapshot['most_passes'],
+        'pokemon_stats': snapshot['pokemon_stats'],
+        'total_users': snapshot['total_users'],
     }
     return render(request, 'analytics/index.html', context)
 
+def pokemon_voters(request, pokeapi_id):
+    """
+    One page of the users who smashed, passed or haven't voted on a Pokémon,
+    ordered by username. `cursor` is the last username of the previous page.
+    """
+    pokemon = get_object_or_404(Pokemon, pokeapi_id=pokeapi_id)
+    vote_type = request.GET.get('type', 'smash')
+    cursor = request.GET.get('cursor', '')
+    try:
+        limit = min(int(request.GET.get('limit', VOTERS_PAGE_SIZE)), MAX_VOTERS_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit must be positive'}, status=400)
+
+    if vote_type in ('smash', 'pass'):
+        users = Vote.objects.filter(pokemon=pokemon, smash=(vote_type == 'smash'))
+    elif vote_type == 'pending':
+        # Every user with a vote has one tally row, so walk those by username and
+        # skip the ones found in this Pokémon's votes, instead of the vote table
+        users = UserTally.objects.exclude(username__in=Vote.objects.filter(pokemon=pokemon).values('username'))
+    else:
+        return JsonResponse({'error': 'type must be smash, pass or pending'}, status=400)
+
+    # One row per user either way: a user votes once per Pokémon, and has one tally
+    page = list(
+        users.filter(username__gt=cursor)
+        .order_by('username')
+        .values_list('username', flat=True)[:limit + 1]
+    )
+    next_cursor = page[limit - 1] if len(page) > limit else None
+
+    return JsonResponse({'users': page[:limit], 'next_cursor': next_cursor})
+
+def _leaderboard_page(request, boards, default):
+    """
+    (board, entries, error) for a leaderboard request: `by` picks the board,
+    `limit` and `offset` the slice of it. entries are (key, score, rank).
+    """
+    by = request.GET.get('by', default)
+    if by not in boards:
+        return None, None, JsonResponse({'error': f"by must be one of {', '.join(boards)}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', LEADERBOARD_SIZE)), MAX_LEADERBOARD_SIZE)
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return None, None, JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+    if limit < 1 or offset < 0:
+        return None, None, JsonResponse({'error': 'limit must be positive and offset not negative'}, status=400)
+
+    board = boards[by]
+    entries = [(key, score, offset + i + 1) for i, (key, score) in enumerate(board.top(limit, offset))]
+    return board, entries, None
+
+def user_leaderboard(request):
+    """Top users by number of smashes (`by=smashes`) or passes (`by=passes`)."""
+    board, entries, error = _leaderboard_page(request, user_boards(), 'smashes')
+    if error:
+        return error
+    return JsonResponse({
+        'total': len(board),
+        'users': [{'rank': rank, 'username': username, 'count': count} for username, count, rank in entries],
+    })
+
+def pokemon_leaderboard(request):
+    """Pokémon ranked by smash rate (`by=smash`) or pass rate (`by=pass`)."""
+    board, entries, error = _leaderboard_page(request, pokemon_boards(), 'smash')
+    if error:
+        return error
+    ranks = {pokeapi_id: rank for pokeapi_id, _, rank in entries}
+    stats = get_pokemon_entries(list(ranks), user_count())
+    pokemon = [{'rank': ranks[entry['pokeapi_id']], **entry} for entry in stats]
+    return JsonResponse({'total': len(board), 'pokemon': pokemon})
+
 def user_stats(request, username):
     """
     Display simple stats for a specific user.
     """
-    votes = Vote.objects.filter(username=username)
-    
-    # If no votes found for this username, we can either 404 or show empty stats
-    # Let's show empty stats but check if user exists in votes at all to be safe? 
-    # Actually, if we link from index, they exist. If manual url, maybe 0 is fine.
-    
-    total_votes = votes.count()
-    smash_count = votes.filter(smash=True).count()
-    pass_count = votes.filter(smash=False).count()
-    
-    # Evolution Stage Stats for Smashed Pokémon
-    evolution_stats = votes.filter(smash=True).values('pokemon__evolution_stage').annotate(count=Count('id'))
-    
-    # Convert to a flat dictionary for easier template usage
-    evo_data = {
-        'FIRST': 0,
-        'MIDDLE': 0,
-        'LAST': 0,
-        'NONE': 0
-    }
-    evo_pokemon = {
-        'FIRST': [],
-        'MIDDLE': [],
-        'LAST': [],
-        'NONE': []
-    }
-    shape_data = {}
-    shape_pokemon = {}
-    color_data = {}
-    color_pokemon = {}
-    gen_data = {}
-    gen_pokemon = {}
-    
-    smashed_votes = votes.filter(smash=True).select_related('pokemon')
-    for vote in smashed_votes:
-        # Evolution stage data
-        stage = vote.pokemon.evolution_stage
-        evo_data[stage] += 1
-        evo_pokemon[stage].append({
-            'id': vote.pokemon.pokeapi_id,
-            'name': vote.pokemon.name,
-            'image_url': vote.pokemon.image_url
-        })
-        
-        # Shape data
-        shape = vote.pokemon.shape or 'unknown'
-        shape_data[shape] = shape_data.get(shape, 0) + 1
-        if shape not in shape_pokemon:
-            shape_pokemon[shape] = []
-        shape_pokemon[shape].append({
-            'id': vote.pokemon.pokeapi_id,
-            'name': vote.pokemon.name,
-            'image_url': vote.pokemon.image_url
-        })
-
-        # Color data
-        color = vote.pokemon.color or 'unknown'
-        color_data[color] = color_data.get(color, 0) + 1
-        if color not in color_pokemon:
-            color_pokemon[color] = []
-        color_pokemon[color].append({
-            'id': vote.pokemon.pokeapi_id,
-            'name': vote.pokemon.name,
-            'image_url': vote.pokemon.image_url
-        })
+    stats = get_user_facets(username)
+    facets = stats['facets']
 
-        # Generation data
-        gen = vote.pokemon.generation or 'unknown'
-        gen_data[gen] = gen_data.get(gen, 0) + 1
-        if gen not in gen_pokemon:
-            gen_pokemon[gen] = []
-        gen_pokemon[gen].append({
-            'id': vote.pokemon.pokeapi_id,
-            'name': vote.pokemon.name,
-            'image_url': vote.pokemon.image_url
-        })
-    
     context = {
         'username': username,
-        'total_votes': total_votes,
-        'smash_count': smash_count,
-        'pass_count': pass_count,
-        'evo_data': evo_data,
-        'evo_pokemon': evo_pokemon,
-        'shape_data': shape_data,
-        'shape_pokemon': shape_pokemon,
-        'color_data': color_data,
-        'color_pokemon': color_pokemon,
-        'gen_data': gen_data,
-        'gen_pokemon': gen_pokemon,
+        'total_votes': stats['total_votes'],
+        'smash_count': stats['smash_count'],
+        'pass_count': stats['pass_count'],
+        'evo_data': facets['evo']['counts'],
+        'shape_data': facets['shape']['counts'],
+        'color_data': facets['color']['counts'],
+        'gen_data': facets['gen']['counts'],
+        # Facet drilldowns are pokeapi_id lists into one shared roster
+        'facet_pokemon': {name: facet['pokemon'] for name, facet in facets.items()},
+        'roster': stats['roster'],
     }
     return render(request, 'analytics/user_stats.html', context)
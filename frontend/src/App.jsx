@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import Login from './components/Login';
 import Header from './components/Header';
@@ -11,7 +11,15 @@ axios.defaults.xsrfCookieName = 'csrftoken';
 axios.defaults.xsrfHeaderName = 'X-CSRFToken';
 axios.defaults.withCredentials = true;
 
-const MAX_POKEMON_ID = 151; // Keeping to Gen 1 for now based on context, or 1025 if all
+// Swipes are queued and sent together to /api/votes/batch/
+const VOTE_FLUSH_SIZE = 5;
+const VOTE_FLUSH_DELAY = 3000;
+const VOTE_RETRY_MAX_DELAY = 60000;
+// Same as MAX_BATCH_VOTES in game/views.py
+const MAX_BATCH_VOTES = 200;
+
+// Cards are fetched in windows of this many ids from /api/pokemon/?from=&to=
+const PRELOAD_WINDOW = 6;
 
 export default function App() {
   const [user, setUser] = useState(null);
@@ -20,10 +28,29 @@ export default function App() {
   const [pokemon, setPokemon] = useState(null);
   const [swipeX, setSwipeX] = useState(0);
   const [voteLoading, setVoteLoading] = useState(false);
+  const voteQueue = useRef([]);
+  const voteFlushTimer = useRef(null);
+  const voteRetryDelay = useRef(VOTE_FLUSH_DELAY);
+  // Settles when the flush in progress (and any queued behind it) is done
+  const voteFlush = useRef(Promise.resolve());
+  const pokemonCache = useRef({});
+  // Static card data by id from the roster manifest; once loaded, windows only
+  // fetch the live part (counts and the user's vote)
+  const manifest = useRef(null);
+  // Active roster bounds, replaced by /api/bootstrap/ on load
+  const [roster, setRoster] = useState({ min_id: 1, max_id: 151 });
 
   // Initial Auth Check
   useEffect(() => {
     checkAuth();
+    loadBootstrap();
+  }, []);
+
+  // Send whatever is still queued when the page goes away
+  useEffect(() => {
+    const onPageHide = () => flushVotes(true);
+    window.addEventListener('pagehide', onPageHide);
+    return () => window.removeEventListener('pagehide', onPageHide);
   }, []);
 
   // Fetch Pokemon when ID changes
@@ -46,6 +73,31 @@ export default function App() {
     }
   };
 
+  const loadBootstrap = async () => {
+    try {
+      const res = await axios.get('/api/bootstrap/');
+      if (res.data.roster.max_id) setRoster(res.data.roster);
+      loadManifest(res.data.manifest_url);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
+  const loadManifest = async (url) => {
+    try {
+      const res = await axios.get(url);
+      const byId = {};
+      res.data.pokemon.forEach(row => {
+        const entry = Object.fromEntries(res.data.fields.map((field, i) => [field, row[i]]));
+        entry.name = entry.name.charAt(0).toUpperCase() + entry.name.slice(1);
+        byId[entry.id] = entry;
+      });
+      manifest.current = byId;
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   const fetchStartingId = async () => {
     try {
       const res = await axios.get('/api/start/');
@@ -56,15 +108,44 @@ export default function App() {
   };
 
   const fetchPokemon = async (id) => {
+    const cached = pokemonCache.current[id];
+    if (cached) {
+      setPokemon(cached);
+      // Top up the window before the user reaches its end
+      if (!pokemonCache.current[Math.min(id + PRELOAD_WINDOW - 1, roster.max_id)]) {
+        fetchWindow(id + 1).catch(() => {});
+      }
+      return;
+    }
+
     try {
-      const res = await axios.get(`/api/pokemon/${id}/`);
-      setPokemon(res.data);
+      await fetchWindow(id);
+      if (!pokemonCache.current[id]) {
+        // Outside the manifest (inactive), so the window only had its live part
+        const res = await axios.get(`/api/pokemon/${id}/`);
+        pokemonCache.current[id] = res.data;
+      }
+      setPokemon(pokemonCache.current[id]);
     } catch (err) {
       console.error('Failed to fetch pokemon', err);
       // Fallback or error state?
     }
   };
 
+  const fetchWindow = async (from) => {
+    const to = Math.min(from + PRELOAD_WINDOW - 1, roster.max_id);
+    const known = manifest.current;
+    const params = known ? { from, to, fields: 'live' } : { from, to };
+    const res = await axios.get('/api/pokemon/', { params });
+    res.data.pokemon.forEach(p => {
+      if (!known) {
+        pokemonCache.current[p.id] = p;
+      } else if (known[p.id]) {
+        pokemonCache.current[p.id] = { ...known[p.id], ...p };
+      }
+    });
+  };
+
   const handleLogin = async (username) => {
     const res = await axios.post('/api/login/', { username });
     if (res.data.status === 'success') {
@@ -74,38 +155,118 @@ export default function App() {
   };
 
   const handleLogout = async () => {
+    await flushVotes();
     await axios.post('/api/logout/');
     setUser(null);
     setPokemon(null);
     setCurrentId(null);
+    pokemonCache.current = {};
+  };
+
+  const flushVotes = (keepalive = false) => {
+    clearTimeout(voteFlushTimer.current);
+    voteFlushTimer.current = null;
+    // One batch on the wire at a time: a flush asked for meanwhile runs after it,
+    // so batches reach the server in the order the votes were cast
+    voteFlush.current = voteFlush.current
+      .then(() => sendVotes(keepalive))
+      .catch(err => console.error('Vote failed', err));
+    return voteFlush.current;
+  };
+
+  const sendVotes = async (keepalive) => {
+    while (voteQueue.current.length > 0) {
+      // The server refuses batches over MAX_BATCH_VOTES; send the rest after this one
+      const votes = voteQueue.current.slice(0, MAX_BATCH_VOTES);
+      voteQueue.current = voteQueue.current.slice(MAX_BATCH_VOTES);
+
+      let status;
+      let data;
+      try {
+        if (keepalive) {
+          // axios can't outlive the page, fetch with keepalive can
+          const res = await fetch('/api/votes/batch/', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ votes }),
+            credentials: 'include',
+            keepalive: true,
+          });
+          status = res.status;
+          if (res.ok) data = await res.json();
+        } else {
+          const res = await axios.post('/api/votes/batch/', { votes }, { validateStatus: () => true });
+          status = res.status;
+          data = res.data;
+        }
+      } catch (err) {
+        console.error('Vote failed', err);
+        retryVotes(votes);
+        return;
+      }
+
+      if (status >= 500) {
+        console.error('Vote failed', status);
+        retryVotes(votes);
+        return;
+      }
+      voteRetryDelay.current = VOTE_FLUSH_DELAY;
+      if (status >= 400) {
+        // Sending the same batch again would be refused the same way
+        console.error(`Dropped ${votes.length} votes the server refused (${status})`);
+        if (status === 401) setUser(null);
+        return;
+      }
+
+      // Keep cached cards in step with the server's counts
+      Object.entries(data.counts).forEach(([id, counts]) => {
+        if (pokemonCache.current[id]) {
+          pokemonCache.current[id] = { ...pokemonCache.current[id], ...counts };
+        }
+      });
+    }
   };
 
-  const handleVote = async (action) => {
+  const retryVotes = (votes) => {
+    // Network or server trouble: put the votes back and try again later, backing off.
+    // A vote cast since on the same Pokémon is newer, so the old one is dropped
+    const newer = new Set(voteQueue.current.map(vote => vote.pokemon_id));
+    voteQueue.current = votes.filter(vote => !newer.has(vote.pokemon_id)).concat(voteQueue.current);
+    if (!voteFlushTimer.current) {
+      voteFlushTimer.current = setTimeout(flushVotes, voteRetryDelay.current);
+    }
+    voteRetryDelay.current = Math.min(voteRetryDelay.current * 2, VOTE_RETRY_MAX_DELAY);
+  };
+
+  const handleVote = (action) => {
     if (!pokemon || voteLoading) return;
     setVoteLoading(true);
 
-    try {
-      await axios.post(`/api/vote/${pokemon.id}/`, { action });
-      // Optimistic update or wait?
-      // Move to next pokemon automatically after a slight delay
-      setTimeout(() => {
-        handleNext(); // Move to next
-        setVoteLoading(false);
-      }, 200);
-    } catch (err) {
-      console.error('Vote failed', err);
-      setVoteLoading(false);
+    voteQueue.current.push({ pokemon_id: pokemon.id, action });
+    if (pokemonCache.current[pokemon.id]) {
+      pokemonCache.current[pokemon.id] = { ...pokemonCache.current[pokemon.id], user_vote: action };
+    }
+    if (voteQueue.current.length >= VOTE_FLUSH_SIZE) {
+      flushVotes();
+    } else if (!voteFlushTimer.current) {
+      voteFlushTimer.current = setTimeout(flushVotes, VOTE_FLUSH_DELAY);
     }
+
+    // Move to next pokemon automatically after a slight delay
+    setTimeout(() => {
+      handleNext(); // Move to next
+      setVoteLoading(false);
+    }, 200);
   };
 
   const handleNext = () => {
-    if (currentId < MAX_POKEMON_ID) {
+    if (currentId < roster.max_id) {
       setCurrentId(prev => prev + 1);
     }
   };
 
   const handlePrev = () => {
-    if (currentId > 1) {
+    if (currentId > roster.min_id) {
       setCurrentId(prev => prev - 1);
     }
   };
@@ -133,6 +294,8 @@ export default function App() {
           <Header
             username={user.username}
             currentId={currentId}
+            minId={roster.min_id}
+            maxId={roster.max_id}
             onLogout={handleLogout}
             onJumpToId={handleJump}
           />
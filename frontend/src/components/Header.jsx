@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { LogOut, ArrowRight } from 'lucide-react';
 
-export default function Header({ username, currentId, onLogout, onJumpToId }) {
+export default function Header({ username, currentId, minId, maxId, onLogout, onJumpToId }) {
     const [inputVal, setInputVal] = useState(currentId || '');
 
     useEffect(() => {
@@ -11,7 +11,7 @@ export default function Header({ username, currentId, onLogout, onJumpToId }) {
     const handleSubmit = (e) => {
         e.preventDefault();
         const id = parseInt(inputVal);
-        if (!isNaN(id) && id > 0 && id <= 1025) { // Cap at reasonable max
+        if (!isNaN(id) && id >= minId && id <= maxId) { // Cap at the active roster
             onJumpToId(id);
         } else {
             setInputVal(currentId); // Reset on invalid
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GameConfig(AppConfig):
     name = 'game'
+
+    def ready(self):
+        from . import cache, metrics  # noqa: F401  (connects the cache and query-tracking receivers)
@@ -0,0 +1,84 @@
+class Bitmap:
+    """
+    A set of small non-negative integers (pokeapi_ids) packed into one Python int.
+
+    Bit `n` is set when `n` is in the set. Lookups and the first/next/previous
+    queries are a few big-int operations over ceil(max_id / 64) machine words,
+    so a full 1025-entry dex is 17 words.
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_ids(cls, ids):
+        bits = 0
+        for i in ids:
+            bits |= 1 << i
+        return cls(bits)
+
+    def to_bytes(self):
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(int.from_bytes(data, 'little'))
+
+    def add(self, i):
+        self.bits |= 1 << i
+
+    def discard(self, i):
+        self.bits &= ~(1 << i)
+
+    def __contains__(self, i):
+        return i >= 0 and (self.bits >> i) & 1 == 1
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __iter__(self):
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __sub__(self, other):
+        return Bitmap(self.bits & ~other.bits)
+
+    def __and__(self, other):
+        return Bitmap(self.bits & other.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.bits == other.bits
+
+    def __repr__(self):
+        return f'Bitmap({list(self)!r})'
+
+    def first(self):
+        """Smallest member, or None if empty."""
+        if not self.bits:
+            return None
+        return (self.bits & -self.bits).bit_length() - 1
+
+    def next_after(self, i):
+        """Smallest member greater than `i`, or None."""
+        start = max(i + 1, 0)
+        rest = self.bits >> start
+        if not rest:
+            return None
+        return start + (rest & -rest).bit_length() - 1
+
+    def previous_before(self, i):
+        """Largest member smaller than `i`, or None."""
+        if i <= 0:
+            return None
+        below = self.bits & ((1 << i) - 1)
+        if not below:
+            return None
+        return below.bit_length() - 1
@@ -0,0 +1,170 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .bitmap import Bitmap
+from .images import image_src
+from .models import Pokemon, Vote
+from .roster import active_filter
+from .signals import roster_changed, vote_cast, votes_imported
+
+ROSTER_KEY = 'game:roster'
+MANIFEST_KEY = 'game:manifest'
+
+# Column order of the rows in the roster manifest
+MANIFEST_FIELDS = ['pokeapi_id', 'name', 'image_url', 'evolution_stage', 'shape', 'color', 'generation']
+
+
+# How long a buffered vote keeps its Pokémon out of /api/start/. The flush adds
+# it to the voted-set long before; this only bounds a stalled flush_votes
+PENDING_TIMEOUT = 60 * 60
+
+# Names of the cached values whose hits and misses are counted, see cache_stats()
+TRACKED = ['roster', 'manifest', 'voted']
+
+
+def user_key(prefix, username):
+    # Usernames are free text; hash them into a cache-safe key
+    return f'{prefix}:{hashlib.md5(username.encode()).hexdigest()}'
+
+
+def cached(kind, key, build, timeout=DEFAULT_TIMEOUT):
+    """
+    cache.get(key), falling back to storing build(). Hits and misses are counted
+    under `kind` in this process's metrics registry, which costs no cache
+    round-trip; /metrics exposes them per process for the scraper to sum.
+    """
+    value = cache.get(key)
+    if value is None:
+        metrics.registry.count_cache(kind, 'misses')
+        value = build()
+        cache.set(key, value, timeout)
+    else:
+        metrics.registry.count_cache(kind, 'hits')
+    return value
+
+
+async def acached(kind, key, build, timeout=DEFAULT_TIMEOUT):
+    """cached() for async views; `build` is a coroutine function."""
+    value = await cache.aget(key)
+    if value is None:
+        outcome = 'misses'
+        value = await build()
+        await cache.aset(key, value, timeout)
+    else:
+        outcome = 'hits'
+    metrics.registry.count_cache(kind, outcome)
+    return value
+
+
+def cache_stats():
+    """Hit/miss counters and hit rate of every tracked cached value, in this process."""
+    counts = metrics.registry.cache
+    stats = {}
+    for kind in TRACKED:
+        hits, misses = counts[kind, 'hits'], counts[kind, 'misses']
+        total = hits + misses
+        stats[kind] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
+    return stats
+
+
+def get_roster():
+    """Bitmap of every seeded pokeapi_id in the active roster."""
+    ids = Pokemon.objects.filter(active_filter()).values_list('pokeapi_id', flat=True)
+    bits = cached('roster', ROSTER_KEY, lambda: Bitmap.from_ids(ids).bits)
+    return Bitmap(bits)
+
+
+async def aget_roster():
+    async def build():
+        ids = Pokemon.objects.filter(active_filter()).values_list('pokeapi_id', flat=True)
+        return Bitmap.from_ids([i async for i in ids]).bits
+    return Bitmap(await acached('roster', ROSTER_KEY, build))
+
+
+def invalidate_roster():
+    cache.delete_many([ROSTER_KEY, MANIFEST_KEY])
+
+
+def get_manifest():
+    """
+    The static part of the roster as (json_bytes, etag). The body is built once
+    and kept until a Pokemon is saved or deleted; the ETag is a hash of it.
+    """
+    return cached('manifest', MANIFEST_KEY, _build_manifest)
+
+
+def _build_manifest():
+    rows = Pokemon.objects.filter(active_filter()).order_by('pokeapi_id').values_list(*MANIFEST_FIELDS, 'image_hash')
+    image = MANIFEST_FIELDS.index('image_url')
+    pokemon = []
+    for *row, image_hash in rows:
+        row[image] = image_src(image_hash, row[image], 'card')
+        pokemon.append(row)
+    body = json.dumps(
+        {'fields': ['id', *MANIFEST_FIELDS[1:]], 'pokemon': pokemon},
+        separators=(',', ':'),
+    ).encode()
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+def get_voted(username):
+    """Bitmap of the pokeapi_ids `username` has voted on."""
+    ids = Vote.objects.filter(username=username).values_list('pokemon__pokeapi_id', flat=True)
+    bits = cached('voted', user_key('game:voted', username), lambda: Bitmap.from_ids(ids).bits)
+    return Bitmap(bits)
+
+
+def pending_key(username, pokeapi_id):
+    return f"{user_key('game:pending', username)}:{pokeapi_id}"
+
+
+def mark_pending(username, pokeapi_ids):
+    """
+    Flag votes that are acknowledged but still in the write-behind log, so
+    /api/start/ skips them before the flush adds them to the voted-set. One key
+    per vote: concurrent appends and flushes never read-modify-write a shared
+    value, so none of them can drop another's ids.
+    """
+    cache.set_many({pending_key(username, pokeapi_id): True for pokeapi_id in pokeapi_ids}, PENDING_TIMEOUT)
+
+
+def pending_votes(username):
+    """Callable returning which of some pokeapi_ids have a pending vote by `username`, in one cache read."""
+    def pending(pokeapi_ids):
+        keys = {pending_key(username, pokeapi_id): pokeapi_id for pokeapi_id in pokeapi_ids}
+        return {keys[key] for key in cache.get_many(list(keys))}
+    return pending
+
+
+async def aget_voted(username):
+    async def build():
+        ids = Vote.objects.filter(username=username).values_list('pokemon__pokeapi_id', flat=True)
+        return Bitmap.from_ids([i async for i in ids]).bits
+    return Bitmap(await acached('voted', user_key('game:voted', username), build))
+
+
+@receiver(vote_cast)
+def clear_voted_set(sender, username, **kwargs):
+    """
+    Drop the voted-set; the next read rebuilds it from one indexed query. Editing
+    it in place would be a get-modify-set that a concurrent write could undo.
+    """
+    cache.delete(user_key('game:voted', username))
+
+
+@receiver(votes_imported)
+def clear_voted_sets(sender, usernames, **kwargs):
+    cache.delete_many([user_key('game:voted', username) for username in usernames])
+
+
+@receiver(post_save, sender=Pokemon)
+@receiver(post_delete, sender=Pokemon)
+@receiver(roster_changed)
+def clear_roster(sender, **kwargs):
+    invalidate_roster()
@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bitmap import Bitmap
+from .models import Vote
+
+# One exported vote. pokemon_id is the pokeapi_id rather than the local primary
+# key, so an export lines up with any instance's roster.
+FIELDS = ('id', 'username', 'pokemon_id', 'smash', 'created_at')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/octet-stream',
+}
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'columnar': 'psv'}
+
+# Rows encoded per chunk handed to the response (CSV/NDJSON) and per columnar block
+CHUNK_ROWS = 1000
+BLOCK_ROWS = 10000
+
+COLUMNAR_MAGIC = b'PSVOTES1'
+BLOCK_HEADER = struct.Struct('<I')  # compressed length of the block that follows
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+CURSOR_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+
+def make_cursor(created_at, vote_id):
+    """Resume token for the export position just after this vote."""
+    return f'{created_at.astimezone(dt_timezone.utc).strftime(CURSOR_FORMAT)}:{vote_id}'
+
+
+def parse_cursor(value):
+    try:
+        stamp, vote_id = value.rsplit(':', 1)
+        return datetime.strptime(stamp, CURSOR_FORMAT).replace(tzinfo=dt_timezone.utc), int(vote_id)
+    except ValueError:
+        raise ValueError(f'Invalid cursor {value!r}') from None
+
+
+def parse_time(value):
+    """An ISO 8601 datetime; naive values are taken as UTC."""
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Expected an ISO 8601 datetime, got {value!r}')
+    return parsed if timezone.is_aware(parsed) else parsed.replace(tzinfo=dt_timezone.utc)
+
+
+def vote_rows(since=None, until=None, usernames=None, after=None, chunk_size=2000):
+    """
+    Votes as (id, username, pokeapi_id, smash, created_at) tuples in (created_at,
+    id) order, optionally within [since, until), for some users, and after a
+    (created_at, id) position. Fetched through iterator() in chunks, so memory
+    stays flat however many rows there are; the order is what makes the last
+    row written a resume point (make_cursor).
+    """
+    votes = Vote.objects.order_by('created_at', 'id')
+    if since is not None:
+        votes = votes.filter(created_at__gte=since)
+    if until is not None:
+        votes = votes.filter(created_at__lt=until)
+    if usernames:
+        votes = votes.filter(username__in=usernames)
+    if after is not None:
+        created_at, vote_id = after
+        votes = votes.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=vote_id))
+    return votes.values_list('id', 'username', 'pokemon__pokeapi_id', 'smash', 'created_at').iterator(chunk_size=chunk_size)
+
+
+def encode(fmt, rows, header=True):
+    """Byte chunks of `rows` in `fmt`; `header=False` continues an earlier export."""
+    return {'csv': csv_chunks, 'ndjson': ndjson_chunks, 'columnar': columnar_chunks}[fmt](rows, header)
+
+
+def csv_chunks(rows, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(FIELDS)
+    for n, (vote_id, username, pokemon_id, smash, created_at) in enumerate(rows, 1):
+        writer.writerow((vote_id, username, pokemon_id, int(smash), created_at.isoformat()))
+        if n % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(rows, header=True):
+    lines = []
+    for vote_id, username, pokemon_id, smash, created_at in rows:
+        lines.append(json.dumps(
+            {'id': vote_id, 'username': username, 'pokemon_id': pokemon_id, 'smash': smash, 'created_at': created_at.isoformat()},
+            separators=(',', ':'),
+        ))
+        if len(lines) == CHUNK_ROWS:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def columnar_chunks(rows, header=True):
+    """
+    The compact format: a magic string, then self-contained blocks of up to
+    BLOCK_ROWS votes, each a little-endian u32 length and a zlib-compressed body
+    laid out column by column:
+
+        u32 rows, u32 distinct usernames
+        u16 byte length of each username, then the UTF-8 usernames
+        u32 username index per row (dictionary encoding)
+        i64 id delta from the previous row (first from 0)
+        u32 pokemon_id per row
+        i64 created_at delta in microseconds (first from the epoch)
+        smash as a bitmap, bit n for row n, ceil(rows / 8) bytes
+
+    Sorted ids and timestamps delta-encode to small numbers and a handful of
+    usernames repeat, so each column compresses to a fraction of its CSV text.
+    """
+    if header:
+        yield COLUMNAR_MAGIC
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == BLOCK_ROWS:
+            yield _encode_block(block)
+            block = []
+    if block:
+        yield _encode_block(block)
+
+
+def _encode_block(rows):
+    names = {}
+    user_index = array('I', (names.setdefault(username, len(names)) for _, username, _, _, _ in rows))
+    encoded_names = [name.encode() for name in names]
+    ids, previous = array('q'), 0
+    stamps, previous_stamp = array('q'), 0
+    for vote_id, _, _, _, created_at in rows:
+        ids.append(vote_id - previous)
+        previous = vote_id
+        micros = (created_at - EPOCH) // timedelta(microseconds=1)
+        stamps.append(micros - previous_stamp)
+        previous_stamp = micros
+    smash = Bitmap.from_ids(n for n, row in enumerate(rows) if row[3]).to_bytes().ljust((len(rows) + 7) // 8, b'\0')
+
+    body = b''.join([
+        struct.pack('<II', len(rows), len(names)),
+        _to_bytes(array('H', (len(name) for name in encoded_names))),
+        *encoded_names,
+        _to_bytes(user_index),
+        _to_bytes(ids),
+        _to_bytes(array('I', (row[2] for row in rows))),
+        _to_bytes(stamps),
+        smash,
+    ])
+    compressed = zlib.compress(body, 6)
+    return BLOCK_HEADER.pack(len(compressed)) + compressed
+
+
+def detect_format(head):
+    """Format of an export from its first bytes."""
+    if head.startswith(COLUMNAR_MAGIC):
+        return 'columnar'
+    return 'ndjson' if head.lstrip().startswith(b'{') else 'csv'
+
+
+def read_export(fmt, stream):
+    """Rows of an export in `fmt` read from a binary stream, as vote_rows() yields them."""
+    if fmt == 'columnar':
+        return read_columnar(stream)
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return read_csv(text) if fmt == 'csv' else read_ndjson(text)
+
+
+def read_csv(stream):
+    for record in csv.DictReader(stream):
+        yield (
+            int(record['id']), record['username'], int(record['pokemon_id']),
+            record['smash'] == '1', parse_time(record['created_at']),
+        )
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield (
+                record['id'], record['username'], record['pokemon_id'],
+                record['smash'], parse_time(record['created_at']),
+            )
+
+
+def read_columnar(stream):
+    """Rows of a columnar export read from a binary stream, as vote_rows() yields them."""
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not a columnar vote export.')
+    while header := stream.read(BLOCK_HEADER.size):
+        data = b''
+        if len(header) == BLOCK_HEADER.size:
+            size, = BLOCK_HEADER.unpack(header)
+            data = stream.read(size)
+        if len(header) < BLOCK_HEADER.size or len(data) < size:
+            raise ValueError('Columnar vote export is truncated.')
+        yield from _decode_block(zlib.decompress(data))
+
+
+def _decode_block(body):
+    view = memoryview(body)
+    count, name_count = struct.unpack_from('<II', view)
+    position = 8
+
+    def column(typecode, length):
+        nonlocal position
+        values = array(typecode)
+        values.frombytes(view[position:position + length * values.itemsize])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        position += length * values.itemsize
+        return values
+
+    names = []
+    for length in column('H', name_count):
+        names.append(bytes(view[position:position + length]).decode())
+        position += length
+    user_index = column('I', count)
+    ids = column('q', count)
+    pokemon_ids = column('I', count)
+    stamps = column('q', count)
+    smash = Bitmap.from_bytes(bytes(view[position:position + (count + 7) // 8]))
+
+    rows = []
+    vote_id = micros = 0
+    for n in range(count):
+        vote_id += ids[n]
+        micros += stamps[n]
+        rows.append((vote_id, names[user_index[n]], pokemon_ids[n], n in smash, EPOCH + timedelta(microseconds=micros)))
+    return rows
+
+
+def _to_bytes(values):
+    # Stored little-endian whatever the platform
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
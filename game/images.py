@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+HASH_RE = re.compile(r'[0-9a-f]{64}')
+
+# Served formats, best first; the first one the client accepts wins
+FORMATS = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+
+
+def image_settings():
+    config = getattr(settings, 'POKESMASH_IMAGES', {}) or {}
+    return {
+        'path': Path(config.get('path', settings.BASE_DIR / '.image-store')),
+        'variants': config.get('variants', {'thumb': 192, 'card': 475}),
+    }
+
+
+def available_formats():
+    """Formats variants can be rendered in; without Pillow only the stored PNG."""
+    if Image is None:
+        return ['png']
+    return [fmt for fmt in FORMATS if fmt == 'png' or features.check(fmt)]
+
+
+def negotiate(accept):
+    """The best available format the Accept header allows."""
+    for fmt in available_formats():
+        if FORMATS[fmt] in accept:
+            return fmt
+    return 'png'
+
+
+def image_src(image_hash, image_url, variant):
+    """URL of a local variant once the sprite is stored, else the original remote URL."""
+    if not image_hash:
+        return image_url
+    return reverse('pokemon_image', args=[image_hash, variant])
+
+
+def original_path(digest):
+    return image_settings()['path'] / 'originals' / digest[:2] / f'{digest}.png'
+
+
+def variant_path(digest, variant, fmt):
+    return image_settings()['path'] / 'variants' / digest[:2] / digest / f'{variant}.{fmt}'
+
+
+def store_original(data):
+    """
+    Keep downloaded sprite bytes under their SHA-256 and return it. Identical
+    images (shared artwork, re-downloads) are stored once.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = original_path(digest)
+    if not path.exists():
+        _write_atomic(path, data)
+    return digest
+
+
+def render_variant(digest, variant, fmt):
+    """
+    Path of `variant` of a stored sprite in `fmt`, rendering it on first use.
+    None if the original isn't stored or the variant/format is unknown.
+    """
+    size = image_settings()['variants'].get(variant)
+    original = original_path(digest)
+    if size is None or fmt not in available_formats() or not original.exists():
+        return None
+    if Image is None:
+        # No Pillow: every variant is the stored original
+        return original
+
+    path = variant_path(digest, variant, fmt)
+    if not path.exists():
+        with Image.open(original) as image:
+            image = image.convert('RGBA')
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            tmp = _tmp_path(path)
+            # quality 80 keeps the artwork's flat colours clean at a fraction of the PNG size
+            image.save(tmp, format=fmt.upper(), **({} if fmt == 'png' else {'quality': 80}))
+        tmp.replace(path)
+    return path
+
+
+def render_all(digest):
+    """Pre-render every variant in every format, so no request waits on Pillow."""
+    for variant in image_settings()['variants']:
+        for fmt in available_formats():
+            render_variant(digest, variant, fmt)
+
+
+def _tmp_path(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.with_name(f'{path.stem}.{os.getpid()}-{threading.get_ident()}.tmp{path.suffix}')
+
+
+def _write_atomic(path, data):
+    # Write then rename, so a reader never sees a partial file
+    tmp = _tmp_path(path)
+    tmp.write_bytes(data)
+    tmp.replace(path)
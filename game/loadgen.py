@@ -0,0 +1,150 @@
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class LoadError(Exception):
+    pass
+
+
+@contextmanager
+def serve(port, env=None):
+    """Run the project under uvicorn on `port` for the duration of the block."""
+    if importlib.util.find_spec('uvicorn') is None:
+        raise LoadError('uvicorn is not installed (pip install uvicorn).')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'pokesmash.asgi:application',
+         '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+        cwd=settings.BASE_DIR, env={**os.environ, **(env or {})},
+    )
+    try:
+        _wait_for_port(port, process)
+        yield
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _wait_for_port(port, process, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise LoadError(f'uvicorn exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise LoadError(f'uvicorn did not start listening on port {port}.')
+
+
+def login(port, username):
+    """Log in through /api/login/ and return the session cookie as a Cookie header value."""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/login/', json.dumps({'username': username}), {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 200 or not cookie:
+        raise LoadError(f'Login failed with status {response.status}.')
+    return cookie.split(';', 1)[0]
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return body.decode()
+
+
+def query_totals(port):
+    """
+    (queries, requests) summed over every view but /metrics itself, read from
+    the server's /metrics endpoint. Diff two readings for the queries per request
+    of the load in between.
+    """
+    queries = requests = 0
+    for line in get(port, '/metrics').splitlines():
+        if 'view="metrics"' in line:
+            continue
+        if line.startswith('pokesmash_request_queries_sum{'):
+            queries += float(line.rsplit(' ', 1)[1])
+        elif line.startswith('pokesmash_request_queries_count{'):
+            requests += int(line.rsplit(' ', 1)[1])
+    return queries, requests
+
+
+def run(port, build, cookie, duration, concurrency, seed=0):
+    """
+    Drive the server from `concurrency` keep-alive connections for `duration`
+    seconds. `build(rng)` returns the next (method, path, body). Responses with a
+    5xx status or a broken connection count as errors.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(n):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + n)
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        headers = {'Cookie': cookie, 'Content-Type': 'application/json'}
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            method, path, body = build(rng)
+            began = time.perf_counter()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 500
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port)
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - began)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    began = time.monotonic()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.monotonic() - began, errors)
+
+
+def summarize(latencies, elapsed, errors=0):
+    """requests, errors, rps and p50/p99 latency (in seconds) of a load run."""
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[int(p * (len(latencies) - 1))] if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(0.5),
+        'p99': percentile(0.99),
+    }
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Engines that keep their sessions in the django_session table
+DB_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+class Command(BaseCommand):
+    help = 'Deletes django_session rows that can no longer be used.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted.')
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if settings.SESSION_ENGINE in DB_ENGINES:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+            kind = 'expired'
+        else:
+            # Sessions live in signed cookies (or only in the cache), so every row is
+            # left over from the database backend and nothing will read it again
+            kind = 'stale'
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {sessions.count()} {kind} sessions would be deleted.'))
+            return
+        deleted, _ = sessions.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} {kind} sessions.'))
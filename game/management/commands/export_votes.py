@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from game import export
+
+class Command(BaseCommand):
+    help = (
+        'Streams votes to a file (or stdout) as CSV, NDJSON or the compact columnar format, in '
+        '(created_at, id) order with constant memory. Writing to a file keeps a <file>.cursor checkpoint, '
+        'so an interrupted export continues where it stopped with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--output', default='-', help='File to write, or - for stdout.')
+        parser.add_argument('--since', help='Only votes created at or after this ISO 8601 datetime.')
+        parser.add_argument('--until', help='Only votes created before this ISO 8601 datetime.')
+        parser.add_argument('--username', action='append', help='Only votes by these users.')
+        parser.add_argument('--after', metavar='CURSOR', help='Only votes after this cursor (printed by an earlier export).')
+        parser.add_argument('--resume', action='store_true', help='Continue an interrupted export into --output.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if output == '-':
+            if options['resume']:
+                raise CommandError('--resume needs an --output file.')
+            self.export(sys.stdout.buffer, options, header=options['after'] is None)
+            return
+
+        path = Path(output)
+        state_path = path.with_name(f'{path.name}.cursor')
+        if options['resume']:
+            try:
+                state = json.loads(state_path.read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Nothing to resume: no checkpoint at {state_path}.') from e
+            # The checkpoint's filters win, so the two halves belong to one export
+            options.update(state['options'], after=state['cursor'])
+            with open(path, 'r+b') as f:
+                # Drop anything written after the last checkpoint
+                f.truncate(state['offset'])
+                f.seek(state['offset'])
+                last = self.export(f, options, header=state['offset'] == 0, state_path=state_path)
+        else:
+            with open(path, 'wb') as f:
+                last = self.export(f, options, header=options['after'] is None, state_path=state_path)
+        state_path.unlink(missing_ok=True)
+        if last:
+            self.stdout.write(self.style.SUCCESS(f'Export complete; continue later with --after {last}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Export complete.'))
+
+    def export(self, f, options, header, state_path=None):
+        """
+        Write the export to `f`. After each chunk with `state_path`, record the
+        cursor of its last row and the file offset it ends at. Returns the last
+        cursor written.
+        """
+        try:
+            since = export.parse_time(options['since']) if options['since'] else None
+            until = export.parse_time(options['until']) if options['until'] else None
+            after = export.parse_cursor(options['after']) if options['after'] else None
+        except ValueError as e:
+            raise CommandError(e)
+
+        last = options['after']
+        latest = None
+
+        def track(rows):
+            # The encoders emit a chunk right after consuming its last row, so
+            # this is always the last row of the chunk just written
+            nonlocal latest
+            for row in rows:
+                latest = row
+                yield row
+
+        rows = export.vote_rows(since=since, until=until, usernames=options['username'], after=after,
+                                chunk_size=options['chunk_size'])
+        for chunk in export.encode(options['format'], track(rows), header=header):
+            f.write(chunk)
+            if latest is not None:
+                last = export.make_cursor(latest[4], latest[0])
+            if state_path:
+                f.flush()
+                os.fsync(f.fileno())
+                self.save_state(state_path, last, f.tell(), options)
+        return last
+
+    def save_state(self, path, cursor, offset, options):
+        state = {
+            'cursor': cursor,
+            'offset': offset,
+            'options': {key: options[key] for key in ('format', 'since', 'until', 'username')},
+        }
+        tmp = path.with_name(f'{path.name}.tmp')
+        tmp.write_text(json.dumps(state))
+        tmp.replace(path)
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from game import images
+from game.models import Pokemon
+from game.pokeapi import PokeApiClient, PokeApiError
+from game.signals import roster_changed
+
+class Command(BaseCommand):
+    help = 'Downloads Pokémon sprites into the local image store and renders their size variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads.')
+        parser.add_argument('--refresh', action='store_true', help='Download every sprite again, not just missing ones.')
+
+    def handle(self, *args, **options):
+        pokemon = Pokemon.objects.order_by('pokeapi_id')
+        if not options['refresh']:
+            pokemon = pokemon.filter(image_hash='')
+        pokemon = list(pokemon.only('pk', 'pokeapi_id', 'image_url', 'image_hash'))
+        if images.Image is None:
+            self.stdout.write(self.style.WARNING('Pillow is not installed; only the original PNGs will be served.'))
+        self.stdout.write(f'Fetching {len(pokemon)} sprites...')
+
+        client = PokeApiClient(pool_size=options['workers'])
+        changed = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(self.fetch, client, p.image_url): p for p in pokemon}
+            for future in as_completed(futures):
+                p = futures[future]
+                try:
+                    digest = future.result()
+                except (PokeApiError, OSError) as e:
+                    self.stdout.write(self.style.ERROR(f'Failed to fetch the sprite of #{p.pokeapi_id}: {e}'))
+                    continue
+                if digest != p.image_hash:
+                    p.image_hash = digest
+                    changed.append(p)
+
+        Pokemon.objects.bulk_update(changed, ['image_hash'], batch_size=500)
+        if changed:
+            # Manifests and the analytics gallery carry image URLs
+            roster_changed.send(sender=Pokemon)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {len(changed)} new sprites ({client.network_requests} downloads).'
+        ))
+
+    def fetch(self, client, url):
+        digest = images.store_original(client.download(url))
+        images.render_all(digest)
+        return digest
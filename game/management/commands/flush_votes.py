@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from game.votelog import get_vote_log
+
+class Command(BaseCommand):
+    help = 'Writes the votes waiting in the write-behind vote buffer to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Votes applied per transaction.')
+        parser.add_argument(
+            '--interval', type=float, metavar='SECONDS',
+            help='Keep running, flushing every SECONDS, instead of flushing once.',
+        )
+
+    def handle(self, *args, **options):
+        log = get_vote_log()
+        while True:
+            applied = log.flush(options['batch_size'])
+            if applied is None:
+                self.stdout.write(self.style.WARNING('Another flush is running; skipped.'))
+            elif applied or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Flushed {applied} votes.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
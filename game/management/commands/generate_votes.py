@@ -0,0 +1,59 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from game.models import Pokemon, Vote
+from game.synthetic import make_roster, make_votes
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic dataset for benchmarks: USERS users each voting on a DENSITY share of the '
+        'first POKEMON Pokemon (placeholders are created for any missing), bulk-inserted in batches and '
+        'then reconciled with recalculate_stats. Deterministic for a given --seed. '
+        'For example --users 100000 --pokemon 1025 --density 0.49 inserts about 50M votes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--pokemon', type=int, default=1025, help='Roster size the votes are spread over.')
+        parser.add_argument('--density', type=float, default=0.5, help='Share of the roster each user votes on.')
+        parser.add_argument('--smash-rate', type=float, default=0.5, help='Chance that a vote is a smash.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Votes per INSERT batch.')
+        parser.add_argument('--prefix', default='user', help='Usernames are PREFIX0, PREFIX1, ...')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['density'] <= 1 or not 0 <= options['smash_rate'] <= 1:
+            raise CommandError('--density and --smash-rate must be between 0 and 1.')
+        prefix = options['prefix']
+        if Vote.objects.filter(username=f'{prefix}0').exists():
+            raise CommandError(
+                f'Votes from "{prefix}0" already exist; pick another --prefix or start from an empty database (manage.py flush).'
+            )
+
+        pokemon = list(Pokemon.objects.order_by('pokeapi_id')[:options['pokemon']])
+        missing = options['pokemon'] - len(pokemon)
+        if missing > 0:
+            start = pokemon[-1].pokeapi_id + 1 if pokemon else 1
+            pokemon += make_roster(missing, start=start)
+            self.stdout.write(f'Created {missing} placeholder Pokemon.')
+
+        total = options['users'] * round(len(pokemon) * options['density'])
+        step = max(total // 20, options['batch_size'])
+        next_report = step
+
+        def progress(created):
+            nonlocal next_report
+            if created >= next_report:
+                self.stdout.write(f'{created}/{total} votes...')
+                next_report += step
+
+        self.stdout.write(f"Inserting {total} votes from {options['users']} users over {len(pokemon)} Pokemon...")
+        created = make_votes(
+            pokemon, options['users'], density=options['density'], smash_rate=options['smash_rate'],
+            seed=options['seed'], batch_size=options['batch_size'], prefix=prefix, progress=progress,
+        )
+
+        # The bulk inserts bypassed the counters; bring them in line in one pass
+        call_command('recalculate_stats', stdout=StringIO())
+        self.stdout.write(self.style.SUCCESS(f'Created {created} votes and recalculated the Pokemon counters.'))
@@ -0,0 +1,93 @@
+import sys
+from io import StringIO
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from game import export
+from game.models import Pokemon, Vote
+from game.signals import votes_imported
+
+class Command(BaseCommand):
+    help = (
+        "Merges a vote export (export_votes, any format) from another instance into this one. "
+        "Pokemon are matched by pokeapi_id. When both sides have a user's vote on a Pokemon, the one "
+        "changed last wins (created_at, which a flip restamps; ties keep the local vote). The Pokemon counters are rebuilt "
+        "once at the end. Re-running an import is safe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Export file to import, or - for stdin.')
+        parser.add_argument('--format', choices=export.FORMATS, help='Detected from the file by default.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Votes written per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            stream = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(e)
+        # One lookup for the whole import instead of a join per row
+        local_ids = dict(Pokemon.objects.values_list('pokeapi_id', 'id'))
+        before = Vote.objects.count()
+        usernames = set()
+        read = applied = 0
+        unknown = {}
+        fmt = options['format']
+
+        try:
+            with stream:
+                fmt = fmt or export.detect_format(stream.peek(len(export.COLUMNAR_MAGIC)))
+                rows = export.read_export(fmt, stream)
+                while batch := list(islice(rows, options['batch_size'])):
+                    read += len(batch)
+                    values = []
+                    for _, username, pokeapi_id, smash, created_at in batch:
+                        pokemon_id = local_ids.get(pokeapi_id)
+                        if pokemon_id is None:
+                            unknown[pokeapi_id] = unknown.get(pokeapi_id, 0) + 1
+                            continue
+                        usernames.add(username)
+                        values.append((username, pokemon_id, smash, connection.ops.adapt_datetimefield_value(created_at)))
+                    applied += self.upsert(values)
+                    self.stdout.write(f'Read {read} votes...')
+        except (ValueError, KeyError) as e:
+            raise CommandError(f'Invalid {fmt} export after {read} votes: {e!r}. Batches before it were imported.')
+        finally:
+            if applied:
+                # The upserts skipped the counter updates and vote_cast; catch up once
+                call_command('recalculate_stats', stdout=StringIO())
+                votes_imported.send(sender=Vote, usernames=usernames)
+
+        inserted = Vote.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {read} votes: {inserted} new, {applied - inserted} replaced an older vote, '
+            f'{read - applied - sum(unknown.values())} kept the local vote.'
+        ))
+        if unknown:
+            missing = ', '.join(f'#{pokeapi_id}' for pokeapi_id in sorted(unknown))
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {sum(unknown.values())} votes on Pokemon missing here ({missing}); seed them and import again.'
+            ))
+
+    def upsert(self, values):
+        """
+        Insert a batch of (username, pokemon pk, smash, created_at) votes in one
+        executemany, overwriting an existing vote only when the incoming one is
+        newer. bulk_create(update_conflicts=True) can't express the condition and
+        would stamp created_at with now (auto_now_add). Returns the rows written.
+        """
+        if not values:
+            return 0
+        qn = connection.ops.quote_name
+        table = qn(Vote._meta.db_table)
+        username, pokemon_id, smash, created_at = (qn(c) for c in ('username', 'pokemon_id', 'smash', 'created_at'))
+        sql = (
+            f'INSERT INTO {table} ({username}, {pokemon_id}, {smash}, {created_at}) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT ({username}, {pokemon_id}) DO UPDATE SET '
+            f'{smash} = excluded.{smash}, {created_at} = excluded.{created_at} '
+            f'WHERE excluded.{created_at} > {table}.{created_at}'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, values)
+            return cursor.rowcount
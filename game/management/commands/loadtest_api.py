@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from game import loadgen
+from game.models import Pokemon, Vote
+
+USERNAME = 'loadtest'
+
+# Endpoint name -> builder of one (method, path, body) request from an rng and the seeded ids
+ENDPOINTS = {
+    'username': lambda rng, ids: ('GET', '/api/username/', None),
+    'start': lambda rng, ids: ('GET', f'/api/start/?after={rng.choice(ids)}', None),
+    'pokemon': lambda rng, ids: ('GET', f'/api/pokemon/{rng.choice(ids)}/', None),
+    'vote': lambda rng, ids: (
+        'POST', f'/api/vote/{rng.choice(ids)}/', json.dumps({'action': rng.choice(['smash', 'pass'])}),
+    ),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Serves the project with uvicorn once with the sync game views and once with the async ones '
+        '(POKESMASH_ASYNC_VIEWS) and reports req/s and latency percentiles per endpoint. '
+        f'Votes are cast as "{USERNAME}" and deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent keep-alive client connections.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--mode', choices=['sync', 'async'], action='append', help='Only run these modes.')
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', help='Only load these endpoints.')
+
+    def handle(self, *args, **options):
+        ids = list(Pokemon.objects.values_list('pokeapi_id', flat=True))
+        if not ids:
+            raise CommandError('No Pokemon to load; run seed_pokemon first.')
+
+        self.results = {}
+        port = options['port']
+        try:
+            for mode in options['mode'] or ['sync', 'async']:
+                with loadgen.serve(port, {'POKESMASH_ASYNC_VIEWS': '1' if mode == 'async' else '0'}):
+                    cookie = loadgen.login(port, USERNAME)
+                    for endpoint in options['endpoint'] or ENDPOINTS:
+                        build = ENDPOINTS[endpoint]
+                        result = loadgen.run(
+                            port, lambda rng: build(rng, ids), cookie, options['duration'], options['concurrency'],
+                        )
+                        self.results[mode, endpoint] = result
+                        self.stdout.write(
+                            f"{mode:>5} {endpoint:<8} {result['rps']:8.1f} req/s  "
+                            f"p50 {result['p50'] * 1000:7.2f} ms  p99 {result['p99'] * 1000:7.2f} ms  "
+                            f"{result['errors']} errors"
+                        )
+        except loadgen.LoadError as e:
+            raise CommandError(e)
+        finally:
+            # Deleting one by one keeps the Pokémon counters in step (post_delete)
+            deleted, _ = Vote.objects.filter(username=USERNAME).delete()
+            self.stdout.write(f'Removed {deleted} load-test votes.')
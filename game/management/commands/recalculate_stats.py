@@ -1,25 +1,103 @@
-from django.core.management.base import BaseCommand
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from game.models import Pokemon, Vote
-from django.db.models import Count, Q
+from game.signals import roster_changed
 
 class Command(BaseCommand):
     help = 'Recalculates smash and pass counts for all Pokemon based on actual Vote records.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report Pokemon whose counters drifted without fixing them.')
+        parser.add_argument(
+            '--since', nargs='?', const='last', metavar='DATETIME',
+            help='Only reconcile Pokemon with votes created after DATETIME (ISO 8601), or after the last run '
+                 'if no value is given. Deleted votes are only picked up by a full run.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Pokemon reconciled per transaction.')
+        parser.add_argument(
+            '--state-file', default=str(settings.BASE_DIR / '.recalculate_stats.json'),
+            help='Where the time of the last successful run is kept for --since.',
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write('Recalculating Pokemon stats...')
-        
-        all_pokemon = Pokemon.objects.all()
-        total = all_pokemon.count()
-        
-        for i, pokemon in enumerate(all_pokemon):
-            smash_count = Vote.objects.filter(pokemon=pokemon, smash=True).count()
-            pass_count = Vote.objects.filter(pokemon=pokemon, smash=False).count()
-            
-            pokemon.smash_count = smash_count
-            pokemon.pass_count = pass_count
-            pokemon.save()
-            
-            if (i + 1) % 10 == 0:
-                self.stdout.write(f'Processed {i + 1}/{total} pokemon...')
-        
-        self.stdout.write(self.style.SUCCESS('Successfully recalculated all Pokemon stats.'))
+        started_at = timezone.now()
+        pokemon_ids = Pokemon.objects.order_by('id').values_list('id', flat=True)
+
+        if options['since']:
+            since = self.resolve_since(options['since'], options['state_file'])
+            self.stdout.write(f'Recalculating Pokemon stats for votes since {since.isoformat()}...')
+            pokemon_ids = Vote.objects.filter(created_at__gt=since).order_by('pokemon_id').values_list('pokemon_id', flat=True).distinct()
+        else:
+            self.stdout.write('Recalculating Pokemon stats...')
+
+        pokemon_ids = list(pokemon_ids)
+        chunk_size = options['chunk_size']
+        drifted = 0
+        for i in range(0, len(pokemon_ids), chunk_size):
+            drifted += self.reconcile(pokemon_ids[i:i + chunk_size], options['dry_run'])
+            self.stdout.write(f'Processed {min(i + chunk_size, len(pokemon_ids))}/{len(pokemon_ids)} pokemon...')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {drifted} of {len(pokemon_ids)} Pokemon have drifted counters.'))
+            return
+
+        with open(options['state_file'], 'w') as f:
+            json.dump({'last_run': started_at.isoformat()}, f)
+        if drifted:
+            roster_changed.send(sender=Pokemon)
+        self.stdout.write(self.style.SUCCESS(f'Successfully recalculated all Pokemon stats ({drifted} corrected).'))
+
+    def reconcile(self, pokemon_ids, dry_run):
+        """
+        Compare one chunk's stored counters with a GROUP BY (pokemon_id, smash)
+        aggregate of its votes and bulk_update the ones that disagree. The rows
+        are locked first (where the backend supports it), and votes update the
+        Pokemon row before writing the vote, so no vote can slip in between the
+        aggregate and the update.
+        """
+        with transaction.atomic():
+            pokemon = Pokemon.objects.filter(id__in=pokemon_ids).only('id', 'pokeapi_id', 'name', 'smash_count', 'pass_count')
+            if not dry_run:
+                pokemon = pokemon.select_for_update()
+            pokemon = list(pokemon)
+
+            actual = {}
+            rows = Vote.objects.filter(pokemon_id__in=pokemon_ids).values_list('pokemon_id', 'smash').annotate(count=Count('id')).order_by()
+            for pokemon_id, smash, count in rows:
+                actual.setdefault(pokemon_id, [0, 0])[0 if smash else 1] = count
+
+            drifted = []
+            for p in pokemon:
+                smash_count, pass_count = actual.get(p.id, [0, 0])
+                if (p.smash_count, p.pass_count) != (smash_count, pass_count):
+                    self.stdout.write(
+                        f'#{p.pokeapi_id} {p.name}: stored {p.smash_count}/{p.pass_count}, '
+                        f'actual {smash_count}/{pass_count} (smash/pass)'
+                    )
+                    p.smash_count, p.pass_count = smash_count, pass_count
+                    drifted.append(p)
+
+            if drifted and not dry_run:
+                Pokemon.objects.bulk_update(drifted, ['smash_count', 'pass_count'])
+        return len(drifted)
+
+    def resolve_since(self, value, state_file):
+        if value != 'last':
+            try:
+                since = parse_datetime(value)
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError(f'--since expects an ISO 8601 datetime, got {value!r}')
+            return since if timezone.is_aware(since) else timezone.make_aware(since)
+        try:
+            with open(state_file) as f:
+                return parse_datetime(json.load(f)['last_run'])
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'No previous run recorded in {state_file}; run without --since first.') from e
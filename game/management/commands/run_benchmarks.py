@@ -0,0 +1,193 @@
+import json
+import platform
+import random
+import subprocess
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from game import loadgen
+from game.models import Pokemon, Vote
+
+USERNAME = 'benchmark'
+
+# Endpoint name -> builder of one (method, path, body) request from an rng, the
+# roster's pokeapi_ids and the user whose stats page is loaded
+ENDPOINTS = {
+    'vote': lambda rng, ids, user: (
+        'POST', f'/api/vote/{rng.choice(ids)}/', json.dumps({'action': rng.choice(['smash', 'pass'])}),
+    ),
+    'start': lambda rng, ids, user: ('GET', f'/api/start/?after={rng.choice(ids)}', None),
+    'pokemon': lambda rng, ids, user: ('GET', f'/api/pokemon/{rng.choice(ids)}/', None),
+    'analytics_index': lambda rng, ids, user: ('GET', '/analytics/', None),
+    'user_stats': lambda rng, ids, user: ('GET', f'/analytics/user/{user}/', None),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the main endpoints against the current database (see generate_votes) through the '
+        'Django test client and, with --http, through uvicorn and a local HTTP load generator. Throughput, '
+        'p50/p99 latency and queries per request go to a JSON file to diff across commits. '
+        f'Votes are cast as "{USERNAME}" and deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Measured test client requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint first.')
+        parser.add_argument('--http', action='store_true', help='Also load the endpoints over HTTP (needs uvicorn).')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of HTTP load per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent HTTP connections.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', help='Only run these endpoints.')
+        parser.add_argument('--user', help='User whose stats page is loaded (default: the first voter).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='JSON results file (default: .benchmarks/<commit>.json).')
+        parser.add_argument('--compare', metavar='FILE', help='Earlier results to print the changes against.')
+
+    def handle(self, *args, **options):
+        ids = list(Pokemon.objects.values_list('pokeapi_id', flat=True))
+        if not ids:
+            raise CommandError('No Pokemon to benchmark; run seed_pokemon or generate_votes first.')
+        user = options['user'] or Vote.objects.order_by('username').values_list('username', flat=True).first() or USERNAME
+        endpoints = options['endpoint'] or list(ENDPOINTS)
+        commit = self.git_commit()
+
+        report = {
+            'meta': {
+                'commit': commit,
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'async_views': bool(settings.POKESMASH_ASYNC_VIEWS),
+            },
+            'dataset': {
+                'pokemon': len(ids),
+                'users': Vote.objects.values('username').distinct().count(),
+                'votes': Vote.objects.count(),
+            },
+            'options': {key: options[key] for key in ('requests', 'warmup', 'duration', 'concurrency', 'seed')},
+            'results': {'client': {}},
+        }
+        self.results = report['results']
+        try:
+            for endpoint in endpoints:
+                self.record('client', endpoint, self.run_client(endpoint, ids, user, options))
+            if options['http']:
+                self.results['http'] = {}
+                port = options['port']
+                # Serve the same views the client runs used, whatever pokesmash.asgi defaults to
+                with loadgen.serve(port, {'POKESMASH_ASYNC_VIEWS': '1' if settings.POKESMASH_ASYNC_VIEWS else '0'}):
+                    cookie = loadgen.login(port, USERNAME)
+                    for endpoint in endpoints:
+                        self.record('http', endpoint, self.run_http(endpoint, ids, user, cookie, options))
+        except loadgen.LoadError as e:
+            raise CommandError(e)
+        finally:
+            # Deleting one by one keeps the Pokémon counters in step (post_delete)
+            Vote.objects.filter(username=USERNAME).delete()
+
+        output = Path(options['output'] or settings.BASE_DIR / '.benchmarks' / f'{commit}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
+        if options['compare']:
+            self.compare(options['compare'])
+
+    def run_client(self, endpoint, ids, user, options):
+        build = ENDPOINTS[endpoint]
+        rng = random.Random(options['seed'])
+        client = Client(HTTP_HOST=self.host())
+        client.post('/api/login/', {'username': USERNAME}, content_type='application/json')
+
+        def send():
+            method, path, body = build(rng, ids, user)
+            if method == 'POST':
+                return client.post(path, body, content_type='application/json')
+            return client.get(path)
+
+        for _ in range(options['warmup']):
+            send()
+        latencies, queries, errors = [], [], 0
+        began = time.perf_counter()
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                sent = time.perf_counter()
+                response = send()
+                elapsed = time.perf_counter() - sent
+            if response.status_code >= 500:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            queries.append(len(captured))
+        result = loadgen.summarize(latencies, time.perf_counter() - began, errors)
+        result['queries_mean'] = sum(queries) / len(queries) if queries else 0.0
+        result['queries_max'] = max(queries, default=0)
+        return result
+
+    def run_http(self, endpoint, ids, user, cookie, options):
+        build = ENDPOINTS[endpoint]
+        port = options['port']
+        queries_before, requests_before = loadgen.query_totals(port)
+        result = loadgen.run(
+            port, lambda rng: build(rng, ids, user), cookie, options['duration'], options['concurrency'], options['seed'],
+        )
+        queries_after, requests_after = loadgen.query_totals(port)
+        handled = requests_after - requests_before
+        result['queries_mean'] = (queries_after - queries_before) / handled if handled else 0.0
+        return result
+
+    def record(self, mode, endpoint, result):
+        # Milliseconds and rounding keep the file readable in a diff
+        p50, p99 = result.pop('p50'), result.pop('p99')
+        result = {
+            **result,
+            'rps': round(result['rps'], 1),
+            'p50_ms': round(p50 * 1000, 3),
+            'p99_ms': round(p99 * 1000, 3),
+            'queries_mean': round(result['queries_mean'], 2),
+        }
+        self.results[mode][endpoint] = result
+        self.stdout.write(
+            f"{mode:>6} {endpoint:<15} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+            f"p99 {result['p99_ms']:7.2f} ms  {result['queries_mean']:5.2f} queries  {result['errors']} errors"
+        )
+
+    def compare(self, path):
+        try:
+            previous = json.loads(Path(path).read_text())['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read earlier results from {path}: {e}')
+
+        def change(old, new):
+            return f'{(new - old) / old * 100:+6.1f}%' if old else '    n/a'
+
+        self.stdout.write(f"Changes against {path}:")
+        for mode, endpoints in self.results.items():
+            for endpoint, result in endpoints.items():
+                old = previous.get(mode, {}).get(endpoint)
+                if old is None:
+                    continue
+                self.stdout.write(
+                    f"{mode:>6} {endpoint:<15} req/s {change(old['rps'], result['rps'])}  "
+                    f"p50 {change(old['p50_ms'], result['p50_ms'])}  p99 {change(old['p99_ms'], result['p99_ms'])}  "
+                    f"queries {old['queries_mean']:.2f} -> {result['queries_mean']:.2f}"
+                )
+
+    def host(self):
+        # The test client's default "testserver" is only allowed inside tests
+        return next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
@@ -1,92 +1,139 @@
-import requests
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from game.models import Pokemon
+from game.pokeapi import API_URL, PokeApiClient, PokeApiError
+from game.roster import active_ids
+from game.signals import roster_changed
+
+# Pokemon fields the seeder owns; vote counters are never touched
+METADATA_FIELDS = ['name', 'image_url', 'evolution_stage', 'shape', 'color', 'generation']
+
+
+def metadata_hash(record):
+    return hashlib.sha1(json.dumps([record[f] for f in METADATA_FIELDS]).encode()).hexdigest()
+
+
+def evolution_stages(chain):
+    """Map each species in an evolution chain to its stage."""
+    stages = {}
+    first_species = chain['species']['name']
+    if not chain['evolves_to']:
+        stages[first_species] = 'NONE'
+    else:
+        stages[first_species] = 'FIRST'
+        for middle_evol in chain['evolves_to']:
+            middle_species = middle_evol['species']['name']
+            if not middle_evol['evolves_to']:
+                stages[middle_species] = 'LAST'
+            else:
+                stages[middle_species] = 'MIDDLE'
+                for last_evol in middle_evol['evolves_to']:
+                    last_species = last_evol['species']['name']
+                    stages[last_species] = 'LAST'
+    return stages
+
+
+def fetch_record(client, pokeapi_id):
+    """Fetch and parse one Pokémon into the fields stored on the Pokemon model."""
+    data = client.get(f'{API_URL}/pokemon/{pokeapi_id}')
+    species = client.get(data['species']['url'])
+    # Every species in a chain shares it, so fetch each chain once per run
+    chain = client.get(species['evolution_chain']['url'], memoize=True)['chain']
+
+    stages = evolution_stages(chain)
+    name_api = data['name']  # Lowercase for API matching
+    return {
+        'pokeapi_id': pokeapi_id,
+        'name': name_api.capitalize(),
+        'image_url': data['sprites']['other']['official-artwork']['front_default'],
+        'evolution_stage': stages.get(species['name'], stages.get(name_api, 'NONE')),
+        'shape': (species.get('shape') or {}).get('name', 'unknown'),
+        'color': (species.get('color') or {}).get('name', 'unknown'),
+        'generation': (species.get('generation') or {}).get('name', 'unknown'),
+    }
+
 
 class Command(BaseCommand):
     help = 'Seeds the database with Pokémon from PokéAPI'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent PokéAPI fetches.')
+        parser.add_argument(
+            '--cache-dir', default=str(settings.BASE_DIR / '.pokeapi-cache'),
+            help='On-disk PokéAPI response cache (or fixture directory). Re-runs replay from it.',
+        )
+        parser.add_argument('--offline', action='store_true', help='Only replay responses from --cache-dir.')
+        parser.add_argument('--refresh', action='store_true', help='Ignore cached responses and fetch again.')
+        parser.add_argument('--images', action='store_true', help='Also fetch missing sprites into the image store.')
+
+    def handle(self, *args, **options):
         self.stdout.write('Fetching Pokémon...')
-        
-        # Cache for evolution chains and shapes
-        evolution_cache = {}
-        shape_cache = {}
-
-        def get_species_metadata(species_url):
-            species_resp = requests.get(species_url).json()
-            shape = species_resp.get('shape', {}).get('name', 'unknown')
-            color = species_resp.get('color', {}).get('name', 'unknown')
-            generation = species_resp.get('generation', {}).get('name', 'unknown')
-            
-            chain_url = species_resp['evolution_chain']['url']
-            chain_data = requests.get(chain_url).json()['chain']
-            
-            # Map species in the chain to their stage
-            stages = {}
-            first_species = chain_data['species']['name']
-            if not chain_data['evolves_to']:
-                stages[first_species] = 'NONE'
-            else:
-                stages[first_species] = 'FIRST'
-                for middle_evol in chain_data['evolves_to']:
-                    middle_species = middle_evol['species']['name']
-                    if not middle_evol['evolves_to']:
-                        stages[middle_species] = 'LAST'
-                    else:
-                        stages[middle_species] = 'MIDDLE'
-                        for last_evol in middle_evol['evolves_to']:
-                            last_species = last_evol['species']['name']
-                            stages[last_species] = 'LAST'
-            return stages, shape, color, generation
-
-        # Target first 151 Pokémon
-        for i in range(1, 152):
-            url = f'https://pokeapi.co/api/v2/pokemon/{i}'
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                name_api = data['name'] # Lowercase for API matching
-                name_display = name_api.capitalize()
-                image_url = data['sprites']['other']['official-artwork']['front_default']
-                
-                # Determine metadata
-                if name_api not in evolution_cache:
-                    species_url = data['species']['url']
-                    try:
-                        new_stages, shape, color, gen = get_species_metadata(species_url)
-                        evolution_cache.update(new_stages)
-                        shape_cache[name_api] = shape 
-                        # We'll map color and gen to this name
-                        # (In reality, other species in the same chain might have different colors/gens, 
-                        # but for Gen 1 it's mostly consistent, and we'll fetch them as we hit them)
-                        shape_cache[name_api + '_color'] = color
-                        shape_cache[name_api + '_gen'] = gen
-                    except Exception as e:
-                        self.stdout.write(self.style.WARNING(f'Could not fetch species data for {name_display}: {e}'))
-                
-                stage = evolution_cache.get(name_api, 'NONE')
-                shape = shape_cache.get(name_api, 'unknown')
-                color = shape_cache.get(name_api + '_color', 'unknown')
-                gen = shape_cache.get(name_api + '_gen', 'unknown')
-
-                pokemon, created = Pokemon.objects.update_or_create(
-                    pokeapi_id=i,
-                    defaults={
-                        'name': name_display,
-                        'image_url': image_url,
-                        'evolution_stage': stage,
-                        'shape': shape,
-                        'color': color,
-                        'generation': gen
-                    }
-                )
-                
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f'Successfully added {name_display} ({stage}, {shape}, {color}, {gen})'))
-                else:
-                    self.stdout.write(self.style.SUCCESS(f'Successfully updated {name_display} ({stage}, {shape}, {color}, {gen})'))
-            else:
-                self.stdout.write(self.style.ERROR(f'Failed to fetch Pokémon {i}'))
 
-        self.stdout.write(self.style.SUCCESS('Seeding complete!'))
+        client = PokeApiClient(
+            cache_dir=options['cache_dir'],
+            offline=options['offline'],
+            refresh=options['refresh'],
+            pool_size=options['workers'],
+        )
+
+        # Target the active roster (settings.POKESMASH_ROSTER)
+        ids = active_ids()
+        records = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(fetch_record, client, i): i for i in ids}
+            for future in as_completed(futures):
+                try:
+                    records.append(future.result())
+                except (PokeApiError, KeyError, TypeError) as e:
+                    self.stdout.write(self.style.ERROR(f'Failed to fetch Pokémon {futures[future]}: {e}'))
+
+        inserted, updated, unchanged = self.write_records(records)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeding complete! {len(records)}/{len(ids)} Pokémon fetched, {client.network_requests} network requests. '
+            f'{inserted} inserted, {updated} updated, {unchanged} unchanged.'
+        ))
+
+        if options['images']:
+            call_command('fetch_images', workers=options['workers'], stdout=self.stdout)
+
+    def write_records(self, records):
+        """
+        Upsert the parsed records in one transaction with a single bulk INSERT ...
+        ON CONFLICT (pokeapi_id) DO UPDATE, skipping rows whose metadata is already
+        stored. Returns (inserted, updated, unchanged) counts.
+        """
+        with transaction.atomic():
+            rows = {
+                row['pokeapi_id']: row
+                for row in Pokemon.objects.filter(pokeapi_id__in=[r['pokeapi_id'] for r in records])
+                .values('pokeapi_id', 'image_hash', *METADATA_FIELDS)
+            }
+            stored = {pokeapi_id: metadata_hash(row) for pokeapi_id, row in rows.items()}
+
+            changed = [r for r in records if stored.get(r['pokeapi_id']) != metadata_hash(r)]
+            for r in changed:
+                # A new image_url invalidates the locally stored sprite
+                row = rows.get(r['pokeapi_id'])
+                r['image_hash'] = row['image_hash'] if row and row['image_url'] == r['image_url'] else ''
+            inserted = sum(1 for r in changed if r['pokeapi_id'] not in stored)
+            updated = len(changed) - inserted
+
+            # Database writes stay on this thread, in pokeapi_id order
+            Pokemon.objects.bulk_create(
+                [Pokemon(**r) for r in sorted(changed, key=lambda r: r['pokeapi_id'])],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['pokeapi_id'],
+                update_fields=[*METADATA_FIELDS, 'image_hash'],
+            )
+
+        if changed:
+            roster_changed.send(sender=Pokemon)
+        return inserted, updated, len(records) - len(changed)
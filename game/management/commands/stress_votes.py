@@ -0,0 +1,155 @@
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from analytics.models import UserTally
+from analytics.triggers import TALLY_TRIGGERS
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from game.models import Pokemon, Vote
+from game.synthetic import make_roster
+
+# Connection options to compare: Django's SQLite defaults and the configured ones
+CONFIGS = {
+    'baseline': {},
+    'tuned': settings.DATABASES['default'].get('OPTIONS', {}),
+}
+
+# Scratch votes still go through every vote_cast receiver, like real ones, but
+# what those cache lands here instead of next to the project's voted-sets
+SCRATCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stress_votes',
+    }
+}
+
+class Command(BaseCommand):
+    help = (
+        'Measures vote throughput with concurrent writers and readers on a scratch SQLite '
+        'database, once with the default connection options and once with the configured ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Threads casting votes.')
+        parser.add_argument('--readers', type=int, default=2, help='Threads running the analytics GROUP BY meanwhile.')
+        parser.add_argument('--votes', type=int, default=200, help='Votes cast by each writer.')
+        parser.add_argument('--pokemon', type=int, default=151, help='Size of the scratch roster.')
+        parser.add_argument('--config', choices=CONFIGS, action='append', help='Only run these configurations.')
+
+    def handle(self, *args, **options):
+        self.results = {}
+        with override_settings(CACHES=SCRATCH_CACHES):
+            try:
+                for name in options['config'] or CONFIGS:
+                    with tempfile.TemporaryDirectory() as tmp:
+                        result = self.run(Path(tmp) / 'stress.sqlite3', CONFIGS[name], options)
+                    cache.clear()
+                    self.report(name, result)
+            finally:
+                cache.clear()
+
+    def report(self, name, result):
+        self.results[name] = result
+        self.stdout.write(
+            f"{name}: {result['votes']} votes in {result['seconds']:.2f}s "
+            f"({result['votes_per_second']:.0f} votes/s), {result['reads']} reads, "
+            f"{result['locked']} failed with \"database is locked\""
+        )
+
+    def run(self, path, db_options, options):
+        """
+        Every thread gets its own connection, so each one is pointed at the scratch
+        file before its first query; the project database is never touched.
+        """
+        errors = []
+        start = threading.Barrier(options['writers'] + options['readers'] + 1)
+
+        def on_scratch_db(work):
+            def target(*args):
+                connection.settings_dict = {
+                    **connection.settings_dict,
+                    'NAME': str(path),
+                    'OPTIONS': db_options,
+                    'CONN_MAX_AGE': 0,
+                }
+                try:
+                    work(*args)
+                except Exception as e:
+                    errors.append(e)
+                    # Don't leave the other threads waiting at the start line
+                    start.abort()
+                finally:
+                    connection.close()
+            return target
+
+        def create_schema():
+            with connection.schema_editor() as editor:
+                editor.create_model(Pokemon)
+                editor.create_model(Vote)
+                editor.create_model(UserTally)
+                for trigger in TALLY_TRIGGERS:
+                    editor.execute(trigger)
+            make_roster(options['pokemon'])
+
+        setup = threading.Thread(target=on_scratch_db(create_schema))
+        setup.start()
+        setup.join()
+
+        writing = threading.Event()
+        lock = threading.Lock()
+        totals = {'votes': 0, 'reads': 0, 'locked': 0}
+
+        def count(key):
+            with lock:
+                totals[key] += 1
+
+        def write(n):
+            rng = random.Random(n)
+            start.wait()
+            for _ in range(options['votes']):
+                try:
+                    Vote.objects.record(f'stress{n}', rng.randint(1, options['pokemon']), rng.random() < 0.5)
+                    count('votes')
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    count('locked')
+
+        def read(n):
+            start.wait()
+            while writing.is_set():
+                try:
+                    list(Vote.objects.values_list('username', 'smash').annotate(count=Count('id')).order_by())
+                    count('reads')
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    count('locked')
+
+        writing.set()
+        writers = [threading.Thread(target=on_scratch_db(write), args=(n,)) for n in range(options['writers'])]
+        readers = [threading.Thread(target=on_scratch_db(read), args=(n,)) for n in range(options['readers'])]
+        for thread in writers + readers:
+            thread.start()
+        try:
+            start.wait()
+        except threading.BrokenBarrierError:
+            pass
+        began = time.perf_counter()
+        for thread in writers:
+            thread.join()
+        seconds = time.perf_counter() - began
+        writing.clear()
+        for thread in readers:
+            thread.join()
+        if errors:
+            raise next((e for e in errors if not isinstance(e, threading.BrokenBarrierError)), errors[0])
+
+        return {**totals, 'seconds': seconds, 'votes_per_second': totals['votes'] / seconds if seconds else 0}
@@ -0,0 +1,245 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger('pokesmash.performance')
+
+# Upper bounds of the latency buckets in seconds (Prometheus' defaults)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Stats of the request being handled. A context variable rather than a thread
+# local, so queries an async view runs through sync_to_async are counted too.
+_current = ContextVar('pokesmash_request_stats', default=None)
+
+
+def metrics_settings():
+    config = getattr(settings, 'POKESMASH_METRICS', {}) or {}
+    return {
+        'allowed_ips': config.get('allowed_ips', ['127.0.0.1', '::1']),
+        'slow_request_ms': config.get('slow_request_ms', 500),
+        'duplicate_query_threshold': config.get('duplicate_query_threshold', 5),
+    }
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield '+Inf', self.count
+
+
+class Registry:
+    """Metric values keyed by label tuples, updated under one lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # (view, method, status) -> count
+            self.durations = {}  # (view, method) -> Histogram
+            self.queries = {}  # view -> Histogram of queries per request
+            self.query_seconds = Counter()  # view -> seconds
+            self.duplicate_queries = Counter()  # view -> repeated executions
+            self.n_plus_one = Counter()  # view -> requests over the threshold
+            self.slow = Counter()  # view -> requests over the slow threshold
+            self.cache = Counter()  # (cached value kind, 'hits' or 'misses') -> lookups
+
+    def record(self, view, method, status, seconds, stats, duplicates, n_plus_one, slow):
+        with self._lock:
+            self.requests[view, method, status] += 1
+            self.durations.setdefault((view, method), Histogram(DURATION_BUCKETS)).observe(seconds)
+            self.queries.setdefault(view, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.query_seconds[view] += stats.query_seconds
+            self.duplicate_queries[view] += duplicates
+            self.n_plus_one[view] += n_plus_one
+            self.slow[view] += slow
+
+    def count_cache(self, kind, outcome):
+        with self._lock:
+            self.cache[kind, outcome] += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, key_labels, histograms):
+            for key, hist in sorted(histograms.items()):
+                labels = _labels(zip(key_labels, key if isinstance(key, tuple) else (key,)))
+                for bound, count in hist.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+                lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+        def counter(name, key_labels, values):
+            for key, value in sorted(values.items()):
+                labels = _labels(zip(key_labels, key if isinstance(key, tuple) else (key,)))
+                lines.append(f'{name}{{{labels}}} {value}')
+
+        with self._lock:
+            header('pokesmash_requests_total', 'counter', 'Requests handled, by view, method and status.')
+            counter('pokesmash_requests_total', ('view', 'method', 'status'), self.requests)
+            header('pokesmash_request_duration_seconds', 'histogram', 'Time until the view returned a response.')
+            histogram('pokesmash_request_duration_seconds', ('view', 'method'), self.durations)
+            header('pokesmash_request_queries', 'histogram', 'SQL queries per request.')
+            histogram('pokesmash_request_queries', ('view',), self.queries)
+            header('pokesmash_query_seconds_total', 'counter', 'Time spent in SQL queries.')
+            counter('pokesmash_query_seconds_total', ('view',), self.query_seconds)
+            header('pokesmash_duplicate_queries_total', 'counter', 'Executions of a SQL statement already run in the same request.')
+            counter('pokesmash_duplicate_queries_total', ('view',), self.duplicate_queries)
+            header('pokesmash_n_plus_one_requests_total', 'counter', 'Requests repeating one SQL statement at least the N+1 threshold.')
+            counter('pokesmash_n_plus_one_requests_total', ('view',), self.n_plus_one)
+            header('pokesmash_slow_requests_total', 'counter', 'Requests slower than the slow-request threshold.')
+            counter('pokesmash_slow_requests_total', ('view',), self.slow)
+            header('pokesmash_cache_lookups_total', 'counter', 'Lookups of cached values, by kind and outcome.')
+            counter('pokesmash_cache_lookups_total', ('kind', 'outcome'), self.cache)
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # SQL with placeholders -> executions; the same statement with different
+        # parameters is what an N+1 loop looks like
+        self.statements = Counter()
+
+
+def _track_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+        stats.statements[sql] += 1
+
+
+@receiver(connection_created)
+def install_query_tracker(sender, connection, **kwargs):
+    # Every connection, in every thread, reports into the current request's stats
+    if _track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_track_query)
+
+
+class PerformanceMiddleware:
+    """
+    Times every request and counts its SQL queries into the registry. Put it
+    first in MIDDLEWARE so the time spent in the other middleware is included.
+    Streamed bodies are generated after the view returns and aren't timed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def finish(self, request, response, seconds, stats):
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+
+        repeated = [(sql, count) for sql, count in stats.statements.items() if count > 1]
+        duplicates = sum(count - 1 for _, count in repeated)
+        config = metrics_settings()
+        threshold = config['duplicate_query_threshold']
+        worst = max(repeated, key=lambda item: item[1], default=None)
+        n_plus_one = worst is not None and worst[1] >= threshold
+        slow = seconds * 1000 >= config['slow_request_ms']
+
+        registry.record(view, request.method, response.status_code, seconds, stats, duplicates, n_plus_one, slow)
+
+        if n_plus_one:
+            logger.warning(
+                'Possible N+1 in %s %s (%s): %d executions of %s',
+                request.method, request.path, view, worst[1], worst[0][:200],
+            )
+        if slow:
+            logger.warning(
+                'Slow request: %s %s (%s) took %.0f ms, %d queries in %.0f ms',
+                request.method, request.path, view, seconds * 1000, stats.queries, stats.query_seconds * 1000,
+            )
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint; only answers the addresses in allowed_ips. The
+    registry lives in process memory, so each worker process reports its own.
+    """
+    if request.META.get('REMOTE_ADDR') not in metrics_settings()['allowed_ips']:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
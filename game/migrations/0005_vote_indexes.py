@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_pokemon_color_pokemon_generation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['pokemon', 'smash', 'username'], name='vote_pokemon_smash_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['username', 'smash'], name='vote_username_smash_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_vote_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemon',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_vote_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['-smash_count', 'pokeapi_id'], name='pokemon_smashes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['-pass_count', 'pokeapi_id'], name='pokemon_passes_idx'),
+        ),
+    ]
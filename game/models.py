@@ -1,12 +1,18 @@
-from django.db import models
-from django.db.models.signals import post_save, post_delete
+from asgiref.sync import sync_to_async
+from django.db import connection, models, transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.db.models import Count
+from django.db.models import DEFERRED, F
+from django.utils import timezone
+
+from .signals import vote_cast
 
 class Pokemon(models.Model):
     pokeapi_id = models.IntegerField(unique=True)
     name = models.CharField(max_length=100)
     image_url = models.URLField()
+    # SHA-256 of the sprite in the local image store (see game.images), once fetched
+    image_hash = models.CharField(max_length=64, blank=True, default='')
     smash_count = models.IntegerField(default=0)
     pass_count = models.IntegerField(default=0)
     EVOLUTION_STAGES = [
@@ -20,6 +26,13 @@ class Pokemon(models.Model):
     color = models.CharField(max_length=20, blank=True, null=True)
     generation = models.CharField(max_length=20, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # The analytics Pokémon leaderboards walk these in rank order
+            models.Index(fields=['-smash_count', 'pokeapi_id'], name='pokemon_smashes_idx'),
+            models.Index(fields=['-pass_count', 'pokeapi_id'], name='pokemon_passes_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -33,31 +46,214 @@ class Pokemon(models.Model):
             return 0
         return round((self.smash_count / self.total_votes) * 100, 2)
 
+# Columns a vote upsert overwrites on conflict. created_at comes along so a
+# changed vote is restamped (see Vote.created_at)
+UPSERT_FIELDS = ['smash', 'created_at']
+
+class VoteManager(models.Manager):
+    def record(self, username, pokeapi_id, smash):
+        """
+        Upsert a user's vote and return the Pokemon's new (smash_count, pass_count,
+        previous_smash), or None if no Pokemon has that pokeapi_id.
+
+        The counters are moved by the delta against the user's previous vote in a
+        single UPDATE ... RETURNING, then the vote row is written with
+        INSERT ... ON CONFLICT (username, pokemon) DO UPDATE, so a swipe costs two
+        queries and never needs a refresh_from_db(). Repeating the stored vote
+        writes nothing after the first query.
+        """
+        with transaction.atomic(savepoint=False):
+            row = _apply_vote_delta(username, pokeapi_id, smash)
+            if row is None:
+                return None
+            pokemon_pk, smash_count, pass_count, previous = row
+            if previous != smash:
+                self.bulk_create(
+                    [Vote(username=username, pokemon_id=pokemon_pk, smash=smash)],
+                    update_conflicts=True,
+                    unique_fields=['username', 'pokemon'],
+                    update_fields=UPSERT_FIELDS,
+                )
+        if previous != smash:
+            vote_cast.send(sender=Vote, username=username, pokeapi_id=pokeapi_id, smash=smash, previous=previous)
+        return smash_count, pass_count, previous
+
+    async def arecord(self, username, pokeapi_id, smash):
+        # The async ORM has no transactions; run the whole upsert in one thread hop
+        return await sync_to_async(self.record)(username, pokeapi_id, smash)
+
+    def record_many(self, username, votes):
+        """
+        Apply a batch of (pokeapi_id, smash) votes in one transaction.
+
+        Later entries for the same Pokemon win, each affected Pokemon gets a single
+        counter update, and all vote rows are written with one bulk upsert.
+        Returns {pokeapi_id: (smash_count, pass_count, previous_smash) or None}.
+        """
+        latest = dict(votes)
+        results = {}
+        rows = []
+        with transaction.atomic(savepoint=False):
+            for pokeapi_id, smash in latest.items():
+                row = _apply_vote_delta(username, pokeapi_id, smash)
+                if row is None:
+                    results[pokeapi_id] = None
+                    continue
+                pokemon_pk, smash_count, pass_count, previous = row
+                results[pokeapi_id] = (smash_count, pass_count, previous)
+                if previous != smash:
+                    rows.append(Vote(username=username, pokemon_id=pokemon_pk, smash=smash))
+            if rows:
+                self.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['username', 'pokemon'],
+                    update_fields=UPSERT_FIELDS,
+                )
+        for pokeapi_id, smash in latest.items():
+            if results[pokeapi_id] is not None and results[pokeapi_id][2] != smash:
+                vote_cast.send(sender=Vote, username=username, pokeapi_id=pokeapi_id, smash=smash, previous=results[pokeapi_id][2])
+        return results
+
+    def preview_many(self, username, votes):
+        """
+        What record_many() would return, without writing anything: the current
+        counters moved by each vote's difference from the user's stored vote.
+        One query. Votes still waiting in the write-behind buffer aren't seen.
+        """
+        latest = dict(votes)
+        stored = self.filter(username=username, pokemon=models.OuterRef('pk')).values('smash')[:1]
+        rows = Pokemon.objects.filter(pokeapi_id__in=latest).annotate(previous=models.Subquery(stored)).values_list(
+            'pokeapi_id', 'smash_count', 'pass_count', 'previous'
+        )
+        results = dict.fromkeys(latest)
+        for pokeapi_id, smash_count, pass_count, previous in rows:
+            smash = latest[pokeapi_id]
+            if previous != smash:
+                if previous is not None:
+                    smash_count, pass_count = smash_count - previous, pass_count - (not previous)
+                smash_count, pass_count = smash_count + smash, pass_count + (not smash)
+            results[pokeapi_id] = (smash_count, pass_count, previous)
+        return results
+
+def _apply_vote_delta(username, pokeapi_id, smash):
+    """
+    Move the counters of the Pokemon with `pokeapi_id` from the user's current vote
+    (if any) to `smash` in one statement. Returns (pk, smash_count, pass_count,
+    previous_smash), or None when the Pokemon doesn't exist.
+    """
+    qn = connection.ops.quote_name
+    pokemon_table = qn(Pokemon._meta.db_table)
+    vote_table = qn(Vote._meta.db_table)
+    user_vote = (
+        f'FROM {vote_table} WHERE {vote_table}.{qn("username")} = %s '
+        f'AND {vote_table}.{qn("pokemon_id")} = {pokemon_table}.{qn("id")}'
+    )
+    sql = (
+        f'UPDATE {pokemon_table} SET '
+        f'{qn("smash_count")} = {qn("smash_count")} + %s - (SELECT COUNT(*) {user_vote} AND {vote_table}.{qn("smash")}), '
+        f'{qn("pass_count")} = {qn("pass_count")} + %s - (SELECT COUNT(*) {user_vote} AND NOT {vote_table}.{qn("smash")}) '
+        f'WHERE {qn("pokeapi_id")} = %s '
+        f'RETURNING {qn("id")}, {qn("smash_count")}, {qn("pass_count")}, (SELECT {vote_table}.{qn("smash")} {user_vote})'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [int(smash), username, int(not smash), username, pokeapi_id, username])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    pokemon_pk, smash_count, pass_count, previous = row
+    return pokemon_pk, smash_count, pass_count, None if previous is None else bool(previous)
+
 class Vote(models.Model):
     username = models.CharField(max_length=100)
     pokemon = models.ForeignKey(Pokemon, on_delete=models.CASCADE, related_name='votes')
     smash = models.BooleanField()  # True for smash, False for pass
+    # When the vote took its current value: a flip restamps it, so exports
+    # (--after), imports (newest wins) and recalculate_stats --since see changes
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = VoteManager()
+
     class Meta:
         unique_together = ['username', 'pokemon']  # Each user can only vote once per Pokemon
+        indexes = [
+            # Per-Pokemon counts (vote delta subqueries, recalculate_stats) and the
+            # analytics voter pages, which also order by username
+            models.Index(fields=['pokemon', 'smash', 'username'], name='vote_pokemon_smash_user_idx'),
+            # Smash/pass totals grouped by user (most smashes / most passes, the
+            # analytics tallies, user_stats). username leads so the GROUP BY walks
+            # the index in order: SQLite can't seek on a bare boolean WHERE smash
+            models.Index(fields=['username', 'smash'], name='vote_username_smash_idx'),
+            # Exports walk votes in (created_at, id) order and resume from a
+            # position in it; also recalculate_stats --since
+            models.Index(fields=['created_at', 'id'], name='vote_created_idx'),
+        ]
 
     def __str__(self):
         action = "Smash" if self.smash else "Pass"
         return f"{self.username} - {action} - {self.pokemon.name}"
 
+@receiver(post_init, sender=Vote)
+def remember_original_smash(sender, instance, **kwargs):
+    """
+    Keep the loaded smash value so a later save can apply only the delta.
+    DEFERRED when the row was loaded without it (only()/defer()).
+    """
+    if not instance.pk:
+        instance._original_smash = None
+    else:
+        instance._original_smash = instance.__dict__.get('smash', DEFERRED)
+
+def _resolve_original_smash(instance):
+    """Read the stored smash of a vote loaded without it, before it's overwritten or deleted."""
+    if instance._original_smash is DEFERRED:
+        instance._original_smash = Vote.objects.filter(pk=instance.pk).values_list('smash', flat=True).first()
+
+@receiver(pre_save, sender=Vote)
+def restamp_changed_vote(sender, instance, **kwargs):
+    """A save that changes an existing vote moves created_at to now, as record() does."""
+    if instance._original_smash is DEFERRED and 'smash' not in instance.__dict__:
+        # Still unloaded, so this save doesn't write smash
+        return
+    _resolve_original_smash(instance)
+    if instance.pk and instance._original_smash is not None and instance.smash != instance._original_smash:
+        instance.created_at = timezone.now()
+
 @receiver(post_save, sender=Vote)
 def update_pokemon_counts_on_save(sender, instance, created, **kwargs):
-    """Update Pokemon counts when a Vote is saved."""
-    pokemon = instance.pokemon
-    pokemon.smash_count = Vote.objects.filter(pokemon=pokemon, smash=True).count()
-    pokemon.pass_count = Vote.objects.filter(pokemon=pokemon, smash=False).count()
-    pokemon.save()
+    """Apply the vote's delta to the Pokemon counters with in-database increments."""
+    previous = None if created else instance._original_smash
+    if previous is DEFERRED:
+        return
+    instance._original_smash = instance.smash
+    if previous == instance.smash:
+        return
+
+    if previous is None:
+        counts = {'smash_count': F('smash_count') + 1} if instance.smash else {'pass_count': F('pass_count') + 1}
+    elif instance.smash:
+        counts = {'smash_count': F('smash_count') + 1, 'pass_count': F('pass_count') - 1}
+    else:
+        counts = {'smash_count': F('smash_count') - 1, 'pass_count': F('pass_count') + 1}
+    Pokemon.objects.filter(pk=instance.pokemon_id).update(**counts)
+    vote_cast.send(sender=Vote, username=instance.username, pokeapi_id=instance.pokemon.pokeapi_id,
+                   smash=instance.smash, previous=previous)
+
+@receiver(pre_delete, sender=Vote)
+def load_deleted_vote(sender, instance, **kwargs):
+    """Read what post_delete needs while the row still exists, for votes loaded with only()/defer()."""
+    _resolve_original_smash(instance)
+    deferred = instance.get_deferred_fields() & {'username', 'pokemon_id'}
+    if deferred:
+        instance.refresh_from_db(fields=deferred)
 
 @receiver(post_delete, sender=Vote)
 def update_pokemon_counts_on_delete(sender, instance, **kwargs):
-    """Update Pokemon counts when a Vote is deleted."""
-    pokemon = instance.pokemon
-    pokemon.smash_count = Vote.objects.filter(pokemon=pokemon, smash=True).count()
-    pokemon.pass_count = Vote.objects.filter(pokemon=pokemon, smash=False).count()
-    pokemon.save()
+    """Remove the deleted vote from the Pokemon counters."""
+    if instance._original_smash is None:
+        # Already gone when pre_delete looked, so it was never counted here
+        return
+    field = 'smash_count' if instance._original_smash else 'pass_count'
+    Pokemon.objects.filter(pk=instance.pokemon_id).update(**{field: F(field) - 1})
+    vote_cast.send(sender=Vote, username=instance.username, pokeapi_id=instance.pokemon.pokeapi_id,
+                   smash=None, previous=instance._original_smash)
@@ -0,0 +1,106 @@
+import gzip
+import json
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = 'https://pokeapi.co/api/v2'
+
+
+class PokeApiError(Exception):
+    pass
+
+
+class PokeApiClient:
+    """
+    JSON GETs against PokéAPI through one pooled, retrying session, with an
+    on-disk response cache keyed by URL path (e.g. pokemon/25.json.gz).
+
+    A cache directory doubles as a fixture directory: with offline=True every
+    response is replayed from disk and a missing file is an error.
+    """
+
+    def __init__(self, cache_dir=None, offline=False, refresh=False, pool_size=8, timeout=10):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.offline = offline
+        self.refresh = refresh
+        self.timeout = timeout
+        self.network_requests = 0
+        self._memo = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def download(self, url):
+        """Raw bytes at `url` through the pooled session, uncached (images)."""
+        if self.offline:
+            raise PokeApiError(f'{url} is not cached and offline mode is on')
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise PokeApiError(f'{url}: {e}') from e
+        with self._lock:
+            self.network_requests += 1
+        return response.content
+
+    def cache_path(self, url):
+        path = urlsplit(url).path.strip('/')
+        if path.startswith('api/v2/'):
+            path = path[len('api/v2/'):]
+        return self.cache_dir / f'{path}.json.gz'
+
+    def get(self, url, memoize=False):
+        """
+        The decoded JSON at `url`. With memoize=True the response is also kept in
+        memory and concurrent callers for the same URL wait for a single fetch,
+        which is how evolution chains shared by several species are fetched once.
+        """
+        if not memoize:
+            return self._load(url)
+        with self._lock:
+            lock = self._locks.setdefault(url, threading.Lock())
+        with lock:
+            if url not in self._memo:
+                self._memo[url] = self._load(url)
+            return self._memo[url]
+
+    def store(self, url, data):
+        path = self.cache_path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a truncated file
+        tmp = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(data, f)
+        tmp.replace(path)
+
+    def _load(self, url):
+        if self.cache_dir and not self.refresh:
+            path = self.cache_path(url)
+            if path.exists():
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    return json.load(f)
+        if self.offline:
+            raise PokeApiError(f'{url} is not in the cache and offline mode is on')
+
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise PokeApiError(f'{url}: {e}') from e
+        with self._lock:
+            self.network_requests += 1
+
+        if self.cache_dir:
+            self.store(url, data)
+        return data
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db.models import Q
+
+# National dex ids introduced by each generation
+GENERATION_RANGES = {
+    1: (1, 151),
+    2: (152, 251),
+    3: (252, 386),
+    4: (387, 493),
+    5: (494, 649),
+    6: (650, 721),
+    7: (722, 809),
+    8: (810, 905),
+    9: (906, 1025),
+}
+
+
+def active_ranges():
+    """
+    Sorted, merged (first, last) pokeapi_id ranges of the active roster, from
+    settings.POKESMASH_ROSTER: {'generations': [1, 2]} and/or {'ranges': [(1, 151)]}.
+    """
+    config = getattr(settings, 'POKESMASH_ROSTER', {'generations': [1]})
+    ranges = [GENERATION_RANGES[g] for g in config.get('generations', [])]
+    ranges += [tuple(r) for r in config.get('ranges', [])]
+
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def active_ids():
+    return [i for first, last in active_ranges() for i in range(first, last + 1)]
+
+
+def active_filter(field='pokeapi_id'):
+    """Q matching `field` within the active roster."""
+    q = Q(pk__in=[])
+    for first, last in active_ranges():
+        q |= Q(**{f'{field}__range': (first, last)})
+    return q
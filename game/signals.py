@@ -0,0 +1,14 @@
+from django.dispatch import Signal
+
+# Sent after a user's vote on a Pokemon changes, whichever path wrote it.
+# Arguments: username, pokeapi_id, smash (None once the vote is deleted) and
+# previous (the vote before this change, None if there was none).
+vote_cast = Signal()
+
+# Sent after Pokemon rows are written in bulk (bulk_create skips post_save), so
+# caches derived from the roster can be dropped.
+roster_changed = Signal()
+
+# Sent after votes are written in bulk (import_votes), which skips vote_cast.
+# Argument: usernames, the users whose votes may have changed.
+votes_imported = Signal()
@@ -15,9 +15,50 @@ const idInput = document.getElementById('pokemon-id-input');
 const idForm = document.getElementById('id-jump-form');
 
 // Constants
-const MAX_POKEMON_ID = 151; // Or 1025 depending on seeded data
 const SWIPE_THRESHOLD = 120;
 
+// Active roster bounds, replaced by /api/bootstrap/ on load
+let minPokemonId = 1;
+let maxPokemonId = 151;
+
+async function loadBootstrap() {
+    try {
+        const response = await fetch('/api/bootstrap/');
+        const data = await response.json();
+        if (data.roster.max_id) {
+            minPokemonId = data.roster.min_id;
+            maxPokemonId = data.roster.max_id;
+            idInput.min = minPokemonId;
+            idInput.max = maxPokemonId;
+        }
+        loadManifest(data.manifest_url);
+    } catch (error) {
+        console.error('Error loading roster:', error);
+    }
+}
+
+// Static card data (name, image) by id, from the roster manifest. Once it is
+// loaded, range reads only ask for the live part (counts and the user's vote)
+let manifest = null;
+
+async function loadManifest(url) {
+    try {
+        const response = await fetch(url);
+        if (!response.ok) return;
+        const data = await response.json();
+        const byId = {};
+        data.pokemon.forEach(row => {
+            const entry = {};
+            data.fields.forEach((field, i) => { entry[field] = row[i]; });
+            entry.name = entry.name.charAt(0).toUpperCase() + entry.name.slice(1);
+            byId[entry.id] = entry;
+        });
+        manifest = byId;
+    } catch (error) {
+        console.error('Error loading manifest:', error);
+    }
+}
+
 // --- Auth Logic ---
 
 async function checkLoginStatus() {
@@ -93,6 +134,7 @@ async function handleLogin(event) {
 
 async function handleLogout() {
     try {
+        await flushVotes();
         await fetch('/api/logout/');
         location.reload();
     } catch (error) {
@@ -120,7 +162,7 @@ const fetchingIds = new Set();
 
 async function fetchPokemon(id, pushState = true) {
     id = parseInt(id);
-    if (!id || id < 1) return;
+    if (!id || id < minPokemonId || id > maxPokemonId) return;
 
     currentPokemonId = id;
     idInput.value = id;
@@ -196,42 +238,61 @@ function onImageLoaded() {
 }
 
 function preloadAdjacent(centerId) {
-    // Preload next 5 and previous 2 to ensure smooth traversal
-    for (let i = 1; i <= 5; i++) {
-        preloadSingle(centerId + i);
-    }
-    if (centerId > 1) preloadSingle(centerId - 1);
+    // Preload next 5 and previous 1 to ensure smooth traversal, in one request
+    preloadRange(centerId - 1, centerId + 5);
 }
 
-async function preloadSingle(id) {
-    if (id < 1 || id > 1025 || dataCache[id] || fetchingIds.has(id)) return;
+async function preloadRange(from, to) {
+    from = Math.max(from, minPokemonId);
+    to = Math.min(to, maxPokemonId);
+
+    // Shrink the window to the ids we don't have yet
+    while (from <= to && (dataCache[from] || fetchingIds.has(from))) from++;
+    while (to >= from && (dataCache[to] || fetchingIds.has(to))) to--;
+    if (from > to) return;
+
+    const ids = [];
+    for (let id = from; id <= to; id++) {
+        if (!dataCache[id] && !fetchingIds.has(id)) ids.push(id);
+    }
+    ids.forEach(id => fetchingIds.add(id));
 
-    fetchingIds.add(id);
     try {
-        const res = await fetch(`/api/pokemon/${id}/`);
+        const live = manifest !== null;
+        const res = await fetch(`/api/pokemon/?from=${from}&to=${to}${live ? '&fields=live' : ''}`);
         if (res.ok) {
             const data = await res.json();
-            dataCache[id] = data;
-            // Trigger browser to download/cache the image
-            const img = new Image();
-            img.src = data.image_url;
+            data.pokemon.forEach(p => {
+                if (dataCache[p.id]) return;
+                if (live) {
+                    // Not in the manifest (inactive): fetchPokemon reads it in full
+                    if (!manifest[p.id]) return;
+                    p = { ...manifest[p.id], ...p };
+                }
+                dataCache[p.id] = p;
+                // Trigger browser to download/cache the image
+                const img = new Image();
+                img.src = p.image_url;
+            });
         }
     } catch (e) { }
-    fetchingIds.delete(id);
+    ids.forEach(id => fetchingIds.delete(id));
 }
 
 function handleNext() {
     if (document.activeElement instanceof HTMLElement) {
         document.activeElement.blur();
     }
-    fetchPokemon(currentPokemonId + 1);
+    if (currentPokemonId < maxPokemonId) {
+        fetchPokemon(currentPokemonId + 1);
+    }
 }
 
 function handlePrev() {
     if (document.activeElement instanceof HTMLElement) {
         document.activeElement.blur();
     }
-    if (currentPokemonId > 1) {
+    if (currentPokemonId > minPokemonId) {
         fetchPokemon(currentPokemonId - 1);
     }
 }
@@ -239,14 +300,26 @@ function handlePrev() {
 function handleJump(e) {
     e.preventDefault();
     const id = parseInt(idInput.value);
-    if (id && id > 0) {
+    if (id && id >= minPokemonId && id <= maxPokemonId) {
         fetchPokemon(id);
     }
 }
 
 // --- Voting Logic ---
 
-async function handleVote(action) {
+// Swipes are queued and sent together to /api/votes/batch/
+const VOTE_FLUSH_SIZE = 5;
+const VOTE_FLUSH_DELAY = 3000;
+const VOTE_RETRY_MAX_DELAY = 60000;
+// Same as MAX_BATCH_VOTES in game/views.py
+const MAX_BATCH_VOTES = 200;
+let voteRetryDelay = VOTE_FLUSH_DELAY;
+let voteQueue = [];
+let voteFlushTimer = null;
+// Settles when the flush in progress (and any queued behind it) is done
+let voteFlush = Promise.resolve();
+
+function handleVote(action) {
     if (!currentPokemonId || !isLoggedIn || isVoteLoading) return;
 
     const voteId = currentPokemonId; // Lock the ID
@@ -257,38 +330,97 @@ async function handleVote(action) {
     if (action === 'smash') smashBtn.classList.add('active');
     else passBtn.classList.add('active');
 
-    try {
-        const response = await fetch(`/api/vote/${voteId}/`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ action })
-        });
+    // Optimistic cache update, the batch response fills in the real counts
+    if (dataCache[voteId]) {
+        dataCache[voteId].user_vote = action;
+    }
+    queueVote(voteId, action);
 
-        if (!response.ok) throw new Error('Vote failed');
+    // Auto-advance
+    setTimeout(() => {
+        handleNext();
+        isVoteLoading = false;
+    }, 200);
+}
 
-        const data = await response.json();
+function queueVote(pokemonId, action) {
+    voteQueue.push({ pokemon_id: pokemonId, action });
+
+    if (voteQueue.length >= VOTE_FLUSH_SIZE) {
+        flushVotes();
+    } else if (!voteFlushTimer) {
+        voteFlushTimer = setTimeout(flushVotes, VOTE_FLUSH_DELAY);
+    }
+}
 
-        // Update Cache with new vote status
-        if (dataCache[voteId]) {
-            dataCache[voteId].user_vote = action;
-            dataCache[voteId].smash_count = data.smash_count;
-            dataCache[voteId].pass_count = data.pass_count;
+function flushVotes(keepalive = false) {
+    clearTimeout(voteFlushTimer);
+    voteFlushTimer = null;
+    // One batch on the wire at a time: a flush asked for meanwhile runs after it,
+    // so batches reach the server in the order the votes were cast
+    voteFlush = voteFlush
+        .then(() => sendVotes(keepalive))
+        .catch(error => console.error('Vote error:', error));
+    return voteFlush;
+}
+
+async function sendVotes(keepalive) {
+    while (voteQueue.length > 0) {
+        // The server refuses batches over MAX_BATCH_VOTES; send the rest after this one
+        const votes = voteQueue.slice(0, MAX_BATCH_VOTES);
+        voteQueue = voteQueue.slice(MAX_BATCH_VOTES);
+
+        let response;
+        try {
+            response = await fetch('/api/votes/batch/', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ votes }),
+                keepalive
+            });
+        } catch (error) {
+            console.error('Vote error:', error);
+            retryVotes(votes);
+            return;
         }
 
-        // Auto-advance
-        setTimeout(() => {
-            handleNext();
-            isVoteLoading = false;
-        }, 200);
+        if (response.status >= 500) {
+            console.error('Vote error:', response.status);
+            retryVotes(votes);
+            return;
+        }
+        voteRetryDelay = VOTE_FLUSH_DELAY;
+        if (!response.ok) {
+            // Sending the same batch again would be refused the same way
+            console.error(`Dropped ${votes.length} votes the server refused (${response.status})`);
+            if (response.status === 401) {
+                isLoggedIn = false;
+                showLoginModal();
+            }
+            return;
+        }
 
-    } catch (error) {
-        console.error('Vote error:', error);
-        isVoteLoading = false;
-        // Optionally show toast or error indicator
-        resetCard();
+        const data = await response.json();
+
+        // Update Cache with the server's counts
+        for (const [id, counts] of Object.entries(data.counts)) {
+            if (dataCache[id]) {
+                dataCache[id].smash_count = counts.smash_count;
+                dataCache[id].pass_count = counts.pass_count;
+            }
+        }
     }
 }
 
+function retryVotes(votes) {
+    // Network or server trouble: put the votes back and try again later, backing off.
+    // A vote cast since on the same Pokémon is newer, so the old one is dropped
+    const newer = new Set(voteQueue.map(vote => vote.pokemon_id));
+    voteQueue = votes.filter(vote => !newer.has(vote.pokemon_id)).concat(voteQueue);
+    if (!voteFlushTimer) voteFlushTimer = setTimeout(flushVotes, voteRetryDelay);
+    voteRetryDelay = Math.min(voteRetryDelay * 2, VOTE_RETRY_MAX_DELAY);
+}
+
 // --- Gesture Logic (Pointer Events) ---
 
 let startX = 0;
@@ -361,7 +493,7 @@ function clearActiveStates() {
 // --- Event Listeners ---
 
 document.addEventListener('DOMContentLoaded', async () => {
-    const loggedIn = await checkLoginStatus();
+    const [loggedIn] = await Promise.all([checkLoginStatus(), loadBootstrap()]);
     if (loggedIn) {
         isLoggedIn = true;
 
@@ -377,6 +509,8 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 });
 
+window.addEventListener('pagehide', () => flushVotes(true));
+
 document.getElementById('login-form').addEventListener('submit', handleLogin);
 document.getElementById('logout-btn').addEventListener('click', handleLogout);
 
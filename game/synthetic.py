@@ -0,0 +1,59 @@
+import random
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Pokemon, Vote
+
+
+def make_roster(count, start=1):
+    """Bulk-create `count` placeholder Pokémon with consecutive pokeapi_ids; returns them by pokeapi_id."""
+    Pokemon.objects.bulk_create(
+        [
+            Pokemon(pokeapi_id=i, name=f'pokemon{i}', image_url=f'https://example.com/{i}.png')
+            for i in range(start, start + count)
+        ],
+        batch_size=1000,
+    )
+    return list(Pokemon.objects.filter(pokeapi_id__gte=start, pokeapi_id__lt=start + count).order_by('pokeapi_id'))
+
+
+def make_votes(pokemon, users, density=0.5, smash_rate=0.5, seed=0, batch_size=5000, prefix='user', progress=None):
+    """
+    Bulk-insert votes from `users` synthetic usernames (user0, user1, ...), each
+    voting on a random `density` share of `pokemon`. Counters are not touched;
+    run recalculate_stats afterwards if they matter. Deterministic for a seed.
+    `progress(created)` is called after each batch. Returns the number of votes
+    created.
+
+    Rows go through executemany() rather than bulk_create(): at tens of millions
+    of votes, building model instances and compiling the INSERTs costs several
+    times what SQLite spends storing them.
+    """
+    qn = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {qn(Vote._meta.db_table)} '
+        f'({qn("username")}, {qn("pokemon_id")}, {qn("smash")}, {qn("created_at")}) VALUES (%s, %s, %s, %s)'
+    )
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    rng = random.Random(seed)
+    per_user = round(len(pokemon) * density)
+    batch = []
+    created = 0
+
+    def insert():
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+    for u in range(users):
+        for p in rng.sample(pokemon, per_user):
+            batch.append((f'{prefix}{u}', p.pk, rng.random() < smash_rate, created_at))
+        if len(batch) >= batch_size:
+            insert()
+            created += len(batch)
+            batch = []
+            if progress:
+                progress(created)
+    if batch:
+        insert()
+    return created + len(batch)
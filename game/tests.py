@@ -1,3 +1,1159 @@
-from django.test import TestCase
+import csv
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module, reload
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+
+from . import export, images, metrics, urls, views, votelog
+from .bitmap import Bitmap
+from .cache import get_voted, user_key
+from .models import Pokemon, Vote
+from .pokeapi import API_URL, PokeApiClient
+from .roster import active_ids, active_ranges
+from .signals import vote_cast
+from .synthetic import make_roster, make_votes
+
+
+def login(client, username):
+    client.post('/api/login/', {'username': username}, content_type='application/json')
+
+
+def report(test, **seconds):
+    """
+    Print a benchmark's timings. They depend on the machine and its load, so
+    benchmarks assert query counts and plans and leave the clock to the reader.
+    """
+    timings = ', '.join(f'{name} {value * 1000:.3f}ms' for name, value in seconds.items())
+    sys.stderr.write(f'\n{test.id()}: {timings}\n')
+
+
+@contextmanager
+def async_views():
+    """Route the game endpoints to their async views, as pokesmash.asgi does."""
+    def reroute():
+        # The views are picked when the URLconf is imported
+        reload(urls)
+        reload(import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    try:
+        with override_settings(POKESMASH_ASYNC_VIEWS=True):
+            reroute()
+            yield
+    finally:
+        reroute()
+
+
+class VoteCounterSignalTests(TestCase):
+    def setUp(self):
+        self.pokemon = Pokemon.objects.create(pokeapi_id=1, name='Bulbasaur', image_url='https://example.com/1.png')
+
+    def assertCounts(self, smash_count, pass_count):
+        self.pokemon.refresh_from_db()
+        self.assertEqual((self.pokemon.smash_count, self.pokemon.pass_count), (smash_count, pass_count))
+
+    def test_new_votes_increment_counters(self):
+        Vote.objects.create(username='ash', pokemon=self.pokemon, smash=True)
+        Vote.objects.create(username='misty', pokemon=self.pokemon, smash=False)
+        self.assertCounts(1, 1)
+
+    def test_flip_moves_one_vote_between_counters(self):
+        vote = Vote.objects.create(username='ash', pokemon=self.pokemon, smash=True)
+        vote = Vote.objects.get(pk=vote.pk)
+        cast_at = vote.created_at
+        vote.smash = False
+        vote.save()
+        self.assertCounts(0, 1)
+        self.assertGreater(Vote.objects.get(pk=vote.pk).created_at, cast_at)
+
+    def test_unchanged_save_leaves_counters_alone(self):
+        vote = Vote.objects.create(username='ash', pokemon=self.pokemon, smash=True)
+        with self.assertNumQueries(1):
+            vote.save()
+        self.assertCounts(1, 0)
+
+    def test_delete_decrements_counter(self):
+        vote = Vote.objects.create(username='ash', pokemon=self.pokemon, smash=False)
+        Vote.objects.create(username='misty', pokemon=self.pokemon, smash=False)
+        vote.delete()
+        self.assertCounts(0, 1)
+
+    def test_votes_loaded_without_smash(self):
+        Vote.objects.create(username='ash', pokemon=self.pokemon, smash=True)
+        Vote.objects.create(username='misty', pokemon=self.pokemon, smash=True)
+
+        vote = Vote.objects.only('id', 'username', 'pokemon').get(username='ash')
+        vote.username = 'ash'
+        vote.save()
+        self.assertCounts(2, 0)
+
+        vote = Vote.objects.only('id', 'pokemon').get(username='ash')
+        vote.smash = False
+        vote.save()
+        self.assertCounts(1, 1)
+
+        Vote.objects.only('id', 'pokemon').get(username='misty').delete()
+        self.assertCounts(0, 1)
+
+
+class VoteEndpointTests(TestCase):
+    def setUp(self):
+        self.pokemon = Pokemon.objects.create(pokeapi_id=25, name='Pikachu', image_url='https://example.com/25.png')
+        login(self.client, 'ash')
+
+    def post_vote(self, pokemon_id, action):
+        return self.client.post(f'/api/vote/{pokemon_id}/', {'action': action}, content_type='application/json')
+
+    def test_vote_and_flip_return_new_counts(self):
+        self.assertEqual(self.post_vote(25, 'smash').json()['smash_count'], 1)
+        data = self.post_vote(25, 'pass').json()
+        self.assertEqual((data['smash_count'], data['pass_count']), (0, 1))
+        self.assertEqual(Vote.objects.get(username='ash', pokemon=self.pokemon).smash, False)
+
+    def test_repeated_vote_is_not_counted_twice(self):
+        self.post_vote(25, 'smash')
+        data = self.post_vote(25, 'smash').json()
+        self.assertEqual(data['message'], 'Vote already recorded')
+        self.assertEqual((data['smash_count'], data['pass_count']), (1, 0))
+
+    def test_unknown_pokemon_is_404(self):
+        self.assertEqual(self.post_vote(999, 'smash').status_code, 404)
+
+    def test_record_vote_query_count(self):
+        with self.assertNumQueries(2):
+            Vote.objects.record('ash', 25, True)
+        with self.assertNumQueries(2):
+            self.assertEqual(Vote.objects.record('ash', 25, False), (0, 1, True))
+
+
+class VoteBatchEndpointTests(TestCase):
+    def setUp(self):
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'Pokemon {pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+
+    def post_batch(self, votes):
+        return self.client.post('/api/votes/batch/', {'votes': votes}, content_type='application/json')
+
+    def test_batch_applies_latest_vote_per_pokemon(self):
+        response = self.post_batch([
+            {'pokemon_id': 1, 'action': 'smash'},
+            {'pokemon_id': 4, 'action': 'pass'},
+            {'pokemon_id': 1, 'action': 'pass'},
+            {'pokemon_id': 999, 'action': 'smash'},
+            {'pokemon_id': 7, 'action': 'maybe'},
+        ])
+        data = response.json()
+        self.assertEqual([r['status'] for r in data['results']], ['success', 'success', 'success', 'error', 'error'])
+        self.assertEqual(data['counts']['1'], {'smash_count': 0, 'pass_count': 1})
+        self.assertEqual(data['counts']['4'], {'smash_count': 0, 'pass_count': 1})
+        self.assertEqual(Vote.objects.filter(username='ash').count(), 2)
+        self.assertEqual(Pokemon.objects.get(pokeapi_id=1).pass_count, 1)
+
+    def test_batch_flip_of_existing_vote(self):
+        Vote.objects.record('ash', 7, True)
+        data = self.post_batch([{'pokemon_id': 7, 'action': 'pass'}]).json()
+        self.assertEqual(data['counts']['7'], {'smash_count': 0, 'pass_count': 1})
+
+    def test_batch_rejects_non_list(self):
+        self.assertEqual(self.post_batch('nope').status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        for pokeapi_id in (1, 4):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'Pokemon {pokeapi_id}', image_url='https://example.com/p.png')
+        Vote.objects.record('ash', 1, True)
+
+    def request(self, path, method='get', **kwargs):
+        request = getattr(RequestFactory(), method)(path, **kwargs)
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.session['username'] = 'ash'
+        return request
+
+    def test_sync_and_async_views_agree(self):
+        cases = [
+            (views.get_username, views.aget_username, '/api/username/', ()),
+            (views.get_starting_id, views.aget_starting_id, '/api/start/?before=4', ()),
+            (views.get_pokemon_by_id, views.aget_pokemon_by_id, '/api/pokemon/1/', (1,)),
+        ]
+        for sync_view, async_view, path, args in cases:
+            with self.subTest(path):
+                expected = json.loads(sync_view(self.request(path), *args).content)
+                self.assertEqual(json.loads(async_to_sync(async_view)(self.request(path), *args).content), expected)
+
+    def test_async_vote(self):
+        body = {'data': '{"action": "pass"}', 'content_type': 'application/json'}
+        response = async_to_sync(views.avote)(self.request('/api/vote/1/', 'post', **body), 1)
+        self.assertEqual(json.loads(response.content), {'status': 'success', 'smash_count': 0, 'pass_count': 1})
+        with self.assertRaises(Http404):
+            async_to_sync(views.avote)(self.request('/api/vote/999/', 'post', **body), 999)
+
+    def test_async_card_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = async_to_sync(views.aget_pokemon_by_id)(self.request('/api/pokemon/1/'), 1)
+        self.assertEqual(json.loads(response.content)['user_vote'], 'smash')
+
+    def test_sync_views_unless_asked(self):
+        self.assertIs(resolve('/api/username/').func, views.get_username)
+        with async_views():
+            self.assertIs(resolve('/api/username/').func, views.aget_username)
+        self.assertIs(resolve('/api/username/').func, views.get_username)
+
+    async def test_async_client_round_trip(self):
+        await self.async_client.post('/api/login/', {'username': 'ash'}, content_type='application/json')
+        response = await self.async_client.get('/api/start/')
+        self.assertEqual(response.json(), {'id': 4})
+
+
+def png_bytes(size=475):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new('RGBA', (size, size), (255, 0, 0, 255)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ImageStoreTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        store = override_settings(POKESMASH_IMAGES={'path': tmp.name, 'variants': {'thumb': 96, 'card': 475}})
+        store.enable()
+        self.addCleanup(store.disable)
+
+    def test_store_is_content_addressed(self):
+        digest = images.store_original(b'not really a png')
+        self.assertEqual(images.store_original(b'not really a png'), digest)
+        self.assertEqual(len(list(images.original_path(digest).parent.iterdir())), 1)
+
+    def test_cards_point_at_the_store_once_fetched(self):
+        Pokemon.objects.create(pokeapi_id=1, name='bulbasaur', image_url='https://example.com/1.png')
+        Pokemon.objects.create(pokeapi_id=4, name='charmander', image_url='https://example.com/4.png', image_hash='ab' * 32)
+        login(self.client, 'ash')
+        self.assertEqual(self.client.get('/api/pokemon/1/').json()['image_url'], 'https://example.com/1.png')
+        self.assertEqual(self.client.get('/api/pokemon/4/').json()['image_url'], f"/images/{'ab' * 32}/card")
+
+    @skipUnless(images.Image, 'Pillow is not installed')
+    def test_variants_are_negotiated_and_immutable(self):
+        from PIL import Image
+
+        original = png_bytes()
+        digest = images.store_original(original)
+        response = self.client.get(f'/images/{digest}/thumb', HTTP_ACCEPT='image/webp,image/png,*/*')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept', response['Vary'])
+        self.assertLess(len(body), len(original))
+
+        response = self.client.get(f'/images/{digest}/thumb.png')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (96, 96))
+        self.assertNotIn('Vary', response)
+
+    def test_unknown_images_are_404(self):
+        digest = images.store_original(b'x')
+        self.assertEqual(self.client.get(f"/images/{'0' * 64}/thumb").status_code, 404)
+        self.assertEqual(self.client.get(f'/images/{digest}/huge').status_code, 404)
+        self.assertEqual(self.client.get(f'/images/{digest}/thumb.gif').status_code, 404)
+        self.assertEqual(self.client.get('/images/../thumb').status_code, 404)
+
+
+class CrashAfterCommit(Exception):
+    pass
+
+
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        buffer = override_settings(POKESMASH_VOTE_BUFFER={'enabled': True, 'path': tmp.name, 'fsync': False})
+        buffer.enable()
+        self.addCleanup(buffer.disable)
+        # Buffered votes leave per-vote flags in the cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.log = votelog.get_vote_log()
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'Pokemon {pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+
+    def post_vote(self, pokemon_id, action):
+        return self.client.post(f'/api/vote/{pokemon_id}/', {'action': action}, content_type='application/json')
+
+    def assertCounts(self, pokeapi_id, smash_count, pass_count):
+        pokemon = Pokemon.objects.get(pokeapi_id=pokeapi_id)
+        self.assertEqual((pokemon.smash_count, pokemon.pass_count), (smash_count, pass_count))
+
+    def test_vote_is_acknowledged_before_it_is_written(self):
+        Vote.objects.record('ash', 1, False)
+        with self.assertNumQueries(1):
+            data = self.post_vote(1, 'smash').json()
+        self.assertEqual((data['smash_count'], data['pass_count']), (1, 0))
+        self.assertEqual(self.post_vote(999, 'smash').status_code, 404)
+        self.assertEqual(self.log.pending(), 1)
+        self.assertCounts(1, 0, 1)
+
+        out = StringIO()
+        call_command('flush_votes', stdout=out)
+        self.assertIn('Flushed 1 votes', out.getvalue())
+        self.assertCounts(1, 1, 0)
+        self.assertEqual(self.log.pending(), 0)
+        self.assertEqual(list(self.log.path.glob('votes-*')), [])
+
+    def test_start_skips_buffered_votes(self):
+        self.client.get('/api/start/')
+        self.client.post('/api/votes/batch/', {'votes': [{'pokemon_id': 1, 'action': 'pass'}]}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 4})
+
+    def test_interleaved_updates_keep_both_votes(self):
+        self.client.get('/api/start/')
+        backend = caches['default']
+        voted = user_key('game:voted', 'ash')
+
+        # While the flush of #1 touches ash's voted-set, a request buffers a vote
+        # on #4: what another process could do between a read and a write
+        def interleave(method):
+            def call(key, *args, **kwargs):
+                if key == voted and not interleave.done:
+                    interleave.done = True
+                    result = method(key, *args, **kwargs)
+                    votelog.buffer_votes('ash', [(4, True)])
+                    return result
+                return method(key, *args, **kwargs)
+            return call
+        interleave.done = False
+        for name in ('get', 'delete'):
+            setattr(backend, name, interleave(getattr(backend, name)))
+            self.addCleanup(delattr, backend, name)
+        Vote.objects.record_many('ash', [(1, True)])
+        self.assertTrue(interleave.done)
+
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 7})
+        votelog.buffer_votes('ash', [(7, False)])
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 1, 'all_voted': True})
+
+    def test_replaying_a_committed_batch_counts_nothing_twice(self):
+        class CrashingLog(votelog.VoteLog):
+            def _save_offset(self, segment, offset):
+                raise CrashAfterCommit
+
+        self.log.append('ash', [(1, True), (4, False), (1, False)])
+        self.log.append('misty', [(1, True)])
+        with self.assertRaises(CrashAfterCommit):
+            CrashingLog(self.log.path).flush()
+        self.assertCounts(1, 1, 1)
+
+        self.assertEqual(self.log.flush(), 4)
+        self.assertCounts(1, 1, 1)
+        self.assertCounts(4, 0, 1)
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_flush_resumes_after_the_last_committed_batch(self):
+        class FailingLog(votelog.VoteLog):
+            batches = 0
+
+            def _apply(self, entries):
+                FailingLog.batches += 1
+                if FailingLog.batches == 2:
+                    raise CrashAfterCommit
+                super()._apply(entries)
+
+        self.log.append('ash', [(1, True), (4, True), (7, True)])
+        with self.assertRaises(CrashAfterCommit):
+            FailingLog(self.log.path).flush(batch_size=2)
+        self.assertCounts(1, 1, 0)
+        self.assertCounts(7, 0, 0)
+        self.assertEqual(self.log.pending(), 1)
+
+        self.log.append('ash', [(7, False)])
+        self.assertEqual(self.log.flush(batch_size=2), 2)
+        self.assertCounts(7, 0, 1)
+        self.assertEqual(Vote.objects.filter(username='ash').count(), 3)
+
+    def test_torn_tail_is_ignored(self):
+        self.log.append('ash', [(1, True)])
+        with open(self.log.path / votelog.ACTIVE, 'ab') as f:
+            f.write(b'{"username":"ash","pokemon_id":4,"sm')
+        self.assertEqual(self.log.flush(), 1)
+        self.assertCounts(4, 0, 0)
+
+    def test_torn_write_followed_by_an_append(self):
+        self.log.append('ash', [(1, True)])
+        with open(self.log.path / votelog.ACTIVE, 'ab') as f:
+            f.write(b'{"username":"ash","pokemon_id":4,"sm')
+        self.log.append('ash', [(7, True)])
+        with self.assertLogs('pokesmash.votelog', 'WARNING') as logs:
+            self.assertEqual(self.log.flush(), 2)
+        self.assertIn('undecodable vote log line', logs.output[0])
+        self.assertCounts(1, 1, 0)
+        self.assertCounts(7, 1, 0)
+        self.assertEqual((self.log.path / votelog.REJECTED).read_bytes(), b'{"username":"ash","pokemon_id":4,"sm\n')
+        self.assertEqual(self.log.pending(), 0)
+
+
+class BitmapTests(SimpleTestCase):
+    def test_first_next_previous(self):
+        bitmap = Bitmap.from_ids([3, 64, 65, 1025])
+        self.assertEqual(bitmap.first(), 3)
+        self.assertEqual(bitmap.next_after(3), 64)
+        self.assertEqual(bitmap.next_after(65), 1025)
+        self.assertIsNone(bitmap.next_after(1025))
+        self.assertEqual(bitmap.previous_before(64), 3)
+        self.assertIsNone(bitmap.previous_before(3))
+        self.assertEqual(len(bitmap), 4)
+
+    def test_difference_and_bytes_round_trip(self):
+        unvoted = Bitmap.from_ids(range(1, 1026)) - Bitmap.from_ids(range(1, 500))
+        self.assertEqual(unvoted.first(), 500)
+        self.assertEqual(Bitmap.from_bytes(unvoted.to_bytes()), unvoted)
+
+
+@override_settings(POKESMASH_ROSTER={'generations': range(1, 10)})
+class StartingIdTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Created out of order so primary keys and pokeapi_ids disagree
+        for pokeapi_id in (500, 3, 2, 1):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'Pokemon {pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+
+    def test_first_unvoted_uses_pokeapi_ids(self):
+        Vote.objects.record('ash', 1, True)
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 2})
+
+    def test_voted_set_follows_vote_writes(self):
+        self.assertEqual(self.client.get('/api/start/').json()['id'], 1)
+        Vote.objects.record('ash', 1, True)
+        Vote.objects.record_many('ash', [(2, False), (3, True)])
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 500})
+
+    def test_next_and_previous_unvoted(self):
+        Vote.objects.record('ash', 2, True)
+        self.assertEqual(self.client.get('/api/start/?after=1').json(), {'id': 3})
+        self.assertEqual(self.client.get('/api/start/?before=3').json(), {'id': 1})
+        self.assertEqual(self.client.get('/api/start/?after=500').status_code, 404)
+
+    def test_all_voted(self):
+        Vote.objects.record_many('ash', [(1, True), (2, True), (3, False), (500, False)])
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 1, 'all_voted': True})
+
+
+class ManifestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        Pokemon.objects.create(pokeapi_id=4, name='Charmander', image_url='https://example.com/4.png',
+                               evolution_stage='FIRST', shape='upright', color='red', generation='generation-i')
+        Pokemon.objects.create(pokeapi_id=1, name='Bulbasaur', image_url='https://example.com/1.png')
+
+    def test_manifest_rows_and_revalidation(self):
+        response = self.client.get('/api/pokemon/manifest/')
+        data = response.json()
+        self.assertEqual(data['fields'][:2], ['id', 'name'])
+        self.assertEqual([row[0] for row in data['pokemon']], [1, 4])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get('/api/pokemon/manifest/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_roster_change_changes_etag(self):
+        etag = self.client.get('/api/pokemon/manifest/')['ETag']
+        Pokemon.objects.filter(pokeapi_id=1).get().delete()
+        response = self.client.get('/api/pokemon/manifest/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class PokemonRangeTests(TestCase):
+    def setUp(self):
+        for pokeapi_id in range(1, 121):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'pokemon{pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+
+    def get_range(self, first, last):
+        response = self.client.get(f'/api/pokemon/?from={first}&to={last}')
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_window_with_user_votes(self):
+        Vote.objects.record('ash', 3, False)
+        Vote.objects.record('misty', 3, True)
+        _, data = self.get_range(2, 4)
+        self.assertEqual([card['id'] for card in data['pokemon']], [2, 3, 4])
+        self.assertEqual(data['pokemon'][1], {
+            'id': 3, 'name': 'Pokemon3', 'image_url': 'https://example.com/p.png',
+            'smash_count': 1, 'pass_count': 1, 'user_vote': 'pass',
+        })
+
+    def test_live_fields_leave_out_the_manifest_part(self):
+        Vote.objects.record('ash', 3, False)
+        Vote.objects.record('misty', 2, True)
+        response = self.client.get('/api/pokemon/?from=2&to=3&fields=live')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['pokemon'], [
+            {'id': 2, 'smash_count': 1, 'pass_count': 0, 'user_vote': None},
+            {'id': 3, 'smash_count': 0, 'pass_count': 1, 'user_vote': 'pass'},
+        ])
+
+    def test_large_window_uses_two_queries(self):
+        response = self.client.get('/api/pokemon/?from=1&to=120')
+        # The session lookup happens in the view; the streamed body runs the rest
+        with self.assertNumQueries(2):
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['pokemon']), 120)
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.post('/api/login/', {'username': 'ash'}, content_type='application/json')
+        response = await self.async_client.get('/api/pokemon/?from=1&to=3')
+        # An async body: a sync one would be drained before the first byte went out
+        self.assertTrue(response.is_async)
+        data = json.loads(''.join([chunk.decode() async for chunk in response.streaming_content]))
+        self.assertEqual([p['id'] for p in data['pokemon']], [1, 2, 3])
+
+    def test_invalid_range(self):
+        self.assertEqual(self.client.get('/api/pokemon/?from=5&to=1').status_code, 400)
+        self.assertEqual(self.client.get('/api/pokemon/?from=a&to=1').status_code, 400)
+
+
+def write_pokeapi_fixtures(cache_dir, names):
+    """Minimal PokéAPI responses for a single evolution chain of `names`, ids from 1."""
+    client = PokeApiClient(cache_dir=cache_dir, offline=True)
+    chain_url = f'{API_URL}/evolution-chain/1/'
+    chain = {'species': {'name': names[-1]}, 'evolves_to': []}
+    for name in reversed(names[:-1]):
+        chain = {'species': {'name': name}, 'evolves_to': [chain]}
+    client.store(chain_url, {'chain': chain})
+    for pokeapi_id, name in enumerate(names, start=1):
+        species_url = f'{API_URL}/pokemon-species/{pokeapi_id}/'
+        client.store(f'{API_URL}/pokemon/{pokeapi_id}', {
+            'name': name,
+            'species': {'url': species_url},
+            'sprites': {'other': {'official-artwork': {'front_default': f'https://example.com/{pokeapi_id}.png'}}},
+        })
+        client.store(species_url, {
+            'name': name,
+            'shape': {'name': 'quadruped'},
+            'color': {'name': 'green'},
+            'generation': {'name': 'generation-i'},
+            'evolution_chain': {'url': chain_url},
+        })
+
+
+class SeedPokemonTests(TestCase):
+    def test_seed_replays_fixture_directory_offline(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            write_pokeapi_fixtures(cache_dir, ['bulbasaur', 'ivysaur', 'venusaur'])
+            out = StringIO()
+            call_command('seed_pokemon', cache_dir=cache_dir, offline=True, workers=4, stdout=out)
+
+        stages = dict(Pokemon.objects.values_list('name', 'evolution_stage'))
+        self.assertEqual(stages, {'Bulbasaur': 'FIRST', 'Ivysaur': 'MIDDLE', 'Venusaur': 'LAST'})
+        # Later members of a chain get their own species metadata too
+        self.assertEqual(Pokemon.objects.get(pokeapi_id=3).shape, 'quadruped')
+        self.assertIn('0 network requests', out.getvalue())
+        self.assertIn('3 inserted, 0 updated, 0 unchanged', out.getvalue())
+
+    def test_reseed_only_writes_changed_rows(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            write_pokeapi_fixtures(cache_dir, ['bulbasaur', 'ivysaur'])
+            call_command('seed_pokemon', cache_dir=cache_dir, offline=True, stdout=StringIO())
+            Vote.objects.record('ash', 1, True)
+
+            client = PokeApiClient(cache_dir=cache_dir, offline=True)
+            species_url = f'{API_URL}/pokemon-species/2/'
+            client.store(species_url, {**client.get(species_url), 'color': {'name': 'blue'}})
+
+            out = StringIO()
+            call_command('seed_pokemon', cache_dir=cache_dir, offline=True, stdout=out)
+
+        self.assertIn('0 inserted, 1 updated, 1 unchanged', out.getvalue())
+        self.assertEqual(Pokemon.objects.get(pokeapi_id=2).color, 'blue')
+        # Seeding never resets vote counters
+        self.assertEqual(Pokemon.objects.get(pokeapi_id=1).smash_count, 1)
+
+    def test_chain_fetched_once_across_species(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            write_pokeapi_fixtures(cache_dir, ['bulbasaur', 'ivysaur'])
+            client = PokeApiClient(cache_dir=cache_dir, offline=True)
+            url = f'{API_URL}/evolution-chain/1/'
+            self.assertIs(client.get(url, memoize=True), client.get(url, memoize=True))
+
+
+class RosterConfigTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @override_settings(POKESMASH_ROSTER={'generations': [2, 1], 'ranges': [(250, 260)]})
+    def test_generations_and_ranges_merge(self):
+        self.assertEqual(active_ranges(), [(1, 260)])
+        self.assertEqual(len(active_ids()), 260)
+
+    @override_settings(POKESMASH_ROSTER={'generations': [1]})
+    def test_start_and_bootstrap_follow_the_roster(self):
+        for pokeapi_id in (151, 152):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'pokemon{pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+        Vote.objects.record('ash', 151, True)
+
+        # 152 is seeded but outside the active roster
+        self.assertEqual(self.client.get('/api/start/').json()['all_voted'], True)
+        roster = self.client.get('/api/bootstrap/').json()['roster']
+        self.assertEqual(roster, {'ranges': [[1, 151]], 'min_id': 1, 'max_id': 151, 'seeded': 1})
+
+
+@tag('benchmark')
+@override_settings(POKESMASH_ROSTER={'generations': range(1, 10)})
+class FullDexLoadBenchmark(TestCase):
+    """The read and vote paths should stay at fixed query counts with a full 1025-Pokémon dex."""
+
+    USERS = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        Pokemon.objects.bulk_create([
+            Pokemon(pokeapi_id=i, name=f'pokemon{i}', image_url='https://example.com/p.png') for i in range(1, 1026)
+        ])
+        pokemon = list(Pokemon.objects.order_by('pokeapi_id'))
+        # Every user has voted on all but the last Pokémon: ~100k votes
+        Vote.objects.bulk_create(
+            [Vote(username=f'user{u}', pokemon=p, smash=(u + p.pokeapi_id) % 2 == 0) for u in range(cls.USERS) for p in pokemon[:-1]],
+            batch_size=5000,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        login(self.client, 'user0')
+
+    def test_start_and_vote_at_full_dex(self):
+        start = time.perf_counter()
+        self.assertEqual(self.client.get('/api/start/').json(), {'id': 1025})
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(50):
+            # Warm: the session is a signed cookie and the bitmaps come from the cache
+            with self.assertNumQueries(0):
+                self.client.get('/api/start/?after=1')
+        warm = (time.perf_counter() - start) / 50
+
+        start = time.perf_counter()
+        for i in range(1, 51):
+            # Flips every vote: user0 smashed the even ids
+            with self.assertNumQueries(2):
+                Vote.objects.record('user0', i, i % 2 == 1)
+        vote = (time.perf_counter() - start) / 50
+
+        report(self, cold_start=cold, warm_start=warm, vote=vote)
+        self.assertEqual(self.client.get('/api/bootstrap/').json()['roster']['seeded'], 1025)
+
+
+class SessionTests(TestCase):
+    def test_login_round_trip_without_session_rows(self):
+        login(self.client, 'ash')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/username/').json()['username'], 'ash')
+        self.client.post('/api/logout/')
+        self.assertEqual(self.client.get('/api/username/').status_code, 401)
+        self.assertFalse(Session.objects.exists())
+
+    def test_tampered_cookie_is_logged_out(self):
+        login(self.client, 'ash')
+        signed = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        # Flip the last character of the signature
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = signed[:-1] + ('A' if signed[-1] != 'A' else 'B')
+        self.assertEqual(self.client.get('/api/username/').status_code, 401)
+
+    def test_cleanup_sessions(self):
+        db = SessionStore()
+        db['username'] = 'ash'
+        db.create()
+        out = StringIO()
+        call_command('cleanup_sessions', '--dry-run', stdout=out)
+        self.assertIn('1 stale sessions would be deleted', out.getvalue())
+        call_command('cleanup_sessions', stdout=StringIO())
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cleanup_keeps_live_cached_db_sessions(self):
+        live = SessionStore()
+        live.create()
+        expired = SessionStore()
+        expired.set_expiry(-1)
+        expired.create()
+        call_command('cleanup_sessions', stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live.session_key])
+
+
+@tag('benchmark')
+class SessionQueryBenchmark(TestCase):
+    """With signed-cookie sessions a game API call runs only the queries its view needs."""
+
+    REQUESTS = [
+        ('get', '/api/username/'),
+        ('get', '/api/start/'),
+        ('get', '/api/pokemon/1/'),
+        ('post', '/api/vote/4/'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        make_roster(151)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def query_counts(self, username):
+        cache.clear()
+        client = Client()
+        login(client, username)
+        counts = {}
+        for method, url in self.REQUESTS:
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'post':
+                    response = client.post(url, {'action': 'smash'}, content_type='application/json')
+                else:
+                    response = client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = [query['sql'] for query in queries]
+        return counts
+
+    def test_session_lookup_is_gone(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            before = self.query_counts('ash')
+        after = self.query_counts('misty')
+        for _, url in self.REQUESTS:
+            self.assertEqual(len(after[url]), len(before[url]) - 1, url)
+            self.assertFalse([sql for sql in after[url] if 'django_session' in sql], url)
+
+
+class SqlitePragmaTests(TestCase):
+    def test_pragmas_applied_to_each_connection(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+
+@tag('benchmark')
+class VoteWriteConcurrencyBenchmark(SimpleTestCase):
+    """Concurrent writers (with readers alongside) on a file database, default vs configured options."""
+
+    # The command's threads connect to their own scratch file, never the test database
+    databases = {'default'}
+
+    def test_tuned_connections_keep_up(self):
+        from .management.commands.stress_votes import Command
+
+        command = Command(stdout=StringIO())
+        receivers = list(vote_cast.receivers)
+        # A voted-set the scratch votes would extend if they reached this cache
+        voted = user_key('game:voted', 'stress0')
+        cache.set(voted, Bitmap().bits)
+        self.addCleanup(cache.delete, voted)
+        call_command(command, writers=4, readers=2, votes=50, pokemon=20)
+        baseline, tuned = command.results['baseline'], command.results['tuned']
+        self.assertEqual(vote_cast.receivers, receivers)
+        self.assertEqual(cache.get(voted), Bitmap().bits)
+        self.assertEqual((tuned['votes'], tuned['locked']), (200, 0))
+        self.assertGreater(tuned['reads'], 0)
+        # Throughput at this size is too noisy to compare; the command output reports it
+        self.assertEqual(baseline['votes'] + baseline['locked'], 200)
+
+
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'Pokemon {pokeapi_id}', image_url='https://example.com/p.png')
+        login(self.client, 'ash')
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_latency_and_queries_per_view(self):
+        with async_views():
+            self.client.get('/api/pokemon/1/')
+            self.client.get('/api/pokemon/4/')
+        text = self.scrape()
+        self.assertIn('pokesmash_requests_total{view="get_pokemon",method="GET",status="200"} 2', text)
+        self.assertIn('pokesmash_request_duration_seconds_count{view="get_pokemon",method="GET"} 2', text)
+        self.assertIn('pokesmash_request_duration_seconds_bucket{view="get_pokemon",method="GET",le="+Inf"} 2', text)
+        # Counted inside the async view's sync_to_async hop too: one query per card
+        self.assertIn('pokesmash_request_queries_sum{view="get_pokemon"} 2', text)
+
+    @override_settings(POKESMASH_METRICS={'duplicate_query_threshold': 3})
+    def test_repeated_statements_are_flagged(self):
+        votes = [{'pokemon_id': i, 'action': 'smash'} for i in (1, 4, 7)]
+        with self.assertLogs('pokesmash.performance', 'WARNING') as logs:
+            self.client.post('/api/votes/batch/', {'votes': votes}, content_type='application/json')
+        self.assertIn('Possible N+1 in POST /api/votes/batch/ (vote_batch): 3 executions of UPDATE', logs.output[0])
+        text = self.scrape()
+        self.assertIn('pokesmash_n_plus_one_requests_total{view="vote_batch"} 1', text)
+        self.assertIn('pokesmash_duplicate_queries_total{view="vote_batch"} 2', text)
+
+    @override_settings(POKESMASH_METRICS={'slow_request_ms': 0})
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('pokesmash.performance', 'WARNING') as logs:
+            self.client.get('/api/start/')
+        self.assertIn('Slow request: GET /api/start/ (get_starting_id)', logs.output[0])
+
+    def test_endpoint_is_local_only(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 404)
+
+
+@tag('benchmark')
+class PerformanceMiddlewareOverheadBenchmark(SimpleTestCase):
+    def test_overhead_per_request(self):
+        request = RequestFactory().get('/api/start/')
+        middleware = metrics.PerformanceMiddleware(lambda request: HttpResponse())
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+        start = time.perf_counter()
+        for _ in range(10000):
+            middleware(request)
+        per_request = (time.perf_counter() - start) / 10000
+        report(self, per_request=per_request)
+        self.assertIn('pokesmash_requests_total{view="<unmatched>",method="GET",status="200"} 10000', metrics.registry.render())
+
+
+class RecalculateStatsTests(TestCase):
+    def setUp(self):
+        for pokeapi_id in (1, 4, 7):
+            Pokemon.objects.create(pokeapi_id=pokeapi_id, name=f'pokemon{pokeapi_id}', image_url='https://example.com/p.png')
+        Vote.objects.record_many('ash', [(1, True), (4, False)])
+        Vote.objects.record('misty', 1, True)
+        # Simulate drift
+        Pokemon.objects.filter(pokeapi_id__in=[1, 7]).update(smash_count=9)
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_file = f'{state_dir.name}/state.json'
+
+    def recalculate(self, *args):
+        out = StringIO()
+        call_command('recalculate_stats', *args, state_file=self.state_file, stdout=out)
+        return out.getvalue()
+
+    def counts(self):
+        return dict((i, (s, p)) for i, s, p in Pokemon.objects.values_list('pokeapi_id', 'smash_count', 'pass_count'))
+
+    def test_dry_run_reports_drift_only(self):
+        out = self.recalculate('--dry-run')
+        self.assertIn('#1 pokemon1: stored 9/0, actual 2/0', out)
+        self.assertIn('#7 pokemon7: stored 9/0, actual 0/0', out)
+        self.assertIn('2 of 3 Pokemon have drifted', out)
+        self.assertEqual(self.counts()[1], (9, 0))
+
+    def test_fix_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.recalculate('--chunk-size', '2')
+        statements = [q['sql'] for q in ctx.captured_queries]
+        # One aggregate and one bulk UPDATE per chunk, never per Pokemon
+        self.assertEqual(sum('GROUP BY' in sql for sql in statements), 2)
+        self.assertEqual(sum(sql.startswith('UPDATE') for sql in statements), 2)
+        self.assertEqual(self.counts(), {1: (2, 0), 4: (0, 1), 7: (0, 0)})
+
+    def test_since_last_run_only_touches_newer_votes(self):
+        self.recalculate()
+        Pokemon.objects.filter(pokeapi_id__in=[4, 7]).update(pass_count=5)
+        Vote.objects.record('brock', 7, False)
+
+        out = self.recalculate('--since')
+        self.assertIn('Processed 1/1', out)
+        # 4 has drifted too, but has no new votes
+        self.assertEqual(self.counts(), {1: (2, 0), 4: (0, 5), 7: (0, 1)})
+
+
+class VoteExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_roster(3)
+        base = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        for minute, (username, pokeapi_id, smash) in enumerate([
+            ('ash', 1, True), ('misty', 1, False), ('ash', 2, False), ('brock', 3, True), ('misty, "the" gym', 2, True),
+        ]):
+            Vote.objects.record(username, pokeapi_id, smash)
+            Vote.objects.filter(username=username, pokemon__pokeapi_id=pokeapi_id).update(created_at=base + timedelta(minutes=minute))
+        cls.rows = list(export.vote_rows())
+        cls.staff = User.objects.create_user('admin', is_staff=True)
+
+    def download(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/votes/export/', params)
+        return response, b''.join(response.streaming_content)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/votes/export/').status_code, 302)
+
+    def test_csv(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual(lines[0], list(export.FIELDS))
+        self.assertEqual(lines[5][1:4], ['misty, "the" gym', '2', '1'])
+        self.assertEqual([int(line[0]) for line in lines[1:]], [row[0] for row in self.rows])
+
+    def test_ndjson(self):
+        _, body = self.download(format='ndjson', username=['ash', 'brock'])
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([(r['username'], r['pokemon_id'], r['smash']) for r in records], [('ash', 1, True), ('ash', 2, False), ('brock', 3, True)])
+        self.assertEqual(records[0]['created_at'], '2026-01-01T00:00:00+00:00')
+
+    def test_columnar_round_trip(self):
+        _, body = self.download(format='columnar')
+        self.assertEqual(list(export.read_columnar(BytesIO(body))), self.rows)
+        # Several blocks, and a cut-off last block is reported
+        base = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        rows = [(i * 3, f'user{i % 7}', i % 1025 + 1, i % 3 == 0, base + timedelta(seconds=i)) for i in range(export.BLOCK_ROWS + 5)]
+        data = b''.join(export.columnar_chunks(rows))
+        self.assertEqual(list(export.read_columnar(BytesIO(data))), rows)
+        with self.assertRaisesMessage(ValueError, 'truncated'):
+            list(export.read_columnar(BytesIO(data[:-10])))
+
+    def test_time_window_and_cursor(self):
+        _, body = self.download(format='ndjson', since='2026-01-01T00:01:00', until='2026-01-01T00:04:00Z')
+        self.assertEqual(len(body.splitlines()), 3)
+        cursor = export.make_cursor(self.rows[2][4], self.rows[2][0])
+        _, body = self.download(after=cursor)
+        self.assertEqual([int(line.split(',')[0]) for line in body.decode().splitlines()], [row[0] for row in self.rows[3:]])
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/api/votes/export/', {'after': 'yesterday'}).status_code, 400)
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get('/api/votes/export/', {'format': 'columnar'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(list(export.read_columnar(BytesIO(body))), self.rows)
+
+    def test_command_resumes_after_interruption(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'votes.csv'
+            call_command('export_votes', output=str(path), stdout=StringIO())
+            complete = path.read_bytes()
+            self.assertFalse(path.with_name('votes.csv.cursor').exists())
+
+            # As left by a crash: two rows checkpointed, a torn third row after them
+            lines = complete.splitlines(keepends=True)
+            path.write_bytes(b''.join(lines[:3]) + lines[3][:5])
+            path.with_name('votes.csv.cursor').write_text(json.dumps({
+                'cursor': export.make_cursor(self.rows[1][4], self.rows[1][0]),
+                'offset': len(b''.join(lines[:3])),
+                'options': {'format': 'csv', 'since': None, 'until': None, 'username': None},
+            }))
+            out = StringIO()
+            call_command('export_votes', output=str(path), resume=True, stdout=out)
+            self.assertEqual(path.read_bytes(), complete)
+            self.assertIn(f'--after {export.make_cursor(self.rows[-1][4], self.rows[-1][0])}', out.getvalue())
+
+
+class ImportVotesTests(TestCase):
+    def setUp(self):
+        make_roster(3)
+        self.base = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        for username, pokeapi_id, smash, minute in [('ash', 1, True, 2), ('misty', 2, False, 1)]:
+            Vote.objects.record(username, pokeapi_id, smash)
+            Vote.objects.filter(username=username, pokemon__pokeapi_id=pokeapi_id).update(created_at=self.at(minute))
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.dir = Path(state_dir.name)
+        # recalculate_stats keeps its state file under BASE_DIR
+        self.enterContext(override_settings(BASE_DIR=self.dir))
+
+    def at(self, minute):
+        return self.base + timedelta(minutes=minute)
+
+    def run_import(self, fmt, rows):
+        path = self.dir / f'votes.{fmt}'
+        path.write_bytes(b''.join(export.encode(fmt, rows)))
+        out = StringIO()
+        call_command('import_votes', str(path), batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def votes(self):
+        return {(u, p): (s, c) for u, p, s, c in Vote.objects.values_list('username', 'pokemon__pokeapi_id', 'smash', 'created_at')}
+
+    def test_latest_vote_wins(self):
+        rows = [
+            (10, 'ash', 1, False, self.at(1)),  # older than the local smash
+            (11, 'misty', 2, True, self.at(3)),  # newer than the local pass
+            (12, 'brock', 3, True, self.at(1)),
+            (13, 'brock', 3, False, self.at(0)),  # older duplicate within the file
+            (14, 'brock', 999, True, self.at(1)),
+        ]
+        for fmt in export.FORMATS:
+            with self.subTest(fmt), transaction.atomic():
+                out = self.run_import(fmt, rows)
+                self.assertIn('Imported 5 votes: 1 new, 1 replaced an older vote, 2 kept the local vote', out)
+                self.assertIn('Skipped 1 votes on Pokemon missing here (#999)', out)
+                self.assertEqual(self.votes(), {
+                    ('ash', 1): (True, self.at(2)),
+                    ('misty', 2): (True, self.at(3)),
+                    ('brock', 3): (True, self.at(1)),
+                })
+                counts = list(Pokemon.objects.order_by('pokeapi_id').values_list('smash_count', 'pass_count'))
+                self.assertEqual(counts, [(1, 0), (1, 0), (1, 0)])
+                transaction.set_rollback(True)
+
+    def test_a_local_flip_beats_an_older_import(self):
+        # misty flips her pass after another instance exported its copy of the vote
+        Vote.objects.record('misty', 2, True)
+        flipped_at = Vote.objects.get(username='misty').created_at
+        self.assertGreater(flipped_at, self.at(3))
+        # An incremental export from after ash's vote picks the flip up
+        after = (self.at(2), Vote.objects.get(username='ash').pk)
+        self.assertEqual([row[1] for row in export.vote_rows(after=after)], ['misty'])
+
+        out = self.run_import('csv', [(1, 'misty', 2, False, self.at(3))])
+        self.assertIn('0 replaced an older vote, 1 kept the local vote', out)
+        self.assertEqual(self.votes()[('misty', 2)], (True, flipped_at))
+
+    def test_reimport_changes_nothing(self):
+        rows = [(1, 'brock', 3, True, self.at(5)), (2, 'misty', 2, True, self.at(5))]
+        self.run_import('ndjson', rows)
+        with CaptureQueriesContext(connection) as ctx:
+            out = self.run_import('ndjson', rows)
+        self.assertIn('0 new, 0 replaced an older vote, 2 kept the local vote', out)
+        # Nothing written, so no recount either
+        self.assertFalse([q for q in ctx.captured_queries if 'GROUP BY' in q['sql']])
+
+    def test_drops_per_user_caches(self):
+        self.assertNotIn(3, get_voted('brock'))
+        self.run_import('csv', [(1, 'brock', 3, True, self.at(5))])
+        self.assertIn(3, get_voted('brock'))
+
+    def test_truncated_file(self):
+        path = self.dir / 'votes.columnar'
+        path.write_bytes(b''.join(export.encode('columnar', [(1, 'brock', 3, True, self.at(5))]))[:-3])
+        with self.assertRaisesMessage(CommandError, 'Invalid columnar export after 0 votes'):
+            call_command('import_votes', str(path), stdout=StringIO())
+
+
+class GenerateVotesTests(TestCase):
+    def setUp(self):
+        make_roster(3)
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        # recalculate_stats keeps its state file under BASE_DIR
+        self.enterContext(override_settings(BASE_DIR=Path(state_dir.name)))
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_votes', stdout=out, **options)
+        return out.getvalue()
+
+    def test_fills_roster_and_counters(self):
+        out = self.generate(users=10, pokemon=6, density=0.5, batch_size=7)
+        self.assertIn('Created 3 placeholder Pokemon', out)
+        self.assertIn('Created 30 votes', out)
+        self.assertEqual(list(Pokemon.objects.values_list('pokeapi_id', flat=True).order_by('pokeapi_id')), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(Vote.objects.filter(username='user9').count(), 3)
+        actual = Counter(Vote.objects.values_list('pokemon__pokeapi_id', 'smash'))
+        for p in Pokemon.objects.all():
+            self.assertEqual((p.smash_count, p.pass_count), (actual[p.pokeapi_id, True], actual[p.pokeapi_id, False]))
+
+    def test_deterministic_for_seed(self):
+        self.generate(users=4, pokemon=3, density=0.67, seed=5)
+        self.generate(users=4, pokemon=3, density=0.67, seed=5, prefix='again')
+        first = sorted((u[4:], p, s) for u, p, s in Vote.objects.filter(username__startswith='user').values_list('username', 'pokemon_id', 'smash'))
+        again = sorted((u[5:], p, s) for u, p, s in Vote.objects.filter(username__startswith='again').values_list('username', 'pokemon_id', 'smash'))
+        self.assertEqual(first, again)
+
+    def test_refuses_existing_prefix(self):
+        self.generate(users=1, pokemon=3)
+        with self.assertRaisesMessage(CommandError, 'already exist'):
+            self.generate(users=1, pokemon=3)
+
+
+@tag('benchmark')
+class BenchmarkSuiteTests(TestCase):
+    """run_benchmarks through the test client on a small generated dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        make_votes(make_roster(30), users=5)
+
+    def test_writes_json_report(self):
+        from .management.commands.run_benchmarks import ENDPOINTS
+
+        counters = list(Pokemon.objects.values_list('smash_count', 'pass_count'))
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'results.json'
+            call_command('run_benchmarks', requests=5, warmup=1, output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+
+        self.assertEqual(report['dataset'], {'pokemon': 30, 'users': 5, 'votes': 75})
+        self.assertEqual(set(report['results']['client']), set(ENDPOINTS))
+        for endpoint, result in report['results']['client'].items():
+            self.assertEqual((result['requests'], result['errors']), (5, 0), endpoint)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreaterEqual(result['queries_max'], result['queries_mean'])
+        self.assertGreater(report['results']['client']['vote']['queries_mean'], 0)
+        # The benchmark user's votes are removed along with their counts
+        self.assertFalse(Vote.objects.filter(username='benchmark').exists())
+        self.assertEqual(list(Pokemon.objects.values_list('smash_count', 'pass_count')), counters)
+
+
+class VoteIndexPlanTests(TestCase):
+    """EXPLAIN the hot Vote queries and check the planner picks the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        pokemon = make_roster(151)
+        make_votes(pokemon, users=60, density=0.6)
+        cls.pokemon = pokemon[0]
+
+    def assertUsesIndex(self, queryset, index_name):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables make a sequential scan look cheapest
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_counts_per_pokemon(self):
+        self.assertUsesIndex(Vote.objects.filter(pokemon=self.pokemon, smash=True).values('id')[:1], 'vote_pokemon_smash_user_idx')
+
+    def test_recalculate_aggregate(self):
+        rows = Vote.objects.filter(pokemon_id__in=[self.pokemon.pk]).values_list('pokemon_id', 'smash').annotate(count=Count('id')).order_by()
+        self.assertUsesIndex(rows, 'vote_pokemon_smash_user_idx')
+
+    def test_voter_page(self):
+        page = Vote.objects.filter(pokemon=self.pokemon, smash=False, username__gt='user1').order_by('username').values_list('username')
+        self.assertUsesIndex(page, 'vote_pokemon_smash_user_idx')
+
+    def test_top_smasher(self):
+        top = Vote.objects.filter(smash=True).values('username').annotate(count=Count('id')).order_by('-count')[:1]
+        self.assertUsesIndex(top, 'vote_username_smash_idx')
@@ -1,12 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import metrics, views
+
+
+def pick(sync_view, async_view):
+    return async_view if settings.POKESMASH_ASYNC_VIEWS else sync_view
+
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/login/', views.login_view, name='login'),
     path('api/logout/', views.logout_view, name='logout'),
-    path('api/username/', views.get_username, name='get_username'),
-    path('api/pokemon/<int:pokemon_id>/', views.get_pokemon_by_id, name='get_pokemon'),
-    path('api/start/', views.get_starting_id, name='get_starting_id'),
-    path('api/vote/<int:pokemon_id>/', views.vote, name='vote'),
+    path('api/username/', pick(views.get_username, views.aget_username), name='get_username'),
+    path('api/pokemon/', views.get_pokemon_range, name='get_pokemon_range'),
+    path('api/pokemon/manifest/', views.pokemon_manifest, name='pokemon_manifest'),
+    path('api/pokemon/<int:pokemon_id>/', pick(views.get_pokemon_by_id, views.aget_pokemon_by_id), name='get_pokemon'),
+    path('images/<str:digest>/<slug:variant>', views.pokemon_image, name='pokemon_image'),
+    path('images/<str:digest>/<slug:variant>.<slug:fmt>', views.pokemon_image, name='pokemon_image_format'),
+    path('api/bootstrap/', views.bootstrap, name='bootstrap'),
+    path('api/cache/stats/', views.get_cache_stats, name='cache_stats'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    path('api/start/', pick(views.get_starting_id, views.aget_starting_id), name='get_starting_id'),
+    path('api/vote/<int:pokemon_id>/', pick(views.vote, views.avote), name='vote'),
+    path('api/votes/batch/', views.vote_batch, name='vote_batch'),
+    path('api/votes/export/', views.export_votes, name='export_votes'),
 ]
@@ -1,11 +1,31 @@
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import OuterRef, Subquery
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
+from .cache import aget_roster, aget_voted, cache_stats, get_manifest, get_roster, get_voted, pending_votes
 from .models import Pokemon, Vote
+from .roster import active_ranges
+from . import export, images, votelog
+from itertools import islice
 import random
 import json
 
+# Upper bound on queued swipes a client may flush in one request
+MAX_BATCH_VOTES = 200
+# Upper bound on the pokeapi_id window of a single range read
+MAX_RANGE_SIZE = 500
+# Image URLs are content-addressed, so they can be cached for a year
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+# Chunks of a streamed body produced per thread hop under ASGI
+STREAM_CHUNKS_PER_HOP = 50
+# Start candidates checked for a buffered vote per cache read
+PENDING_WINDOW = 16
+
 def index(request):
     return render(request, 'game/index.html')
 
@@ -35,23 +55,95 @@ def get_username(request):
         return JsonResponse({'error': 'Not logged in'}, status=401)
     return JsonResponse({'username': username})
 
+async def aget_username(request):
+    username = await request.session.aget('username')
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    return JsonResponse({'username': username})
+
+
+def bootstrap(request):
+    """Roster configuration the clients start from, instead of a hard-coded max id."""
+    roster = get_roster()
+    ranges = active_ranges()
+    return JsonResponse({
+        'roster': {
+            'ranges': ranges,
+            'min_id': ranges[0][0] if ranges else None,
+            'max_id': ranges[-1][1] if ranges else None,
+            'seeded': len(roster),
+        },
+        'manifest_url': '/api/pokemon/manifest/',
+    })
+
+def get_cache_stats(request):
+    """Hit/miss counters of the per-user and roster caches, in the process that answers."""
+    return JsonResponse({'caches': cache_stats()})
 
 def get_starting_id(request):
     username = request.session.get('username')
     if not username:
         return JsonResponse({'error': 'Not logged in'}, status=401)
-    
-    # Logic: Find the first pokemon ID that the user hasn't voted on yet
-    # We assume IDs are 1-151.
-    voted_ids = set(Vote.objects.filter(username=username).values_list('pokemon_id', flat=True))
-    
-    # Simple loop for Gen 1
-    for i in range(1, 152):
-        if i not in voted_ids:
-            return JsonResponse({'id': i})
-            
-    # If all voted, return 1 (or handle differently on frontend)
-    return JsonResponse({'id': 1, 'all_voted': True})
+    pending = pending_votes(username) if votelog.enabled() else None
+    return _starting_id(request, get_roster(), lambda: get_voted(username), pending)
+
+async def aget_starting_id(request):
+    username = await request.session.aget('username')
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    roster = await aget_roster()
+    voted = await aget_voted(username)
+    if votelog.enabled():
+        # The pending check reads the cache; keep it off the event loop
+        return await sync_to_async(_starting_id)(request, roster, lambda: voted, pending_votes(username))
+    return _starting_id(request, roster, lambda: voted)
+
+def _starting_id(request, roster, voted, pending=None):
+    """
+    The start/navigation answer from the roster bitmap and a callable giving the
+    voted-set. With the write-behind buffer on, `pending` tells which candidates
+    have a vote still waiting in the log (see game.cache.pending_votes).
+    """
+    try:
+        after = int(request.GET['after']) if 'after' in request.GET else None
+        before = int(request.GET['before']) if 'before' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'after/before must be integers'}, status=400)
+
+    # Unvoted = every seeded pokeapi_id minus the user's voted-set, both bitmaps
+    unvoted = roster - voted()
+
+    if not unvoted:
+        # If all voted, return the first one (or handle differently on frontend)
+        return JsonResponse({'id': roster.first() or 1, 'all_voted': True})
+
+    if after is not None:
+        next_id, step = unvoted.next_after(after), unvoted.next_after
+    elif before is not None:
+        next_id, step = unvoted.previous_before(before), unvoted.previous_before
+    else:
+        next_id, step = unvoted.first(), unvoted.next_after
+    if pending is not None:
+        next_id = _skip_pending(next_id, step, pending)
+
+    if next_id is None:
+        if after is None and before is None:
+            return JsonResponse({'id': roster.first() or 1, 'all_voted': True})
+        return JsonResponse({'error': 'No unvoted Pokemon in that direction'}, status=404)
+    return JsonResponse({'id': next_id})
+
+def _skip_pending(next_id, step, pending):
+    """The first of next_id, step(next_id), ... without a pending vote, checking PENDING_WINDOW per cache read."""
+    while next_id is not None:
+        window = [next_id]
+        while len(window) < PENDING_WINDOW and (following := step(window[-1])) is not None:
+            window.append(following)
+        flagged = pending(window)
+        for pokeapi_id in window:
+            if pokeapi_id not in flagged:
+                return pokeapi_id
+        next_id = step(window[-1])
+    return None
 
 def get_pokemon_by_id(request, pokemon_id):
     username = request.session.get('username')
@@ -62,18 +154,149 @@ def get_pokemon_by_id(request, pokemon_id):
     
     # Check if voted
     vote = Vote.objects.filter(username=username, pokemon=pokemon).first()
+
+    return JsonResponse(_pokemon_card(
+        pokemon.pokeapi_id, pokemon.name, pokemon.image_url, pokemon.image_hash,
+        pokemon.smash_count, pokemon.pass_count, vote.smash if vote else None,
+    ))
+
+async def aget_pokemon_by_id(request, pokemon_id):
+    username = await request.session.aget('username')
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+
+    # The user's vote rides along as a subquery: one round trip instead of two
+    user_vote = Vote.objects.filter(username=username, pokemon=OuterRef('pk')).values('smash')[:1]
+    try:
+        pokemon = await Pokemon.objects.annotate(user_vote=Subquery(user_vote)).aget(pokeapi_id=pokemon_id)
+    except Pokemon.DoesNotExist:
+        raise Http404('No Pokemon matches the given query.')
+
+    return JsonResponse(_pokemon_card(
+        pokemon.pokeapi_id, pokemon.name, pokemon.image_url, pokemon.image_hash,
+        pokemon.smash_count, pokemon.pass_count, pokemon.user_vote,
+    ))
+
+def _pokemon_card(pokeapi_id, name, image_url, image_hash, smash_count, pass_count, smash):
+    """Card payload shared by the single and range reads."""
     vote_action = None
-    if vote:
-        vote_action = 'smash' if vote.smash else 'pass'
-        
-    return JsonResponse({
-        'id': pokemon.pokeapi_id,
-        'name': pokemon.name.capitalize(),
-        'image_url': pokemon.image_url,
-        'smash_count': pokemon.smash_count,
-        'pass_count': pokemon.pass_count,
+    if smash is not None:
+        vote_action = 'smash' if smash else 'pass'
+    return {
+        'id': pokeapi_id,
+        'name': name.capitalize(),
+        'image_url': images.image_src(image_hash, image_url, 'card'),
+        'smash_count': smash_count,
+        'pass_count': pass_count,
         'user_vote': vote_action
-    })
+    }
+
+def get_pokemon_range(request):
+    """
+    Cards for pokeapi_ids from..to (inclusive) with the user's votes, streamed as
+    {"pokemon": [...]}. Uses exactly two queries however wide the window is.
+    With fields=live only the part the manifest leaves out is sent: id, counts
+    and the user's vote.
+    """
+    username = request.session.get('username')
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+
+    try:
+        first = int(request.GET['from'])
+        last = int(request.GET['to'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'from and to must be integers'}, status=400)
+    if last < first or last - first + 1 > MAX_RANGE_SIZE:
+        return JsonResponse({'error': f'Range must cover 1 to {MAX_RANGE_SIZE} ids'}, status=400)
+
+    live = request.GET.get('fields') == 'live'
+    response = StreamingHttpResponse(
+        _streaming_body(request, _stream_pokemon_range(username, first, last, live)), content_type='application/json',
+    )
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def _streaming_body(request, chunks):
+    """
+    `chunks` as a StreamingHttpResponse body that streams under both servers.
+    Under ASGI Django drains a sync iterator into a list before sending a byte,
+    so there it becomes an async iterator pulling a few chunks per
+    sync_to_async hop; thread-sensitive hops keep the database cursor on the
+    thread that opened it.
+    """
+    if not isinstance(request, ASGIRequest):
+        return chunks
+    iterator = iter(chunks)
+    pull = sync_to_async(lambda: list(islice(iterator, STREAM_CHUNKS_PER_HOP)))
+
+    async def body():
+        while batch := await pull():
+            for chunk in batch:
+                yield chunk
+
+    return body()
+
+def _stream_pokemon_range(username, first, last, live=False):
+    votes = dict(
+        Vote.objects.filter(username=username, pokemon__pokeapi_id__range=(first, last))
+        .values_list('pokemon__pokeapi_id', 'smash')
+    )
+    fields = ['smash_count', 'pass_count'] if live else ['name', 'image_url', 'image_hash', 'smash_count', 'pass_count']
+    rows = (
+        Pokemon.objects.filter(pokeapi_id__range=(first, last))
+        .order_by('pokeapi_id')
+        .values_list('pokeapi_id', *fields)
+        .iterator(chunk_size=100)
+    )
+
+    yield '{"pokemon":['
+    for i, (pokeapi_id, *values) in enumerate(rows):
+        if live:
+            smash = votes.get(pokeapi_id)
+            card = {
+                'id': pokeapi_id,
+                'smash_count': values[0],
+                'pass_count': values[1],
+                'user_vote': None if smash is None else 'smash' if smash else 'pass',
+            }
+        else:
+            card = _pokemon_card(pokeapi_id, *values, votes.get(pokeapi_id))
+        yield (',' if i else '') + json.dumps(card)
+    yield ']}'
+
+@require_GET
+def pokemon_manifest(request):
+    """
+    The whole roster's static data as {"fields": [...], "pokemon": [[...], ...]}.
+    Clients keep it and revalidate with If-None-Match; unchanged rosters get a 304.
+    """
+    body, etag = get_manifest()
+    response = HttpResponse(body, content_type='application/json')
+    response.headers['ETag'] = quote_etag(etag)
+    patch_cache_control(response, public=True, no_cache=True)
+    return get_conditional_response(request, etag=response.headers['ETag'], response=response)
+
+@require_GET
+def pokemon_image(request, digest, variant, fmt=None):
+    """
+    A size variant of a locally stored sprite. The URL names the image's content
+    hash, so it never changes and can be cached forever. Without an extension the
+    format follows the Accept header (AVIF, then WebP, then PNG).
+    """
+    negotiated = fmt is None
+    if negotiated:
+        fmt = images.negotiate(request.headers.get('Accept', ''))
+    path = images.render_variant(digest, variant, fmt) if images.HASH_RE.fullmatch(digest) else None
+    if path is None:
+        raise Http404('No such image.')
+
+    response = FileResponse(open(path, 'rb'), content_type=images.FORMATS[fmt])
+    response.headers['ETag'] = quote_etag(f'{digest}-{variant}.{fmt}')
+    patch_cache_control(response, public=True, max_age=IMAGE_MAX_AGE, immutable=True)
+    if negotiated:
+        patch_vary_headers(response, ['Accept'])
+    return response
 
 @csrf_exempt
 @require_POST
@@ -86,42 +309,128 @@ def vote(request, pokemon_id):
     try:
         data = json.loads(request.body)
         action = data.get('action')
-        
-        pokemon = get_object_or_404(Pokemon, pokeapi_id=pokemon_id)
         is_smash = (action == 'smash')
-        
-        # Check if user already voted on this pokemon
-        existing_vote = Vote.objects.filter(username=username, pokemon=pokemon).first()
-        
-        if existing_vote:
-            if existing_vote.smash == is_smash:
-                # No change in vote
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Vote already recorded',
-                    'smash_count': pokemon.smash_count,
-                    'pass_count': pokemon.pass_count
-                })
-            
-            # Update existing vote
-            existing_vote.smash = is_smash
-            existing_vote.save()  # Signal will update counts
+
+        if votelog.enabled():
+            counts = votelog.buffer_votes(username, [(pokemon_id, is_smash)])[pokemon_id]
         else:
-            # Create new vote
-            Vote.objects.create(
-                username=username,
-                pokemon=pokemon,
-                smash=is_smash
-            )  # Signal will update counts
-        
-        # We need to refresh the pokemon object because the signal changed it in the DB
-        pokemon.refresh_from_db()
+            counts = Vote.objects.record(username, pokemon_id, is_smash)
+        return _vote_response(counts, is_smash)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+@csrf_exempt
+@require_POST
+async def avote(request, pokemon_id):
+    username = await request.session.aget('username')
+
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    is_smash = (data.get('action') == 'smash')
+
+    if votelog.enabled():
+        counts = (await sync_to_async(votelog.buffer_votes)(username, [(pokemon_id, is_smash)]))[pokemon_id]
+    else:
+        counts = await Vote.objects.arecord(username, pokemon_id, is_smash)
+    return _vote_response(counts, is_smash)
+
+def _vote_response(counts, is_smash):
+    if counts is None:
+        raise Http404('No Pokemon matches the given query.')
+    smash_count, pass_count, previous = counts
 
+    if previous == is_smash:
+        # No change in vote
         return JsonResponse({
             'status': 'success',
-            'smash_count': pokemon.smash_count,
-            'pass_count': pokemon.pass_count
+            'message': 'Vote already recorded',
+            'smash_count': smash_count,
+            'pass_count': pass_count
         })
+
+    return JsonResponse({
+        'status': 'success',
+        'smash_count': smash_count,
+        'pass_count': pass_count
+    })
+
+@csrf_exempt
+@require_POST
+def vote_batch(request):
+    username = request.session.get('username')
+
+    if not username:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+
+    try:
+        data = json.loads(request.body)
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
+    items = data.get('votes') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'votes must be a list'}, status=400)
+    if len(items) > MAX_BATCH_VOTES:
+        return JsonResponse({'error': f'At most {MAX_BATCH_VOTES} votes per batch'}, status=400)
+
+    # Validate every item up front; only well-formed ones reach the database
+    parsed = []
+    for item in items:
+        pokemon_id = item.get('pokemon_id') if isinstance(item, dict) else None
+        action = item.get('action') if isinstance(item, dict) else None
+        if not isinstance(pokemon_id, int) or isinstance(pokemon_id, bool) or action not in ('smash', 'pass'):
+            parsed.append((pokemon_id, None))
+        else:
+            parsed.append((pokemon_id, action == 'smash'))
+
+    valid = [(pid, smash) for pid, smash in parsed if smash is not None]
+    if votelog.enabled():
+        outcome = votelog.buffer_votes(username, valid)
+    else:
+        outcome = Vote.objects.record_many(username, valid)
+
+    results = []
+    counts = {}
+    for pokemon_id, smash in parsed:
+        if smash is None:
+            results.append({'pokemon_id': pokemon_id, 'status': 'error', 'error': 'Invalid vote'})
+        elif outcome[pokemon_id] is None:
+            results.append({'pokemon_id': pokemon_id, 'status': 'error', 'error': 'Pokemon not found'})
+        else:
+            smash_count, pass_count, _ = outcome[pokemon_id]
+            results.append({'pokemon_id': pokemon_id, 'status': 'success'})
+            counts[pokemon_id] = {'smash_count': smash_count, 'pass_count': pass_count}
+
+    return JsonResponse({'status': 'success', 'results': results, 'counts': counts})
+
+@staff_member_required
+@require_GET
+def export_votes(request):
+    """
+    Every vote, streamed as CSV, NDJSON or the compact columnar format (see
+    game.export) in (created_at, id) order. Filters: since/until (ISO 8601,
+    half-open window), username (repeatable), and after, the cursor of the last
+    vote already received, to resume an interrupted download.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    try:
+        since = export.parse_time(request.GET['since']) if request.GET.get('since') else None
+        until = export.parse_time(request.GET['until']) if request.GET.get('until') else None
+        after = export.parse_cursor(request.GET['after']) if request.GET.get('after') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rows = export.vote_rows(since=since, until=until, usernames=request.GET.getlist('username'), after=after)
+    response = StreamingHttpResponse(
+        _streaming_body(request, export.encode(fmt, rows, header=after is None)), content_type=export.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="votes.{export.EXTENSIONS[fmt]}"'
+    response['Cache-Control'] = 'no-store'
+    return response
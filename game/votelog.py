@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .cache import mark_pending
+from .models import Pokemon, Vote
+from .signals import roster_changed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+ACTIVE = 'votes.log'
+FLUSH_LOCK = 'flush.lock'
+# Lines a flush couldn't decode, set aside for a person to look at
+REJECTED = 'rejected.log'
+
+logger = logging.getLogger('pokesmash.votelog')
+
+
+def buffer_settings():
+    return getattr(settings, 'POKESMASH_VOTE_BUFFER', {}) or {}
+
+
+def enabled():
+    return bool(buffer_settings().get('enabled'))
+
+
+def get_vote_log():
+    config = buffer_settings()
+    return VoteLog(config.get('path', settings.BASE_DIR / '.vote-log'), fsync=config.get('fsync', True))
+
+
+def buffer_votes(username, votes):
+    """
+    Write-behind counterpart of Vote.objects.record_many: one read for optimistic
+    counts, then the votes on known Pokémon go to the log. Same return value.
+    """
+    results = Vote.objects.preview_many(username, votes)
+    accepted = [(pokeapi_id, smash) for pokeapi_id, smash in votes if results[pokeapi_id] is not None]
+    if accepted:
+        get_vote_log().append(username, accepted)
+        # /api/start/ must skip these before the flush writes them
+        mark_pending(username, [pokeapi_id for pokeapi_id, _ in accepted])
+    return results
+
+
+class VoteLog:
+    """
+    Durable append-only log of votes that are acknowledged but not yet written to
+    the database, kept as JSON lines in a directory.
+
+    Requests append to votes.log. A flush first rotates it to a timestamped
+    segment (votes-<ns>.log), then applies each segment in order in batched
+    transactions, recording how far it got in a <segment>.offset file after each
+    commit. A segment is deleted only once fully applied, so a crash loses
+    nothing, and a restart resumes from the last committed offset. Should the
+    crash fall between a commit and its offset write, that batch is applied
+    again: record_many() moves the counters by the difference from the stored
+    vote, so replaying a vote that is already stored changes nothing.
+
+    A crash mid-append can leave an unterminated line at the end of votes.log.
+    The next append terminates it first, so the torn line can't swallow the
+    votes after it, and the flush moves any line it can't decode to
+    rejected.log instead of stopping on it.
+    """
+
+    def __init__(self, path, fsync=True):
+        if fcntl is None:
+            raise ImproperlyConfigured('The vote buffer needs fcntl file locks, which this platform lacks.')
+        self.path = Path(path)
+        self.fsync = fsync
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def append(self, username, votes):
+        data = ''.join(
+            json.dumps({'username': username, 'pokemon_id': pokeapi_id, 'smash': smash}, separators=(',', ':')) + '\n'
+            for pokeapi_id, smash in votes
+        ).encode()
+        active = self.path / ACTIVE
+        while True:
+            fd = os.open(active, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                # Shared: appends don't exclude each other (O_APPEND writes of a
+                # line are atomic), only a rotation in progress
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                try:
+                    current = os.stat(active).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current != os.fstat(fd).st_ino:
+                    # Rotated away while we waited for the lock
+                    continue
+                size = os.fstat(fd).st_size
+                if size and os.pread(fd, 1, size - 1) != b'\n':
+                    # Torn append from a crash; end it so our lines stay whole
+                    os.write(fd, b'\n' + data)
+                else:
+                    os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+                return
+            finally:
+                os.close(fd)
+
+    def rotate(self):
+        """Move the active log aside as the newest segment, if it holds anything."""
+        active = self.path / ACTIVE
+        try:
+            fd = os.open(active, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size == 0:
+                return None
+            segment = self.path / f'votes-{time.time_ns():020d}.log'
+            os.rename(active, segment)
+            return segment
+        finally:
+            os.close(fd)
+
+    def segments(self):
+        return sorted(self.path.glob('votes-*.log'))
+
+    def pending(self):
+        """Number of logged votes not yet flushed."""
+        count = 0
+        for segment in [*self.segments(), self.path / ACTIVE]:
+            try:
+                with open(segment, 'rb') as f:
+                    f.seek(self._offset(segment))
+                    count += sum(1 for line in f if line.endswith(b'\n'))
+            except FileNotFoundError:
+                pass
+        return count
+
+    def flush(self, batch_size=500):
+        """
+        Apply every logged vote to the database. Returns the number applied, or
+        None if another flush holds the lock.
+        """
+        lock = os.open(self.path / FLUSH_LOCK, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            self.rotate()
+            return sum(self._flush_segment(segment, batch_size) for segment in self.segments())
+        finally:
+            os.close(lock)
+
+    def _flush_segment(self, segment, batch_size):
+        applied = 0
+        offset = self._offset(segment)
+        with open(segment, 'rb') as f:
+            f.seek(offset)
+            while True:
+                lines = []
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write from a crash mid-append; it was never acknowledged
+                        break
+                    lines.append(line)
+                    if len(lines) == batch_size:
+                        break
+                if not lines:
+                    break
+                entries = []
+                position = offset
+                for line in lines:
+                    entry = self._decode(line)
+                    if entry is not None:
+                        entries.append(entry)
+                    elif line.strip():
+                        self._reject(segment, position, line)
+                    position += len(line)
+                if entries:
+                    self._apply(entries)
+                offset += sum(len(line) for line in lines)
+                self._save_offset(segment, offset)
+                applied += len(entries)
+        # Segment first: a leftover offset file is harmless, a leftover segment
+        # without its offset would be replayed from the start
+        segment.unlink()
+        self._offset_path(segment).unlink(missing_ok=True)
+        return applied
+
+    def _decode(self, line):
+        try:
+            entry = json.loads(line)
+            if isinstance(entry['username'], str) and isinstance(entry['pokemon_id'], int) and isinstance(entry['smash'], bool):
+                return entry
+        except (ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _reject(self, segment, position, line):
+        with open(self.path / REJECTED, 'ab') as f:
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        logger.warning('Set aside an undecodable vote log line at byte %d of %s in %s', position, segment.name, REJECTED)
+
+    def _apply(self, entries):
+        by_user = {}
+        for entry in entries:
+            by_user.setdefault(entry['username'], []).append((entry['pokemon_id'], entry['smash']))
+        try:
+            with transaction.atomic():
+                for username, votes in by_user.items():
+                    Vote.objects.record_many(username, votes)
+        except Exception:
+            # vote_cast already reached the caches for a batch that rolled back
+            roster_changed.send(sender=Pokemon)
+            raise
+
+    def _offset_path(self, segment):
+        return segment.with_name(f'{segment.name}.offset')
+
+    def _offset(self, segment):
+        try:
+            return int(self._offset_path(segment).read_text())
+        except FileNotFoundError:
+            return 0
+
+    def _save_offset(self, segment, offset):
+        path = self._offset_path(segment)
+        tmp = path.with_name(f'{path.name}.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(path)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pokesmash.settings')
+# The async game views pay off here, and only here (see settings)
+os.environ.setdefault('POKESMASH_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include all the other middleware
+    'game.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,15 +76,128 @@ WSGI_APPLICATION = 'pokesmash.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+# https://docs.djangoproject.com/en/6.0/ref/databases/#sqlite-init-command
+# Run on every new SQLite connection. WAL lets the analytics pages read while a
+# vote is being written, synchronous=NORMAL only syncs at checkpoints (safe with
+# WAL) and busy_timeout makes a writer wait for the lock instead of failing.
+# cache_size is negative to mean KiB.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,
+}
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests instead of reconnecting (and
+        # re-running the pragmas) every time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock at BEGIN. A deferred transaction that reads first
+            # can't wait for the lock when it later writes and fails at once with
+            # "database is locked", busy_timeout or not
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
 
+# Roster
+# Which Pokémon are in play, by generation and/or explicit pokeapi_id ranges.
+# The seeder, the start/navigation endpoints and both frontends (through
+# /api/bootstrap/) all read this. {'generations': range(1, 10)} is the full dex.
+
+POKESMASH_ROSTER = {
+    'generations': [1],
+}
+
+
+# Performance metrics
+# game.metrics.PerformanceMiddleware records per-view latency, SQL query counts
+# and time, served in the Prometheus text format at /metrics to `allowed_ips`.
+# Requests slower than slow_request_ms, or running one SQL statement at least
+# duplicate_query_threshold times (an N+1 loop), are logged to
+# 'pokesmash.performance'.
+
+POKESMASH_METRICS = {
+    'allowed_ips': ['127.0.0.1', '::1'],
+    'slow_request_ms': 500,
+    'duplicate_query_threshold': 5,
+}
+
+
+# Sprite images
+# `manage.py fetch_images` (or `seed_pokemon --images`) downloads each sprite once
+# into a content-addressed store under `path` and renders these variants (longest
+# side in px) as AVIF/WebP/PNG, served from /images/ with immutable cache headers.
+# Rendering variants needs Pillow; without it the stored PNG is served as is.
+
+POKESMASH_IMAGES = {
+    'path': BASE_DIR / '.image-store',
+    'variants': {
+        'thumb': 192,  # gallery tiles and facet grids
+        'card': 475,   # game cards and the expanded view
+    },
+}
+
+
+# Async views
+# Serve the hot game endpoints (username, start, single Pokémon, vote) with their
+# native async versions. Only worth it under an ASGI server: under WSGI (runserver,
+# gunicorn) every async view runs in its own event loop. Off by default;
+# pokesmash.asgi turns it on unless the environment variable POKESMASH_ASYNC_VIEWS
+# says otherwise. `manage.py loadtest_api` compares both.
+
+POKESMASH_ASYNC_VIEWS = os.environ.get('POKESMASH_ASYNC_VIEWS', '0') == '1'
+
+
+# Write-behind voting
+# When enabled, the vote endpoints append votes to a durable log under `path`
+# and answer at once with optimistic counts; `manage.py flush_votes` (once, or
+# every few seconds with --interval) writes them to the database in batches.
+# fsync makes each acknowledged vote survive a power loss, at one disk sync each.
+
+POKESMASH_VOTE_BUFFER = {
+    'enabled': False,
+    'path': BASE_DIR / '.vote-log',
+    'fsync': True,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Holds the roster manifest, the per-user voted-sets and stats, and the analytics
+# gallery and user list. Votes update or drop these entries, so when running several worker
+# processes switch to FileBasedCache (e.g. LOCATION: BASE_DIR / 'cache') so every
+# process sees the same entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pokesmash',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/6.0/topics/http/sessions/#using-cookie-based-sessions
+# The game session only holds the player's username, so it travels in a signed
+# cookie instead of costing a django_session SELECT on every API call. Rows left
+# over from the database backend are removed by `manage.py cleanup_sessions`.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -117,3 +233,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
+# What the existing migrations were generated with; set explicitly so older
+# Django versions (whose default is AutoField) don't see pending migrations.
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'